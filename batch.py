@@ -0,0 +1,275 @@
+import argparse
+import collections
+import csv
+import gzip
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from bot.utils.calculations import COMPOST_LIFE, HerbSetups, calculate_fish_profit, herb_price_arrays, herb_profit_batch, kandarin_bonus
+from bot.utils.price_table import PriceTable
+from config.settings import SNAPSHOT_DB_PATH
+from data.item_index import item_index
+from data.items import fish, herbs
+
+
+def _flag(value):
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in ("1", "true", "yes", "y", "t"):
+            return True
+        if text in ("0", "false", "no", "n", "f", ""):
+            return False
+        raise ValueError(f"not a true/false value: {value!r}")
+    return bool(value)
+
+
+def _compost(value):
+    if value not in COMPOST_LIFE:
+        raise ValueError(f"compost must be one of {', '.join(COMPOST_LIFE)}")
+    return value
+
+
+# One of the Kandarin diary bonuses /herb_profit offers: None, 5%, 10% or 15% ("15" works too),
+# or a JSON number fraction such as 0.15
+def _kandarin(value):
+    try:
+        bonus = kandarin_bonus(value)
+    except ValueError:
+        bonus = None
+    if bonus not in (0, 0.05, 0.1, 0.15):
+        raise ValueError(f"must be None, 5%, 10% or 15%, not {value!r}")
+    return bonus
+
+
+REQUIRED = object()
+
+# Setup columns per kind as field -> (conversion, default), herbs in HerbSetups' argument order.
+# Other columns are ignored; an "id" (or "name") column labels the setup in the output.
+SETUP_FIELDS = {
+    "herbs": {
+        "farming_level": (int, REQUIRED),
+        "patches": (int, REQUIRED),
+        "weiss": (_flag, False),
+        "trollheim": (_flag, False),
+        "hosidius": (_flag, False),
+        "fortis": (_flag, False),
+        "compost": (_compost, "None"),
+        "kandarin_diary": (_kandarin, "None"),
+        "kourend": (_flag, False),
+        "magic_secateurs": (_flag, False),
+        "farming_cape": (_flag, False),
+        "attas": (_flag, False),
+    },
+    "fish": {
+        "cooking_rate": (int, 1435),
+    },
+}
+OUTPUT_FIELDS = {
+    "herbs": ["setup", "rank", "Herb", "Seed Price", "Grimy Herb Price", "Profit per Run"],
+    "fish": ["setup", "rank", "Fish", "Raw Price", "Cooked Price", "Profit", "XP/hr", "GP/hr"],
+}
+
+
+# Setup records of a CSV or JSON Lines file (or stdin for "-"), one dict per setup
+def read_records(path, input_format):
+    file = sys.stdin if path == "-" else open(path, "r", newline="")
+    try:
+        if input_format == "csv":
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+# Records converted to typed setups, numbered from 1 in input order. A bad record stops the run
+# here, with its number, rather than failing later inside a worker.
+def parse_setups(records, kind):
+    fields = SETUP_FIELDS[kind]
+    for number, record in enumerate(records, start=1):
+        setup = {"setup": record.get("id") or record.get("name") or number}
+        for field, (convert, default) in fields.items():
+            value = record.get(field)
+            try:
+                if value is None or value == "":
+                    if default is REQUIRED:
+                        raise ValueError("missing")
+                    value = default
+                setup[field] = convert(value)
+            except ValueError as error:
+                raise SystemExit(f"setup {number}: {field}: {error}")
+        if kind == "herbs":
+            disease_free = setup["weiss"] + setup["trollheim"] + setup["hosidius"] + setup["fortis"]
+            if setup["patches"] < disease_free:
+                raise SystemExit(f"setup {number}: patches: {setup['patches']} is less than its {disease_free} disease-free patches")
+        yield setup
+
+
+# The price payload (the API's "data" dict) from a JSON file, optionally gzipped and with or
+# without the API's {"data": ...} wrapper, or the endpoint's newest payload in the snapshot store
+def load_payload(prices, store_path, endpoint):
+    if prices:
+        opener = gzip.open if prices.endswith(".gz") else open
+        with opener(prices, "rt") as file:
+            payload = json.load(file)
+        return payload.get("data", payload), prices
+    if not os.path.exists(store_path):
+        raise SystemExit(f"No snapshot store at {store_path}, run the bot once or pass --prices")
+    from bot.utils.snapshot_store import SnapshotStore
+    store = SnapshotStore(store_path)
+    try:
+        stored = store.load_latest(endpoint)
+    finally:
+        store.close()
+    if stored is None:
+        raise SystemExit(f"No {endpoint} snapshot in {store_path}, fetch prices with the bot first or pass --prices")
+    data, fetched_at, _, _ = stored
+    return data, f"{store_path} ({endpoint}, {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(fetched_at))})"
+
+
+# Per-process prices, set once by the pool initializer instead of shipping them with every chunk
+_state = {}
+
+
+def init_worker(payload, price_key):
+    table = PriceTable.from_payload(payload)
+    _state["table"] = table
+    _state["price_key"] = price_key
+    _state["herb_prices"] = herb_price_arrays(table, herbs, price_key)
+
+
+# Ranked herb rows of a chunk of setups: one vectorised pass for the whole chunk, then the `top`
+# most profitable priced herbs of each setup
+def rank_herbs(chunk, top):
+    fields = list(SETUP_FIELDS["herbs"])
+    setups = HerbSetups(*([setup[field] for setup in chunk] for field in fields))
+    seed_prices, herb_prices = _state["herb_prices"]
+    profits = herb_profit_batch(seed_prices, herb_prices, herbs, setups)
+    order = np.argsort(np.where(np.isnan(profits), np.inf, -profits), axis=1, kind="stable")[:, :top]
+    names = list(herbs)
+    rows = []
+    for number, (setup, positions) in enumerate(zip(chunk, order.tolist())):
+        for rank, position in enumerate(positions, start=1):
+            profit = profits[number, position]
+            if np.isnan(profit):
+                break
+            rows.append({
+                "setup": setup["setup"],
+                "rank": rank,
+                "Herb": names[position],
+                "Seed Price": int(seed_prices[position]),
+                "Grimy Herb Price": int(herb_prices[position]),
+                "Profit per Run": profit.item(),
+            })
+    return len(chunk), rows
+
+
+def rank_fish(chunk, top):
+    rows = []
+    for setup in chunk:
+        results = calculate_fish_profit(_state["table"], fish, _state["price_key"], setup["cooking_rate"])
+        for rank, row in enumerate(sorted(results, key=lambda row: row["GP/hr"], reverse=True)[:top], start=1):
+            rows.append(dict(setup=setup["setup"], rank=rank, **row))
+    return len(chunk), rows
+
+
+RANKERS = {"herbs": rank_herbs, "fish": rank_fish}
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+# Results of every chunk in input order as they complete. With more than one worker at most
+# 2 * workers chunks are in flight, so memory stays flat however many setups are read.
+def process(kind, setups, payload, price_key, workers, chunk_size, top):
+    rank = RANKERS[kind]
+    if workers <= 1:
+        init_worker(payload, price_key)
+        for chunk in chunked(setups, chunk_size):
+            yield rank(chunk, top)
+        return
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker, initargs=(payload, price_key)) as pool:
+        pending = collections.deque()
+        for chunk in chunked(setups, chunk_size):
+            pending.append(pool.submit(rank, chunk, top))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def open_output(path, output_format, fields):
+    file = sys.stdout if path in (None, "-") else open(path, "w", newline="")
+    if output_format == "csv":
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        write = writer.writerows
+    else:
+        def write(rows):
+            file.writelines(json.dumps(row) + "\n" for row in rows)
+    return file, write
+
+
+def _format(path, given):
+    if given:
+        return given
+    return "jsonl" if path not in (None, "-") and path.endswith((".jsonl", ".json")) else "csv"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rank herb run or fish cooking profits for many player setups, without Discord.")
+    parser.add_argument("kind", choices=list(RANKERS), help="what to rank")
+    parser.add_argument("setups", help="CSV or JSON Lines file with one setup per row/line, - for stdin")
+    parser.add_argument("--prices", help="price payload JSON file (optionally .gz), instead of the snapshot store")
+    parser.add_argument("--store", default=SNAPSHOT_DB_PATH, help="snapshot store to read the newest prices from (default: %(default)s)")
+    parser.add_argument("--endpoint", choices=["latest", "1h"], default="latest", help="price endpoint, like /herb_profit's price_type")
+    parser.add_argument("--output", "-o", help="output file (default: stdout)")
+    parser.add_argument("--input-format", choices=["csv", "jsonl"], help="default: from the setups file extension, csv for stdin")
+    parser.add_argument("--output-format", choices=["csv", "jsonl"], help="default: from the output file extension, csv for stdout")
+    parser.add_argument("--top", type=int, default=3, help="ranked rows per setup (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="setups per worker task (default: %(default)s)")
+    args = parser.parse_args(argv)
+    # only the parent needs the API module, spawned workers re-import this one and stay light
+    from bot.utils.api import PRICE_KEYS
+
+    start = time.perf_counter()
+    payload, source = load_payload(args.prices, args.store, args.endpoint)
+    # the workers only need the items the calculations price
+    payload = {item_id: item for item_id, item in payload.items() if int(item_id) in item_index.tracked}
+    setups = parse_setups(read_records(args.setups, _format(args.setups, args.input_format)), args.kind)
+
+    file, write = open_output(args.output, _format(args.output, args.output_format), OUTPUT_FIELDS[args.kind])
+    count = written = 0
+    try:
+        for processed, rows in process(args.kind, setups, payload, PRICE_KEYS[args.endpoint], args.workers, args.chunk_size, args.top):
+            write(rows)
+            file.flush()
+            count += processed
+            written += len(rows)
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"{count:,} setups -> {written:,} rows in {elapsed:.2f}s ({count / elapsed:,.0f} setups/s, "
+        f"{args.workers} workers) using prices from {source}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
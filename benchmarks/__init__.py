@@ -0,0 +1 @@
+# Empty file to mark the directory as a Python package
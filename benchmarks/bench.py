@@ -0,0 +1,261 @@
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import ENDPOINTS, load_body
+from benchmarks.price_server import PriceServer
+from bot.utils import api
+from bot.utils.calculations import HerbSetups, calculate_batch_profit, calculate_custom_profit, calculate_fish_profit, simulate_herb_profit
+from bot.utils.helpers import generate_estimated_yield, skill_interp
+from bot.utils.price_table import PriceTable
+from bot.utils.recipes import RecipeBook, recipe_book
+from bot.utils.rendering import render_embed_fields, render_markdown, sort_records
+from data.item_index import item_index
+from data.items import fish, herbs
+
+HERB_COLUMNS = [("Herb", "Herb", 12, None), ("Seed Price", "Seed Price", 12, None),
+                ("Herb Price", "Grimy Herb Price", 12, None), ("Profit per Run", "Profit per Run", 15, int)]
+FISH_COLUMNS = [("Raw Price", "Raw Price", 12, None), ("Cooked Price", "Cooked Price", 12, None),
+                ("Profit", "Profit", 12, int), ("XP/hr", "XP/hr", 12, None), ("GP/hr", "GP/hr", 12, None)]
+# farming level, patches, weiss, trollheim, hosidius, fortis, compost, kandarin, kourend, secateurs, cape, bucket, attas
+SETUP = (99, 9, True, True, True, True, "Ultracompost", "15%", True, True, True, True, True)
+
+
+# Times `fn` in samples of `number` calls each, growing `number` until one sample takes at least
+# `min_sample` seconds so that timer overhead doesn't dominate tiny functions
+def measure(fn, min_time=0.3, min_sample=1e-4, max_samples=200):
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_sample:
+            break
+        number *= 10
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < max_samples and (len(samples) < 5 or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+async def measure_async(fn, min_time=0.3, max_samples=100):
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < max_samples and (len(samples) < 5 or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(samples, **extra):
+    samples = sorted(samples)
+    result = {
+        "samples": len(samples),
+        "mean_us": statistics.fmean(samples) * 1e6,
+        "median_us": statistics.median(samples) * 1e6,
+        "p95_us": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e6,
+        "min_us": samples[0] * 1e6,
+    }
+    result.update(extra)
+    return result
+
+
+def compute_benchmarks(bodies):
+    latest = json.loads(bodies["latest"])["data"]
+    hourly = json.loads(bodies["1h"])["data"]
+    latest_table = PriceTable.from_payload(latest)
+    hourly_table = PriceTable.from_payload(hourly)
+    herb_rows = calculate_custom_profit(latest_table, herbs, *SETUP[:12], SETUP[12], "high")
+    fish_rows = sort_records(calculate_fish_profit(latest_table, fish, "high"), "GP/hr")
+
+    def parse_filtered(body):
+        parser = api.FilteredPayloadParser(item_index.tracked)
+        for start in range(0, len(body), api.PARSE_CHUNK_SIZE):
+            parser.feed(body[start:start + api.PARSE_CHUNK_SIZE])
+        return PriceTable.from_payload(parser.close())
+
+    rng = np.random.default_rng(0)
+    n = 1000
+    setups = HerbSetups(
+        rng.integers(1, 100, n), rng.integers(4, 10, n), rng.random(n) < .5, rng.random(n) < .5, rng.random(n) < .5,
+        rng.random(n) < .5, rng.choice(["None", "Compost", "Supercompost", "Ultracompost"], n),
+        rng.choice(["None", "5%", "10%", "15%"], n), rng.random(n) < .5, rng.random(n) < .5, rng.random(n) < .5, rng.random(n) < .5)
+
+    # a book the size of a few thousand money makers over items the payload prices, kept out of the
+    # tracked set so the filtered parse benchmarks still only keep the bot's own items
+    priced = latest_table.item_ids[latest_table.present["high"]]
+    large_book = RecipeBook({
+        f"recipe {number}": {
+            "inputs": {int(item_id): int(quantity) for item_id, quantity in zip(rng.choice(priced, 3), rng.integers(1, 10, 3))},
+            "outputs": {int(rng.choice(priced)): 1}, "actions_per_hour": 1000, "xp": 10,
+        } for number in range(5000)
+    }, track=False)
+
+    return {
+        "skill_interp": lambda: skill_interp(39, 80, 75),
+        "generate_estimated_yield": lambda: generate_estimated_yield(75, 39, 80, 6, 0.15, 0.2, 0.05),
+        "parse_latest_json": lambda: json.loads(bodies["latest"]),
+        "parse_latest_table": lambda: PriceTable.from_payload(json.loads(bodies["latest"])["data"]),
+        "parse_latest_filtered": lambda: parse_filtered(bodies["latest"]),
+        "parse_1h_filtered": lambda: parse_filtered(bodies["1h"]),
+        "parse_1h_table": lambda: PriceTable.from_payload(json.loads(bodies["1h"])["data"]),
+        "diff_latest": lambda: api.diff_snapshots(hourly_table, latest_table, 1),
+        "calculate_custom_profit": lambda: calculate_custom_profit(latest_table, herbs, *SETUP[:12], SETUP[12], "high"),
+        "calculate_custom_profit_dict": lambda: calculate_custom_profit(latest, herbs, *SETUP[:12], SETUP[12], "high"),
+        "calculate_batch_profit_1000": lambda: calculate_batch_profit(latest_table, herbs, setups, "high"),
+        "simulate_herb_profit_100k": lambda: simulate_herb_profit(latest_table, herbs, HerbSetups(*SETUP[:11], SETUP[12]), "high", 100000),
+        "calculate_fish_profit": lambda: calculate_fish_profit(latest_table, fish, "high"),
+        "recipe_book_compute": lambda: recipe_book.compute(latest_table, "high"),
+        "recipe_book_compute_5000": lambda: large_book.compute(latest_table, "high"),
+        "render_herb_markdown": lambda: render_markdown(HERB_COLUMNS, sort_records(herb_rows, "Profit per Run"), title="results"),
+        "render_fish_markdown": lambda: render_markdown([("Fish", "Fish", 12, None)] + FISH_COLUMNS, fish_rows),
+        "render_fish_embed_fields": lambda: render_embed_fields("Fish", FISH_COLUMNS, fish_rows),
+    }
+
+
+# Fetch -> compute -> render through PriceStore against the local stand-in server
+async def pipeline_benchmarks(results, selected, latency, failure_rate, min_time):
+    server = await PriceServer(latency=latency).start()
+    saved = dict(api.ENDPOINTS)
+    api.ENDPOINTS.update({endpoint: f"{server.api_base}/{endpoint}" for endpoint in ENDPOINTS})
+    try:
+        async def cold_fetch(full_parse=False):
+            store = api.PriceStore(refresh_interval=0, full_parse=full_parse)
+            await store.refresh("latest")
+            await store.close()
+
+        async def cold_fetch_full():
+            await cold_fetch(full_parse=True)
+
+        store = api.PriceStore(refresh_interval=0, ttl=0, retry_after=0)
+        await store.refresh("latest")
+
+        async def revalidate():
+            await store.refresh("latest")
+
+        async def fetch_compute_render():
+            snapshot = await store.get("latest")
+            rows = calculate_custom_profit(snapshot.table, herbs, *SETUP[:12], SETUP[12], "high")
+            render_markdown(HERB_COLUMNS, sort_records(rows, "Profit per Run"), title="results")
+
+        async def flaky_get():
+            await store.get("latest")
+
+        cases = {"pipeline_cold_fetch": cold_fetch, "pipeline_cold_fetch_full": cold_fetch_full,
+                 "pipeline_revalidate_304": revalidate,
+                 "pipeline_fetch_compute_render": fetch_compute_render}
+        for name, fn in cases.items():
+            if selected(name):
+                results[name] = summarize(await measure_async(fn, min_time), latency_s=latency)
+        if selected("pipeline_get_with_failures"):
+            server.failure_rate = failure_rate
+            requests_before, failures_before = server.requests, server.failures
+            # the store logs every injected failure with a traceback, which is expected here
+            logging.getLogger(api.__name__).disabled = True
+            try:
+                samples = await measure_async(flaky_get, min_time)
+            finally:
+                logging.getLogger(api.__name__).disabled = False
+            results["pipeline_get_with_failures"] = summarize(
+                samples, latency_s=latency, failure_rate=failure_rate,
+                upstream_requests=server.requests - requests_before, injected_failures=server.failures - failures_before)
+        await store.close()
+    finally:
+        api.ENDPOINTS.clear()
+        api.ENDPOINTS.update(saved)
+        await server.stop()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Compares two result files by median; returns the names that got slower than `threshold` x
+def compare(baseline, current, threshold):
+    regressions = []
+    print(f"{'benchmark':<32} {'baseline us':>12} {'current us':>12} {'ratio':>7}")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        ratio = result["median_us"] / before["median_us"] if before["median_us"] else float("inf")
+        flag = "  <-- slower" if ratio > threshold else ""
+        print(f"{name:<32} {before['median_us']:>12.2f} {result['median_us']:>12.2f} {ratio:>7.2f}{flag}")
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the price, calculation and rendering paths.")
+    parser.add_argument("--output", help="write results as JSON to this file (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON produced by an earlier run")
+    parser.add_argument("--threshold", type=float, default=1.25, help="median slowdown ratio that counts as a regression")
+    parser.add_argument("--only", action="append", help="run only benchmarks whose name contains this (repeatable)")
+    parser.add_argument("--min-time", type=float, default=0.3, help="seconds to spend sampling each benchmark")
+    parser.add_argument("--latency", type=float, default=0.0, help="latency injected by the stand-in server")
+    parser.add_argument("--failure-rate", type=float, default=0.2, help="failure rate for pipeline_get_with_failures")
+    parser.add_argument("--no-pipeline", action="store_true", help="skip the benchmarks going through the local HTTP server")
+    args = parser.parse_args(argv)
+
+    def selected(name):
+        return not args.only or any(part in name for part in args.only)
+
+    bodies = {}
+    sources = {}
+    for endpoint in ENDPOINTS:
+        bodies[endpoint], sources[endpoint] = load_body(endpoint)
+
+    results = {}
+    for name, fn in compute_benchmarks(bodies).items():
+        if selected(name):
+            results[name] = summarize(measure(fn, args.min_time))
+    if not args.no_pipeline:
+        asyncio.run(pipeline_benchmarks(results, selected, args.latency, args.failure_rate, args.min_time))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": time.time(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "fixtures": {endpoint: {"source": sources[endpoint], "bytes": len(bodies[endpoint])} for endpoint in bodies},
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import argparse
+import gzip
+import json
+import os
+import random
+
+from data.items import recipes  # noqa: F401 - importing the item tables registers the tracked items
+from data.item_index import item_index
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+ENDPOINTS = ("latest", "5m", "1h")
+
+
+def fixture_path(endpoint):
+    return os.path.join(FIXTURE_DIR, f"{endpoint}.json.gz")
+
+
+def tracked_ids():
+    return set(item_index.tracked)
+
+
+# Deterministic stand-in for a full wiki payload: the same shape, item count and rough value
+# distribution as the real /latest and /1h responses, including nulls and sparse trading
+def synthetic_payload(endpoint, items=3900, seed=2024, timestamp=1700000000):
+    rnd = random.Random(f"{seed}-{endpoint}")
+    ids = sorted(tracked_ids() | set(rnd.sample(range(2, 30000), items)))
+    data = {}
+    for item_id in ids:
+        price = int(10 ** rnd.uniform(0, 9))
+        spread = max(1, int(price * rnd.uniform(0, 0.08)))
+        if endpoint == "latest":
+            item = {
+                "high": price + spread if rnd.random() > 0.02 else None,
+                "highTime": timestamp - rnd.randint(0, 86400 * 3),
+                "low": price if rnd.random() > 0.02 else None,
+                "lowTime": timestamp - rnd.randint(0, 86400 * 3),
+            }
+            data[str(item_id)] = {field: value for field, value in item.items() if value is not None or rnd.random() > 0.5}
+        else:
+            if rnd.random() < 0.3 and item_id not in tracked_ids():
+                continue  # /5m and /1h only list items that traded in the period
+            high_volume = int(10 ** rnd.uniform(0, 5))
+            low_volume = int(10 ** rnd.uniform(0, 5))
+            data[str(item_id)] = {
+                "avgHighPrice": price + spread if high_volume else None,
+                "highPriceVolume": high_volume,
+                "avgLowPrice": price if low_volume else None,
+                "lowPriceVolume": low_volume,
+            }
+    payload = {"data": data}
+    if endpoint != "latest":
+        period = 300 if endpoint == "5m" else 3600
+        payload["timestamp"] = timestamp - timestamp % period
+    return payload
+
+
+# Deterministic stand-in for /timeseries?id=<item_id>&timestep=5m: `points` 5 minute averages
+# drifting around a per-item base price, with the occasional period without trades
+def synthetic_timeseries(item_id, points=365, timestamp=1700000000):
+    rnd = random.Random(f"timeseries-{item_id}")
+    price = 10 ** rnd.uniform(1, 6)
+    start = timestamp - timestamp % 300 - (points - 1) * 300
+    series = []
+    for step in range(points):
+        price = max(1.0, price * (1 + rnd.gauss(0, 0.01)))
+        traded = rnd.random() > 0.05
+        series.append({
+            "timestamp": start + step * 300,
+            "avgHighPrice": int(price * 1.02) if traded else None,
+            "avgLowPrice": int(price) if traded else None,
+            "highPriceVolume": rnd.randint(1, 500) if traded else 0,
+            "lowPriceVolume": rnd.randint(1, 500) if traded else 0,
+        })
+    return {"data": series, "itemId": item_id}
+
+
+# Deterministic stand-in for /mapping: metadata of every item in the synthetic payloads
+def synthetic_mapping(seed=2024):
+    rnd = random.Random(f"{seed}-mapping")
+    ids = sorted(int(item_id) for item_id in synthetic_payload("latest", seed=seed)["data"])
+    return [{
+        "id": item_id,
+        "name": f"Item {item_id}",
+        "members": rnd.random() < 0.7,
+        "limit": rnd.choice([None, 8, 70, 100, 1000, 10000, 25000]),
+        "value": rnd.randint(1, 10 ** 6),
+    } for item_id in ids]
+
+
+# Raw response body of an endpoint: the recorded fixture when one exists, else the synthetic one.
+# Returns (body_bytes, source) with source "recorded" or "synthetic".
+def load_body(endpoint):
+    path = fixture_path(endpoint)
+    if os.path.exists(path):
+        with gzip.open(path, "rb") as file:
+            return file.read(), "recorded"
+    return json.dumps(synthetic_payload(endpoint), separators=(",", ":")).encode(), "synthetic"
+
+
+def load_payload(endpoint):
+    body, _ = load_body(endpoint)
+    return json.loads(body)
+
+
+# Records the live wiki responses into benchmarks/fixtures/ (needs network access)
+def record(api_base, headers):
+    import requests
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for endpoint in ENDPOINTS:
+        response = requests.get(f"{api_base}/{endpoint}", headers=headers, timeout=30)
+        response.raise_for_status()
+        with gzip.open(fixture_path(endpoint), "wb") as file:
+            file.write(response.content)
+        print(f"recorded {endpoint}: {len(response.content)} bytes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record the wiki price payloads used by the benchmarks.")
+    parser.add_argument("--api-base", default="https://prices.runescape.wiki/api/v1/osrs")
+    args = parser.parse_args()
+    from config.settings import HEADERS
+    record(args.api_base, HEADERS)
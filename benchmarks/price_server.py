@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import hashlib
+import random
+
+from aiohttp import web
+
+from benchmarks.fixtures import ENDPOINTS, load_body, synthetic_mapping, synthetic_timeseries
+
+
+# Local stand-in for prices.runescape.wiki serving the benchmark fixtures under the same
+# /api/v1/osrs/<endpoint> paths, with injectable latency and failures:
+#   latency       seconds added before every response
+#   failure_rate  probability that a request is answered with `failure_status`
+#   fail_next     number of upcoming requests that fail unconditionally (for scripted outages)
+# Responses carry an ETag and honour If-None-Match like a caching upstream would.
+class PriceServer:
+    def __init__(self, latency=0.0, failure_rate=0.0, failure_status=503, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.fail_next = 0
+        self.requests = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._bodies = {}
+        self._runner = None
+        self.port = None
+        for endpoint in ENDPOINTS:
+            body, _ = load_body(endpoint)
+            self.set_body(endpoint, body)
+
+    def set_body(self, endpoint, body):
+        self._bodies[endpoint] = (body, '"' + hashlib.sha1(body).hexdigest() + '"')
+
+    @property
+    def api_base(self):
+        return f"http://127.0.0.1:{self.port}/api/v1/osrs"
+
+    async def handle(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail_next > 0 or self._random.random() < self.failure_rate:
+            self.fail_next = max(0, self.fail_next - 1)
+            self.failures += 1
+            return web.Response(status=self.failure_status, text="injected failure")
+        entry = self._bodies.get(request.match_info["endpoint"])
+        if entry is None:
+            return web.Response(status=404)
+        body, etag = entry
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(body=body, content_type="application/json", headers={"ETag": etag})
+
+    async def handle_timeseries(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._random.random() < self.failure_rate:
+            self.failures += 1
+            return web.Response(status=self.failure_status, text="injected failure")
+        return web.json_response(synthetic_timeseries(int(request.query["id"])))
+
+    async def handle_mapping(self, request):
+        self.requests += 1
+        return web.json_response(synthetic_mapping())
+
+    async def start(self, port=0):
+        app = web.Application()
+        app.router.add_get("/api/v1/osrs/timeseries", self.handle_timeseries)
+        app.router.add_get("/api/v1/osrs/mapping", self.handle_mapping)
+        app.router.add_get("/api/v1/osrs/{endpoint}", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve(args):
+    server = await PriceServer(args.latency, args.failure_rate, args.failure_status).start(args.port)
+    print(f"Serving benchmark prices at {server.api_base} (set prices.api_base in config.yaml to use it)")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the OSRS wiki price API.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--failure-status", type=int, default=503)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -1,24 +1,154 @@
+import asyncio
+import hashlib
+import json
+import logging
 import os
+import time
+
+from discord import app_commands
 from discord.ext import commands
-from config.settings import BOT_PREFIX, INTENTS
+from bot.utils.api import MARKET_ENDPOINTS, PriceStore
+from bot.utils.history import price_history
+from bot.utils.margins import margin_scanner
+from bot.utils.metrics import MetricsExporter, metrics
+from bot.utils.shared_prices import SharedPriceStore, market_path
+from bot.utils.snapshot_store import SnapshotStore
+from bot.utils.timing import StartupTimer
+from config.settings import (
+    BOT_PREFIX, COMMAND_HASH_PATH, HISTORY_BACKFILL, INTENTS, MARGINS_REFRESH_INTERVAL, METRICS_HTTP_HOST, METRICS_HTTP_PORT, METRICS_LOOP_LAG_INTERVAL,
+    METRICS_TEXTFILE_PATH, METRICS_WRITE_INTERVAL, STARTUP_TIMINGS_PATH,
+)
 
+log = logging.getLogger(__name__)
 
-class MyBot(commands.Bot):
-    def __init__(self):
-        super().__init__(command_prefix=BOT_PREFIX, intents=INTENTS)
+# Every command module, loaded exactly once from setup_hook
+EXTENSIONS = (
+    "bot.commands.herb_profit",
+    "bot.commands.recipes",
+    "bot.commands.herb_optimize",
+    "bot.commands.bot_stats",
+    "bot.commands.price_trend",
+    "bot.commands.top_margins",
+    "bot.commands.watch",
+)
 
-    async def setup_hook(self):
-        await self.load_extension("bot.commands.herb_profit")
-        await self.load_extension("bot.commands.fish_profit")
 
+def record_command(interaction, outcome):
+    name = interaction.command.qualified_name if interaction.command is not None else "unknown"
+    started = interaction.extras.get("started")
+    if started is not None:
+        metrics.observe("command_seconds", time.perf_counter() - started, command=name)
+    metrics.inc("commands_total", command=name, outcome=outcome)
+
+
+# Command tree that times every slash command from dispatch until its callback returns
+# (completed commands are recorded by MyBot.on_app_command_completion)
+class InstrumentedTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction):
+        interaction.extras["started"] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction, error):
+        record_command(interaction, "error")
+        await super().on_error(interaction, error)
+
+
+# Per-process variant of a metrics setting: shard processes get their own file / port
+def process_metrics(textfile_path, http_port, label, offset):
+    if textfile_path:
+        root, ext = os.path.splitext(textfile_path)
+        textfile_path = f"{root}.{label}{ext}"
+    return textfile_path, http_port + offset if http_port else 0
+
+
+# Runs every shard itself by default. For multi-process mode each process gets a subset of
+# `shard_ids` and `shared_prices=True`, so prices are read from the fetcher process's shared
+# snapshot (bot/utils/shared_prices.py) instead of being fetched and stored per process.
+class MyBot(commands.AutoShardedBot):
+    def __init__(self, timer=None, shard_ids=None, shard_count=None, shared_prices=False):
+        super().__init__(command_prefix=BOT_PREFIX, intents=INTENTS, tree_cls=InstrumentedTree, shard_ids=shard_ids, shard_count=shard_count)
+        self.timer = timer if timer is not None else StartupTimer()
+        # `prices` only keeps the items data/items.py prices, `market` every item of /latest and /1h
+        # (for /top_margins and /watch), fetched and parsed in full on a slower schedule of its own
+        if shared_prices:
+            self.snapshots = None
+            self.prices = SharedPriceStore()
+            self.market = SharedPriceStore(market_path(), endpoints=MARKET_ENDPOINTS, label="market")
+        else:
+            self.snapshots = SnapshotStore()
+            self.prices = PriceStore(snapshot_store=self.snapshots)
+            self.market = PriceStore(
+                ttl=MARGINS_REFRESH_INTERVAL, refresh_interval=MARGINS_REFRESH_INTERVAL, full_parse=True,
+                endpoints=MARKET_ENDPOINTS, label="market")
+        # every new /5m snapshot becomes one sample of the rolling price history
+        self.prices.add_listener(price_history.on_snapshot)
+        # /top_margins results are recomputed once per new /latest or /1h version
+        self.market.add_listener(margin_scanner.on_snapshot)
+        self._background = []
+        textfile_path, http_port = METRICS_TEXTFILE_PATH, METRICS_HTTP_PORT
+        if shard_ids:
+            textfile_path, http_port = process_metrics(textfile_path, http_port, f"shard{min(shard_ids)}", min(shard_ids))
+        self.metrics_exporter = MetricsExporter(
+            textfile_path=textfile_path, write_interval=METRICS_WRITE_INTERVAL, http_host=METRICS_HTTP_HOST,
+            http_port=http_port, loop_lag_interval=METRICS_LOOP_LAG_INTERVAL)
+
+    async def setup_hook(self):
+        await self.metrics_exporter.start()
+        with self.timer.phase("price_warmup"):
+            # warm start from the last stored prices before the gateway connects, then keep them fresh
+            await self.prices.load_persisted()
+            # one shared session + background refresher, commands read from this instead of the network
+            await self.prices.start()
+            await self.market.start()
+        # filling the history takes one request per tracked item, so it runs in the background;
+        # shard processes have no API session and build theirs from live /5m samples only
+        if HISTORY_BACKFILL and self.snapshots is not None:
+            self._background.append(asyncio.create_task(price_history.backfill(self.prices), name="history-backfill"))
+        # shard processes read the item mapping the fetcher process keeps up to date
+        self._background.append(asyncio.create_task(margin_scanner.keep_mapping(fetch=self.snapshots is not None), name="item-mapping"))
+        with self.timer.phase("extensions"):
+            for extension in EXTENSIONS:
+                await self.load_extension(extension)
+        # the command tree is global, only the process running shard 0 syncs it
+        if self.shard_ids is None or 0 in self.shard_ids:
+            with self.timer.phase("tree_sync"):
+                await self.sync_commands()
 
-bot = MyBot()
+    # Syncs the slash commands with Discord only when their definitions changed since the last sync
+    async def sync_commands(self, force=False):
+        payload = [command.to_dict(self.tree) for command in self.tree.get_commands()]
+        digest = hashlib.sha256(json.dumps([self.application_id, payload], sort_keys=True, default=str).encode()).hexdigest()
+        try:
+            with open(COMMAND_HASH_PATH) as file:
+                synced = file.read().strip()
+        except OSError:
+            synced = None
+        if synced == digest and not force:
+            log.info("Command tree unchanged, skipping sync")
+            return False
 
+        await self.tree.sync()
+        os.makedirs(os.path.dirname(COMMAND_HASH_PATH) or ".", exist_ok=True)
+        with open(COMMAND_HASH_PATH, "w") as file:
+            file.write(digest)
+        log.info("Synced %d commands", len(payload))
+        return True
 
-@bot.event
-async def on_ready():
-    print(f'Logged in as {bot.user}')
-    await bot.tree.sync()
+    async def on_ready(self):
+        print(f'Logged in as {self.user}')
+        if not self.timer.finished:
+            self.timer.mark("gateway_ready")
+            self.timer.report(STARTUP_TIMINGS_PATH)
 
+    async def on_app_command_completion(self, interaction, command):
+        record_command(interaction, "ok")
 
-bot.run(os.getenv("DISCORD_BOT_TOKEN"))
+    async def close(self):
+        for task in self._background:
+            task.cancel()
+        await self.metrics_exporter.close()
+        await self.prices.close()
+        await self.market.close()
+        if self.snapshots is not None:
+            self.snapshots.close()
+        await super().close()
@@ -0,0 +1,51 @@
+import time
+
+import discord
+from discord.ext import commands
+from discord import app_commands
+from bot.utils.metrics import metrics
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:.0f}ms"
+
+
+# Plain-text summary of the metrics registry, the full set is in the Prometheus output
+def format_stats():
+    lines = [f"uptime {(time.time() - metrics.started) / 3600:.1f}h", "", "commands"]
+    outcomes = metrics.counters_by("commands_total", "command")
+    for name, histogram in sorted(metrics.histograms_by("command_seconds", "command").items()):
+        lines.append(f"  /{name:<16} {outcomes.get(name, 0):>6} runs  p50 {_ms(histogram.quantile(0.5)):>7}  p95 {_ms(histogram.quantile(0.95)):>7}")
+    for name, histogram in sorted(metrics.histograms_by("view_callback_seconds", "view").items()):
+        lines.append(f"  {name:<17} {histogram.count:>6} uses  p50 {_ms(histogram.quantile(0.5)):>7}  p95 {_ms(histogram.quantile(0.95)):>7}")
+
+    lines += ["", "price api"]
+    errors = metrics.counters_by("price_fetch_errors_total", "endpoint")
+    for endpoint, histogram in sorted(metrics.histograms_by("price_fetch_seconds", "endpoint").items()):
+        size = metrics.gauges.get(("price_payload_bytes", (("endpoint", endpoint),)), 0)
+        lines.append(f"  {endpoint:<6} {histogram.count:>6} fetches  p50 {_ms(histogram.quantile(0.5)):>7}  {errors.get(endpoint, 0)} errors  last {size / 1024:.0f} KiB")
+
+    lines += ["", "caches"]
+    for name, stats in sorted(metrics.cache_stats().items()):
+        lines.append(f"  {name:<14} {stats['size']:>4}/{stats['maxsize']:<4} hit rate {stats['hit_rate']:.0%}  evictions {stats['evictions']}")
+
+    lag = metrics.histogram("event_loop_lag_seconds")
+    if lag is not None:
+        lines += ["", f"event loop lag  p50 {_ms(lag.quantile(0.5))}  p99 {_ms(lag.quantile(0.99))}"]
+    return "```\n" + "\n".join(lines) + "\n```"
+
+
+class BotStats(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    @app_commands.command(name="bot_stats", description="Show the bot's runtime metrics (owner only).")
+    async def stats(self, interaction: discord.Interaction):
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.response.send_message("Only the bot owner can use this command.", ephemeral=True)
+            return
+        await interaction.response.send_message(format_stats(), ephemeral=True)
+
+
+async def setup(bot):
+    await bot.add_cog(BotStats(bot))
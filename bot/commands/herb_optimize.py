@@ -0,0 +1,90 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+from bot.utils.api import PRICE_KEYS, snapshot_for
+from bot.utils.calculations import optimize_herb_setup
+from bot.utils.rendering import render_markdown
+from data.items import compost, herbs
+
+OPTIMIZE_COLUMNS = [
+    ("Herb", "Herb", 12, None),
+    ("Compost", "Compost", 13, None),
+    ("Attas", "Attas", 6, lambda planted: "Yes" if planted else "No"),
+    ("Compost Cost", "Compost Cost", 13, int),
+    ("Profit per Run", "Profit per Run", 15, int),
+]
+
+
+class HerbOptimize(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    @app_commands.command(name="herb_optimize", description="Find the most profitable herb, compost and Attas choice for your unlocks.")
+    @app_commands.describe(
+        farming_level="Your farming level",
+        patches="Number of total herb patches",
+        weiss="Have the disease-free Weiss patch",
+        trollheim="Have the disease-free Trollheim patch",
+        hosidius="Have the disease-free Hosidius patch",
+        fortis="Have the disease-free Civitas illa Fortis patch (champion)",
+        kandarin_diary="Kandarin diary level",
+        kourend="Completed Kourend hard diary",
+        magic_secateurs="Own Magic Secateurs",
+        farming_cape="Own a Farming cape",
+        attas="Can plant Attas in the anima patch",
+        top_k="How many setups to show"
+    )
+    @app_commands.choices(
+        kandarin_diary=[
+            app_commands.Choice(name="None", value="None"),
+            app_commands.Choice(name="Medium (5%)", value="5%"),
+            app_commands.Choice(name="Hard (10%)", value="10%"),
+            app_commands.Choice(name="Elite (15%)", value="15%"),
+        ],
+        price_type=[
+            app_commands.Choice(name="Latest", value="latest"),
+            app_commands.Choice(name="1-hour average", value="1h"),
+        ]
+    )
+    async def herb_optimize(
+        self,
+        interaction: discord.Interaction,
+        farming_level: app_commands.Range[int, 1, 99],
+        patches: app_commands.Range[int, 1, 20],
+        weiss: bool,
+        trollheim: bool,
+        hosidius: bool,
+        fortis: bool,
+        kandarin_diary: app_commands.Choice[str],
+        kourend: bool,
+        magic_secateurs: bool,
+        farming_cape: bool,
+        attas: bool,
+        price_type: app_commands.Choice[str],
+        top_k: app_commands.Range[int, 1, 15] = 5
+    ):
+        disease_free = weiss + trollheim + hosidius + fortis
+        if patches < disease_free:
+            await interaction.response.send_message(
+                f"You picked {disease_free} disease-free patches but only {patches} patches in total.", ephemeral=True)
+            return
+
+        snapshot = await snapshot_for(interaction, self.bot.prices, price_type.value)
+        if snapshot is None:
+            return
+        # every compost/Attas/herb combination is evaluated in a single batch, so this stays well inside
+        # the interaction window and needs no follow-up
+        best = optimize_herb_setup(
+            snapshot.table, herbs, compost, farming_level, patches, weiss, trollheim, hosidius, fortis,
+            kandarin_diary.value, kourend, magic_secateurs, farming_cape, attas, PRICE_KEYS[price_type.value], top_k
+        )
+        if not best:
+            await interaction.response.send_message("No profit data available.")
+            return
+
+        table = render_markdown(OPTIMIZE_COLUMNS, best, title=f"Best setups using {price_type.value} prices")
+        await interaction.response.send_message(content=f"{interaction.user.mention} Here are the results:{snapshot.stale_note()}\n{table}")
+
+
+async def setup(bot):
+    await bot.add_cog(HerbOptimize(bot))
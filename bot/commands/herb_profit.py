@@ -1,34 +1,41 @@
+import asyncio
+
 import discord
 from discord.ext import commands
 from discord import app_commands
-import pandas as pd
-from bot.utils.api import fetch_latest_prices, fetch_1h_prices
-from bot.utils.calculations import calculate_custom_profit, DEBUG
+from bot.utils.api import PRICE_KEYS, snapshot_for
+from bot.utils.calculations import HerbSetups, simulate_herb_profit
+from bot.utils.derived import herb_results
+from bot.utils.history import format_volatility, price_history
+from bot.utils.metrics import TRACING, metrics, trace
+from bot.utils.rendering import build_embed, render_embed_fields, render_markdown, sort_records
+from bot.utils.views import BoundedView
+from config.settings import SIMULATION_TRIALS
 from data.items import herbs
 
+HERB_COLUMNS = [
+    ("Seed Price", "Seed Price", 12, None),
+    ("Herb Price", "Grimy Herb Price", 12, None),
+    ("Profit per Run", "Profit per Run", 15, int),
+]
+VOLATILITY_COLUMN = ("Volatility", "Volatility", 10, format_volatility)
+SIMULATION_COLUMNS = [
+    ("Herbs p10/50/90", "Yield", 15, lambda values: "/".join(f"{value:.0f}" for value in values)),
+    ("Profit p10", "Profit p10", 12, int),
+    ("Profit p50", "Profit p50", 12, int),
+    ("Profit p90", "Profit p90", 12, int),
+]
 
-# Setting the VIEW class to handle user format selection, interactive within discord channel message
-class FormatSelectView(discord.ui.View):
-    def __init__(self, bot, interaction, farming_level, patches, weiss, trollheim, hosidius, fortis, kandarin_diary, kourend, magic_secateurs, farming_cape, bottomless_bucket, attas, compost, prices, price_key, price_type):
-        super().__init__()
-        self.bot = bot
-        self.interaction = interaction
-        self.farming_level = farming_level
-        self.patches = patches
-        self.weiss = weiss
-        self.trollheim = trollheim
-        self.hosidius = hosidius
-        self.fortis = fortis
-        self.kandarin_diary = kandarin_diary
-        self.kourend = kourend
-        self.magic_secateurs = magic_secateurs
-        self.farming_cape = farming_cape
-        self.bottomless_bucket = bottomless_bucket
-        self.attas = attas
-        self.compost = compost
-        self.prices = prices
-        self.price_key = price_key
-        self.price_type = price_type
+
+# Setting the VIEW class to handle user format selection, interactive within discord channel message.
+# Holds only the sorted result rows of the request, computed when the command ran
+class FormatSelectView(BoundedView):
+    def __init__(self, interaction, profit_results, title, stale_note="", columns=HERB_COLUMNS):
+        super().__init__(interaction)
+        self.profit_results = profit_results
+        self.columns = columns
+        self.title = title
+        self.stale_note = stale_note
 
     # Select menu for format, set's the option for the bot to later format the reply
     @discord.ui.select(
@@ -39,61 +46,40 @@ class FormatSelectView(discord.ui.View):
         ],
         custom_id="select_format"
     )
+    @metrics.timed("view_callback_seconds", view="herb_profit_format")
     async def select_callback(self, interaction: discord.Interaction, select):
-        # Sets the format choice
+        # Sets the format choice, the view answers once
         format_choice = interaction.data["values"][0]
+        self.stop()
         await interaction.response.defer()
-        
-        if DEBUG:
-            # Debugging: Print the prices and price_key
-            print("Prices fetched:", self.prices)
-            print("Price key:", self.price_key)
-
-        # calculate profits
-        profit_results = calculate_custom_profit(
-            self.prices, herbs, self.farming_level, self.patches, self.weiss,
-            self.trollheim, self.hosidius, self.fortis, self.compost, self.kandarin_diary,
-            self.kourend, self.magic_secateurs, self.farming_cape, self.bottomless_bucket, self.attas, self.price_key
-        )
+
+        if TRACING:
+            trace("herb_profit.format", format=format_choice, rows=len(self.profit_results))
 
         # Error handling if API or calc is empty
-        if not profit_results:
+        if not self.profit_results:
             await self.interaction.followup.send("No profit data available.")
             return
 
-        # Converting results to data frame
-        df = pd.DataFrame(profit_results)
-        df_sorted = df.sort_values(by="Profit per Run", ascending=False)
-
         # Format and send response based on user choice
-        title = f"results using {self.price_type} prices"
         if format_choice == "markdown":
-            table_header = f"{'Herb':<12} {'Seed Price':<12} {'Herb Price':<12} {'Profit per Run':<15}\n{'-'*12} {'-'*12} {'-'*12} {'-'*15}\n"
-            table_rows = ""
-            for index, row in df_sorted.iterrows():
-                table_rows += f"{row['Herb']:<12} {row['Seed Price']:<12} {row['Grimy Herb Price']:<12} {int(row['Profit per Run']):<15}\n"
-            table = f"```{title}\n{table_header}{table_rows}```"
-            await self.interaction.followup.send(content=f"{self.interaction.user.mention} Here are the results:\n{table}")
+            table = render_markdown([("Herb", "Herb", 12, None)] + self.columns, self.profit_results, title=self.title)
+            await self.interaction.followup.send(content=f"{self.interaction.user.mention} Here are the results:{self.stale_note}\n{table}")
 
         elif format_choice == "embed":
-            embed = discord.Embed(title=title, color=discord.Color.green())
-            embed.set_author(name=self.interaction.user.display_name, icon_url=self.interaction.user.display_avatar.url)
-            for index, row in df_sorted.iterrows():
-                embed.add_field(
-                    name=row['Herb'],
-                    value=(
-                        f"**Seed Price:** {row['Seed Price']}\n"
-                        f"**Herb Price:** {row['Grimy Herb Price']}\n"
-                        f"**Profit per Run:** {int(row['Profit per Run'])}\n"
-                    ),
-                    inline=False
-                )
-            await self.interaction.followup.send(content=f"{self.interaction.user.mention} Here are the results:", embed=embed)
+            fields = render_embed_fields("Herb", self.columns, self.profit_results)
+            embed = build_embed(self.title, discord.Color.green(), fields, self.interaction.user)
+            await self.interaction.followup.send(content=f"{self.interaction.user.mention} Here are the results:{self.stale_note}", embed=embed)
 
 
 class HerbProfit(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # drop cached results that can no longer be patched as soon as new prices arrive
+        bot.prices.add_listener(herb_results.on_snapshot)
+
+    async def cog_unload(self):
+        self.bot.prices.remove_listener(herb_results.on_snapshot)
 
     @app_commands.command(name="herb_profit", description="Calculate the potential profit from herb farming runs.")
     @app_commands.describe(
@@ -103,15 +89,22 @@ class HerbProfit(commands.Cog):
         trollheim="Use disease-free Trollheim patch",
         hosidius="Use disease-free Hosidius patch",
         fortis="Use disease-free Civitas illa Fortis patch (champion)",
-        kandarin_diary="Kandarin diary level (None/5%/10%/15%)",
+        kandarin_diary="Kandarin diary level",
         kourend="Completed Kourend hard diary",
         magic_secateurs="Use Magic Secateurs",
         farming_cape="Have Farming cape equipped",
         bottomless_bucket="Use Bottomless compost bucket",
-        attas="Is attas planted in anima patch?"
-
+        attas="Is attas planted in anima patch?",
+        volatility="Add the grimy herb's 24h price volatility",
+        simulate="Add the 10th/50th/90th percentile of herbs and profit over many simulated runs"
     )
     @app_commands.choices(
+        kandarin_diary=[
+            app_commands.Choice(name="None", value="None"),
+            app_commands.Choice(name="Medium (5%)", value="5%"),
+            app_commands.Choice(name="Hard (10%)", value="10%"),
+            app_commands.Choice(name="Elite (15%)", value="15%"),
+        ],
         compost=[
             app_commands.Choice(name="None", value="None"),
             app_commands.Choice(name="Compost", value="Compost"),
@@ -126,42 +119,68 @@ class HerbProfit(commands.Cog):
     async def herb_profit(
         self,
         interaction: discord.Interaction,
-        farming_level: int,
-        patches: int,
+        farming_level: app_commands.Range[int, 1, 99],
+        patches: app_commands.Range[int, 1, 20],
         weiss: bool,
         trollheim: bool,
         hosidius: bool,
         fortis: bool,
-        kandarin_diary: str,
+        kandarin_diary: app_commands.Choice[str],
         kourend: bool,
         magic_secateurs: bool,
         farming_cape: bool,
         bottomless_bucket: bool,
         attas: bool,
         compost: app_commands.Choice[str],
-        price_type: app_commands.Choice[str]
+        price_type: app_commands.Choice[str],
+        volatility: bool = False,
+        simulate: bool = False
     ):
-        if price_type.value == "latest":
-            prices = fetch_latest_prices()
-            price_key = "high"
-        elif price_type.value == "1h":
-            prices = fetch_1h_prices()
-            price_key = "avgHighPrice"
+        disease_free = weiss + trollheim + hosidius + fortis
+        if patches < disease_free:
+            await interaction.response.send_message(
+                f"You picked {disease_free} disease-free patches but only {patches} patches in total.", ephemeral=True)
+            return
+
+        if price_type.value in PRICE_KEYS:
+            snapshot = await snapshot_for(interaction, self.bot.prices, price_type.value)
+            if snapshot is None:
+                return
+            price_key = PRICE_KEYS[price_type.value]
         else:
             await self.interaction.followup.send("error is checking price type value")
             return
         
-        if DEBUG:
-            # Debugging: Print the prices and price_key
-            print("Prices fetched:", prices)
-            print("Price key:", price_key)
+        if TRACING:
+            trace("herb_profit.prices", endpoint=snapshot.endpoint, version=snapshot.version, age=round(snapshot.age, 1), price_key=price_key)
         
+        # calculate profits, only herbs whose prices changed since the last identical request are recomputed
+        profit_results = herb_results.rows(
+            snapshot, price_key, farming_level, patches, weiss, trollheim, hosidius, fortis, compost.value,
+            kandarin_diary.value, kourend, magic_secateurs, farming_cape, bottomless_bucket, attas
+        )
+
+        # the cached rows are shared, so the volatility goes on copies
+        columns = HERB_COLUMNS
+        if volatility:
+            profit_results = [dict(row, Volatility=price_history.volatility_of(herbs[row["Herb"]]["herb_id"])) for row in profit_results]
+            columns = HERB_COLUMNS + [VOLATILITY_COLUMN]
+        # the simulation draws fresh runs every time, so it is not cached, and runs off the event loop
+        if simulate:
+            setups = HerbSetups(
+                farming_level, patches, weiss, trollheim, hosidius, fortis, compost.value, kandarin_diary.value, kourend,
+                magic_secateurs, farming_cape, attas)
+            with metrics.timer("herb_simulation_seconds"):
+                simulated = await asyncio.to_thread(simulate_herb_profit, snapshot.table, herbs, setups, price_key, SIMULATION_TRIALS)
+            profit_results = [dict(row, **simulated[row["Herb"]]) for row in profit_results if row["Herb"] in simulated]
+            # the percentiles replace the seed and herb price columns, so the markdown table stays
+            # inside Discord's 2000 characters together with the volatility column
+            columns = columns[2:] + SIMULATION_COLUMNS
+
         # Create and send a view select
         view = FormatSelectView(
-            bot=self.bot, interaction=interaction, farming_level=farming_level, patches=patches,
-            weiss=weiss, trollheim=trollheim, hosidius=hosidius, fortis=fortis, kandarin_diary=kandarin_diary,
-            kourend=kourend, magic_secateurs=magic_secateurs, farming_cape=farming_cape, bottomless_bucket=bottomless_bucket, attas=attas,
-            compost=compost.value, prices=prices, price_key=price_key, price_type=price_type.value
+            interaction=interaction, profit_results=sort_records(profit_results, "Profit per Run"),
+            title=f"results using {price_type.value} prices", stale_note=snapshot.stale_note(), columns=columns
         )
         await interaction.response.send_message("Choose the format for the reply:", view=view)
 
@@ -0,0 +1,93 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+from bot.utils.history import format_volatility, price_history
+from bot.utils.rendering import render_markdown, sort_records
+from data.items import compost, fish, herbs
+
+# Every item with a price history, by the name users pick it with
+ITEM_NAMES = {}
+for name, info in herbs.items():
+    ITEM_NAMES[f"{name} seed"] = info["seed_id"]
+    ITEM_NAMES[f"Grimy {name.lower()}"] = info["herb_id"]
+for name, info in fish.items():
+    ITEM_NAMES[f"Raw {name.lower()}"] = info["raw_id"]
+    ITEM_NAMES[name] = info["cooked_id"]
+for name, info in compost.items():
+    ITEM_NAMES[name] = info["item_id"]
+
+# Products shown in the overview table, the inputs are reachable by name
+OVERVIEW = [(f"Grimy {name.lower()}", info["herb_id"]) for name, info in herbs.items()] + [(name, info["cooked_id"]) for name, info in fish.items()]
+
+
+def _gp(value):
+    return "n/a" if value is None else f"{value:,.0f}"
+
+
+def _change(value):
+    return "n/a" if value is None else f"{value:+.1%}"
+
+
+TREND_COLUMNS = [
+    ("Item", "Item", 18, None),
+    ("Last", "last", 10, _gp),
+    ("VWAP", "vwap", 10, _gp),
+    ("Min", "min", 10, _gp),
+    ("Max", "max", 10, _gp),
+    ("Change", "change", 8, _change),
+    ("Volatility", "volatility", 10, format_volatility),
+]
+
+
+# One item's rolling stats as a markdown block
+def format_summary(name, summary):
+    lines = [
+        f"{name} over the last {summary['hours']:.1f}h ({summary['samples']} traded 5m periods)",
+        f"last        {_gp(summary['last'])}",
+        f"mean        {_gp(summary['mean'])}",
+        f"std dev     {_gp(summary['std'])} ({format_volatility(summary['volatility'])})",
+        f"min / max   {_gp(summary['min'])} / {_gp(summary['max'])}",
+        f"vwap        {_gp(summary['vwap'])}",
+        f"change      {_change(summary['change'])}",
+    ]
+    return "```\n" + "\n".join(lines) + "\n```"
+
+
+# Overview rows sorted by volatility, items without enough history last
+def overview_rows():
+    rows = [dict(price_history.summary(item_id), Item=name) for name, item_id in OVERVIEW]
+    for row in rows:
+        row["sort"] = -1 if row["volatility"] is None else row["volatility"]
+    return sort_records(rows, "sort")
+
+
+class PriceTrend(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    @app_commands.command(name="price_trend", description="Show rolling 5-minute price statistics of the tracked items.")
+    @app_commands.describe(item="Item to show, leave empty for an overview sorted by volatility")
+    async def price_trend(self, interaction: discord.Interaction, item: str = None):
+        if not price_history.samples:
+            await interaction.response.send_message("No price history yet, try again in a few minutes.", ephemeral=True)
+            return
+
+        if item is None:
+            table = render_markdown(TREND_COLUMNS, overview_rows(), title=f"last {price_history.summary(OVERVIEW[0][1])['hours']:.1f}h of 5m prices")
+            await interaction.response.send_message(table)
+            return
+
+        item_id = ITEM_NAMES.get(item)
+        if item_id is None:
+            await interaction.response.send_message(f"Unknown item: {item}", ephemeral=True)
+            return
+        await interaction.response.send_message(format_summary(item, price_history.summary(item_id)))
+
+    @price_trend.autocomplete("item")
+    async def item_autocomplete(self, interaction: discord.Interaction, current: str):
+        current = current.lower()
+        return [app_commands.Choice(name=name, value=name) for name in ITEM_NAMES if current in name.lower()][:25]
+
+
+async def setup(bot):
+    await bot.add_cog(PriceTrend(bot))
@@ -0,0 +1,124 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+from bot.utils.api import PRICE_KEYS, snapshot_for
+from bot.utils.cache import LRUCache
+from bot.utils.history import format_volatility, price_history
+from bot.utils.metrics import metrics
+from bot.utils.recipes import recipe_book
+from bot.utils.rendering import build_embed, render_embed_fields, render_markdown, sort_records
+from bot.utils.views import BoundedView
+from data.items import recipe_groups
+
+VOLATILITY_COLUMN = ("Volatility", "Volatility", 10, format_volatility)
+
+
+# Whole amounts without the ".0" of the float results, fractions (e.g. 310390.5 XP/hr) as they are
+def amount(value):
+    return int(value) if value.is_integer() else value
+
+
+# Price columns of a group's table, labelled the way the group describes its inputs and outputs
+def recipe_columns(group):
+    return [
+        (group["input_label"], "Input Cost", 12, int),
+        (group["output_label"], "Output Value", 12, int),
+        ("Profit", "Profit", 12, int),
+        ("XP/hr", "XP/hr", 12, amount),
+        ("GP/hr", "GP/hr", 12, amount),
+    ]
+
+
+# Holds the markdown/embed rendering shared by every invocation on the same price snapshot
+class FormatSelectView(BoundedView):
+    def __init__(self, interaction, rendered, title, stale_note=""):
+        super().__init__(interaction)
+        self.rendered = rendered
+        self.title = title
+        self.stale_note = stale_note
+
+    @discord.ui.select(
+        placeholder="Select an option...",
+        options=[
+            discord.SelectOption(label="Markdown Code Block", value="markdown"),
+            discord.SelectOption(label="Embed with Fields", value="embed"),
+        ],
+        custom_id="select_format"
+    )
+    @metrics.timed("view_callback_seconds", view="recipe_format")
+    async def select_callback(self, interaction: discord.Interaction, select: discord.ui.Select):
+        format_choice = select.values[0]
+        self.stop()
+        await interaction.response.defer()
+
+        if self.rendered is None:
+            await self.interaction.followup.send("No profit data available.")
+            return
+
+        # both formats were rendered once for this price snapshot, only the author differs per reply
+        table, fields = self.rendered
+        if format_choice == "markdown":
+            await self.interaction.followup.send(content=f"{self.interaction.user.mention} Here are the results:{self.stale_note}\n{table}")
+
+        elif format_choice == "embed":
+            embed = build_embed(self.title, discord.Color.blue(), fields, self.interaction.user)
+            await self.interaction.followup.send(content=f"{self.interaction.user.mention} Here are the results:{self.stale_note}", embed=embed)
+
+
+# One slash command per entry of data.items.recipe_groups, all answered from the same batched
+# recipe evaluation. Adding a money maker is a data change: new recipes in an existing group
+# show up in its command, a new group gets its own command.
+class RecipeCommands(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.rendered = LRUCache(maxsize=16)
+        metrics.register_cache("recipe_rendered", self.rendered)
+        self.generated = [self.build_command(name, group) for name, group in recipe_groups.items()]
+
+    async def cog_load(self):
+        for command in self.generated:
+            self.bot.tree.add_command(command)
+
+    async def cog_unload(self):
+        for command in self.generated:
+            self.bot.tree.remove_command(command.name)
+
+    # Markdown table and embed fields of one group; the tables take no user parameters so each is
+    # rendered once per price version (and history version with volatility) and shared
+    def render(self, name, group, snapshot, price_key, volatility=False):
+        key = (name, snapshot.endpoint, price_key, snapshot.version, price_history.version if volatility else None)
+        rendered = self.rendered.get(key)
+        if rendered is None:
+            rows = sort_records(recipe_book.evaluate(snapshot, price_key).rows(name, group["name_label"]), group["sort"])
+            if rows:
+                fields = recipe_columns(group)
+                if volatility:
+                    rows = [dict(row, Volatility=price_history.volatility_of(row["output_id"])) for row in rows]
+                    fields = fields + [VOLATILITY_COLUMN]
+                width = max(12, *(len(row[group["name_label"]]) for row in rows))
+                columns = [(group["name_label"], group["name_label"], width, None)] + fields
+                rendered = (render_markdown(columns, rows), render_embed_fields(group["name_label"], fields, rows))
+                self.rendered.put(key, rendered)
+        return rendered
+
+    def build_command(self, name, group):
+        @app_commands.describe(volatility="Add each product's 24h price volatility")
+        @app_commands.choices(
+            price_type=[
+                app_commands.Choice(name="Latest", value="latest"),
+                app_commands.Choice(name="1-hour average", value="1h"),
+            ]
+        )
+        async def callback(interaction: discord.Interaction, price_type: app_commands.Choice[str], volatility: bool = False):
+            snapshot = await snapshot_for(interaction, self.bot.prices, price_type.value)
+            if snapshot is None:
+                return
+            rendered = self.render(name, group, snapshot, PRICE_KEYS[price_type.value], volatility)
+            view = FormatSelectView(interaction=interaction, rendered=rendered, title=group["title"], stale_note=snapshot.stale_note())
+            await interaction.response.send_message("Choose the format for the reply:", view=view)
+
+        return app_commands.Command(name=group["command"], description=group["description"], callback=callback)
+
+
+async def setup(bot):
+    await bot.add_cog(RecipeCommands(bot))
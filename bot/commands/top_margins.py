@@ -0,0 +1,69 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+from bot.utils.margins import DEFAULT_COUNT, DEFAULT_MIN_VOLUME, margin_scanner
+from bot.utils.rendering import render_markdown
+
+
+NAME_WIDTH = 24
+
+
+def _gp(value):
+    return "n/a" if value is None else f"{value:,}"
+
+
+MARGIN_COLUMNS = [
+    ("Buy", "Buy", 13, _gp),
+    ("Sell", "Sell", 13, _gp),
+    ("Margin", "Margin", 10, _gp),
+    ("ROI", "ROI", 7, lambda value: f"{value:.1%}"),
+    ("Vol/1h", "Volume", 8, _gp),
+    ("Limit", "Limit", 7, _gp),
+    ("Limit Profit", "Limit Profit", 15, _gp),
+]
+
+
+class TopMargins(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    @app_commands.command(name="top_margins", description="Find the best flip margins on the whole Grand Exchange, after tax.")
+    @app_commands.describe(
+        sort="What to rank by",
+        min_volume="Minimum units traded in the last hour",
+        min_limit="Minimum 4-hour buy limit",
+        count="How many items to show"
+    )
+    @app_commands.choices(
+        sort=[
+            app_commands.Choice(name="Margin per item", value="margin"),
+            app_commands.Choice(name="Return on investment", value="roi"),
+            app_commands.Choice(name="Margin x buy limit", value="limit_profit"),
+        ]
+    )
+    async def top_margins(
+        self,
+        interaction: discord.Interaction,
+        sort: app_commands.Choice[str] = None,
+        min_volume: app_commands.Range[int, 0] = DEFAULT_MIN_VOLUME,
+        min_limit: app_commands.Range[int, 0] = 0,
+        count: app_commands.Range[int, 1, 15] = DEFAULT_COUNT
+    ):
+        # the scan runs when prices refresh, this only filters it (or reads the cached default)
+        rows = margin_scanner.top(sort.value if sort is not None else "margin", count, min_volume, min_limit)
+        if rows is None:
+            await interaction.response.send_message("Prices are still loading, try again in a minute.", ephemeral=True)
+            return
+        if not rows:
+            await interaction.response.send_message("No items match those filters.", ephemeral=True)
+            return
+
+        # long item names are cut so the table stays inside one message
+        width = min(NAME_WIDTH, max(12, *(len(row["Item"]) for row in rows)))
+        table = render_markdown([("Item", "Item", width, lambda name: name[:width])] + MARGIN_COLUMNS, rows, title="Margins after 2% GE tax")
+        note = margin_scanner.snapshots["latest"].stale_note()
+        await interaction.response.send_message(content=f"{interaction.user.mention} Here are the results:{note}\n{table}")
+
+
+async def setup(bot):
+    await bot.add_cog(TopMargins(bot))
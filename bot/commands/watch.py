@@ -0,0 +1,136 @@
+import asyncio
+
+import discord
+from discord.ext import commands
+from discord import app_commands
+from bot.commands.price_trend import ITEM_NAMES
+from bot.utils.margins import margin_scanner
+from bot.utils.recipes import recipe_book
+from bot.utils.watchlists import DIRECTIONS, ITEM_METRICS, WATCHABLE_RECIPES, AlertSender, Watchlists, WatchStore, describe
+from config.settings import ALERTS_MAX_PER_USER
+
+
+# Item id for a name: every item of the wiki mapping once it is loaded, the tracked items before that
+def find_item(name):
+    name = name.strip().lower()
+    for item_id, item_name in margin_scanner.names.items():
+        if item_name.lower() == name:
+            return item_id
+    for item_name, item_id in ITEM_NAMES.items():
+        if item_name.lower() == name:
+            return item_id
+    return None
+
+
+def _value(value):
+    return "n/a" if value is None else f"{value:,.0f}"
+
+
+# /watch add|list|remove. Every process can edit the watchlists, only the one running shard 0
+# evaluates them on new prices and sends the DMs, so nobody gets an alert twice.
+class Watch(commands.GroupCog, group_name="watch", group_description="Get a DM when a price or profit crosses a threshold"):
+    def __init__(self, bot):
+        self.bot = bot
+        self.watchlists = None
+        self.sender = AlertSender(bot)
+        self.evaluates = bot.shard_ids is None or 0 in bot.shard_ids
+        self._sending = None
+
+    async def cog_load(self):
+        # opening the database creates it and its tables, which stays off the event loop too
+        self.watchlists = Watchlists(await asyncio.to_thread(WatchStore))
+        await self.watchlists.load()
+        if self.evaluates:
+            self.bot.market.add_listener(self.on_snapshot)
+            self._sending = asyncio.create_task(self.run(), name="price-alerts")
+
+    async def cog_unload(self):
+        self.bot.market.remove_listener(self.on_snapshot)
+        if self._sending is not None:
+            self._sending.cancel()
+        if self.watchlists is not None:
+            await asyncio.to_thread(self.watchlists.store.close)
+
+    # Every flush interval: pick up watches other processes changed, then send the queued alerts
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.sender.flush_interval)
+            await self.watchlists.sync()
+            await self.sender.flush()
+
+    # PriceStore listener
+    def on_snapshot(self, snapshot):
+        for watch, value in self.watchlists.evaluate(snapshot):
+            self.sender.queue(watch["user_id"], f"{describe(watch)} is now {_value(value)} ({watch['direction']} {_value(watch['threshold'])}, watch #{watch['id']})")
+
+    @app_commands.command(name="add", description="Watch an item price/margin or a recipe profit/GP per hour")
+    @app_commands.describe(
+        metric="What to watch",
+        target="Item name for price/margin, recipe name (e.g. Shark, Clean ranarr) for profit and GP/hr",
+        direction="Alert when the value rises above or falls below the threshold",
+        threshold="Threshold in gp"
+    )
+    @app_commands.choices(
+        metric=[
+            app_commands.Choice(name="Item price", value="price"),
+            app_commands.Choice(name="Item flip margin (after tax)", value="margin"),
+            app_commands.Choice(name="Recipe profit per action/run", value="profit"),
+            app_commands.Choice(name="Recipe GP/hr", value="gp_hr"),
+        ],
+        direction=[app_commands.Choice(name=direction, value=direction) for direction in DIRECTIONS]
+    )
+    async def add(self, interaction: discord.Interaction, metric: app_commands.Choice[str], target: str, direction: app_commands.Choice[str], threshold: int):
+        if metric.value in ITEM_METRICS:
+            item_id = find_item(target)
+            if item_id is None:
+                await interaction.response.send_message(f"Unknown item: {target}", ephemeral=True)
+                return
+            target = item_id
+        elif target in recipe_book.positions and target not in WATCHABLE_RECIPES:
+            await interaction.response.send_message(
+                f"{target} profits depend on your farming setup and can't be watched, check them with /herb_profit.", ephemeral=True)
+            return
+        elif target not in recipe_book.positions:
+            await interaction.response.send_message(f"Unknown recipe: {target}", ephemeral=True)
+            return
+
+        if await asyncio.to_thread(self.watchlists.store.count, interaction.user.id) >= ALERTS_MAX_PER_USER:
+            await interaction.response.send_message(f"You already have {ALERTS_MAX_PER_USER} watches, remove one first.", ephemeral=True)
+            return
+
+        snapshot = self.bot.market.peek("latest")
+        current = self.watchlists.current(snapshot.table, metric.value, target) if snapshot is not None else None
+        watch_id = await self.watchlists.add(interaction.user.id, metric.value, target, direction.value, threshold, current)
+        watch = {"metric": metric.value, "target": str(target)}
+        await interaction.response.send_message(
+            f"Watch #{watch_id}: I'll DM you when {describe(watch)} goes {direction.value} {threshold:,} (now {_value(current)}).", ephemeral=True)
+
+    @add.autocomplete("target")
+    async def target_autocomplete(self, interaction: discord.Interaction, current: str):
+        current = current.lower()
+        if interaction.namespace.metric in ITEM_METRICS:
+            names = list(ITEM_NAMES) + [name for name in margin_scanner.names.values() if name not in ITEM_NAMES]
+        else:
+            names = WATCHABLE_RECIPES
+        return [app_commands.Choice(name=name, value=name) for name in names if current in name.lower()][:25]
+
+    @app_commands.command(name="list", description="Show your watches")
+    async def show(self, interaction: discord.Interaction):
+        watches = await asyncio.to_thread(self.watchlists.store.for_user, interaction.user.id)
+        if not watches:
+            await interaction.response.send_message("You have no watches, add one with /watch add.", ephemeral=True)
+            return
+        lines = [f"#{watch['id']}  {describe(watch)} {watch['direction']} {_value(watch['threshold'])}" for watch in watches]
+        await interaction.response.send_message("```\n" + "\n".join(lines) + "\n```", ephemeral=True)
+
+    @app_commands.command(name="remove", description="Remove one of your watches")
+    @app_commands.describe(watch_id="Number shown by /watch list")
+    async def remove(self, interaction: discord.Interaction, watch_id: int):
+        if await self.watchlists.remove(interaction.user.id, watch_id):
+            await interaction.response.send_message(f"Removed watch #{watch_id}.", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"You have no watch #{watch_id}.", ephemeral=True)
+
+
+async def setup(bot):
+    await bot.add_cog(Watch(bot))
@@ -1,11 +1,61 @@
-import requests
-from config.settings import HEADERS
+import asyncio
+import functools
+import json
+import logging
+import re
+import sqlite3
+import time
 
+import aiohttp
+import numpy as np
+from bot.utils.metrics import metrics
+from bot.utils.price_table import PriceTable, diff_tables
+from config.settings import (
+    HEADERS, PRICE_API_BASE, PRICE_FULL_PARSE, PRICE_REFRESH_INTERVAL, PRICE_RETRY_AFTER, PRICE_STALE_AFTER, PRICE_TIMEOUT, PRICE_TTL,
+    SNAPSHOT_PRUNE_INTERVAL,
+)
+from data.item_index import item_index
 
-# Grabs latest prices from wiki API, returns the entire list of all items to save an API resource
+log = logging.getLogger(__name__)
+
+API_BASE = PRICE_API_BASE
+ENDPOINTS = {
+    "latest": f"{API_BASE}/latest",
+    "5m": f"{API_BASE}/5m",
+    "1h": f"{API_BASE}/1h",
+}
+# Per-item history and item metadata, not price snapshots, so they are not refreshed with the ENDPOINTS
+TIMESERIES_URL = f"{API_BASE}/timeseries"
+MAPPING_URL = f"{API_BASE}/mapping"
+# Which field of each endpoint's item dicts the commands price against
+PRICE_KEYS = {
+    "latest": "high",
+    "5m": "avgHighPrice",
+    "1h": "avgHighPrice",
+}
+# Endpoints of the market-wide snapshots (every item, fully parsed) that /top_margins and /watch
+# read. They are fetched by a PriceStore of their own so commands keep the filtered parse.
+MARKET_ENDPOINTS = ("latest", "1h")
+# What PriceStore.get and SharedPriceStore.get raise when there is no snapshot at all to serve
+PRICE_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ValueError)
+PRICES_UNAVAILABLE = "Prices are unavailable right now, try again shortly."
+_TIMESTAMP = re.compile(rb'"timestamp"\s*:\s*(\d+)')
+PARSE_CHUNK_SIZE = 64 * 1024
+
+
+# Endpoint label of a store's metrics: the endpoint itself for the commands' store, prefixed with
+# the store's label otherwise (e.g. "market_latest")
+def metric_endpoint(endpoint, label=None):
+    return endpoint if label is None else f"{label}_{endpoint}"
+
+
+# Grabs latest prices from wiki API, returns the entire list of all items to save an API resource.
+# These blocking helpers are for scripts only, the bot reads from PriceStore; requests is imported
+# on first use so the bot never pays for it at startup.
 def fetch_latest_prices():
-    url = "https://prices.runescape.wiki/api/v1/osrs/latest"
-    response = requests.get(url, headers=HEADERS)  # OSRS wiki demands custom user-agent headers, defined in config.yaml. python requests are blocked by default
+    import requests
+    url = ENDPOINTS["latest"]
+    response = requests.get(url, headers=HEADERS, timeout=PRICE_TIMEOUT)  # OSRS wiki demands custom user-agent headers, defined in config.yaml. python requests are blocked by default
     data = response.json()
 
     if "data" not in data:
@@ -14,9 +64,401 @@ def fetch_latest_prices():
 
 
 def fetch_1h_prices():
-    url = "https://prices.runescape.wiki/api/v1/osrs/1h"
-    response = requests.get(url, headers=HEADERS)
+    import requests
+    url = ENDPOINTS["1h"]
+    response = requests.get(url, headers=HEADERS, timeout=PRICE_TIMEOUT)
     data = response.json()
     if "data" not in data:
         raise ValueError("Error fetching data from API")
-    return data["data"]
\ No newline at end of file
+    return data["data"]
+
+
+# Every tradeable item's metadata (id, name, members, buy limit, alch values, ...) as the API's
+# list of dicts. It changes with game updates only, so callers cache it (see bot/utils/margins.py)
+# and it gets a short-lived session of its own instead of a PriceStore.
+async def fetch_mapping(headers=HEADERS, timeout=PRICE_TIMEOUT):
+    async with aiohttp.ClientSession(headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        with metrics.timer("price_fetch_seconds", endpoint="mapping"):
+            async with session.get(MAPPING_URL) as response:
+                metrics.inc("price_fetch_total", endpoint="mapping", status=response.status)
+                response.raise_for_status()
+                mapping = await response.json()
+    if not isinstance(mapping, list):
+        raise ValueError("Error fetching item mapping from API")
+    return mapping
+
+
+# Regex matching `"<id>":{...}` (whitespace around the colon allowed) for exactly the given ids.
+# The ids are laid out as a digit trie so the scan decides at the first digit whether an item can
+# be wanted, instead of trying every id.
+@functools.lru_cache(maxsize=4)
+def _item_pattern(item_ids):
+    trie = {}
+    for item_id in item_ids:
+        node = trie
+        for digit in str(item_id):
+            node = node.setdefault(digit, {})
+        node[""] = {}
+
+    def alternatives(node):
+        branches = [digit + alternatives(child) for digit, child in sorted(node.items()) if digit]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return "(?:" + pattern + ")?" if "" in node else pattern
+
+    return re.compile(rb'"(' + alternatives(trie).encode() + rb')"\s*:\s*(\{[^{}]*\})')
+
+
+# Incremental parser for the wiki's {"data": {"<id>": {...}, ...}} payloads that keeps only the
+# items in `item_ids`. Every other item is skipped by the regex scan without being decoded.
+# Item objects are flat, so everything up to the last "}" of a chunk is complete and only the
+# tail after it is carried over into the next one. The top-level "timestamp" of the averaged
+# endpoints (/5m, /1h) is kept as well.
+class FilteredPayloadParser:
+    def __init__(self, item_ids):
+        self._pattern = _item_pattern(frozenset(item_ids))
+        self._buffer = b""
+        self._has_data = False
+        self.data = {}
+        self.size = 0
+        self.timestamp = None
+
+    def feed(self, chunk):
+        self.size += len(chunk)
+        buffer = self._buffer + chunk if self._buffer else chunk
+        self._has_data = self._has_data or b'"data"' in buffer
+        end = buffer.rfind(b"}") + 1
+        for match in self._pattern.finditer(buffer, 0, end):
+            self.data[match.group(1).decode()] = json.loads(match.group(2))
+        if self.timestamp is None:
+            match = _TIMESTAMP.search(buffer, 0, end)
+            if match is not None:
+                self.timestamp = int(match.group(1))
+        self._buffer = buffer[end:]
+
+    # The kept items keyed by id string, like the "data" dict of a full parse
+    def close(self):
+        if not self._has_data:
+            raise ValueError("Error fetching data from API")
+        self._buffer = b""
+        return self.data
+
+
+# Returns the closed parser: its data, payload size in bytes and timestamp
+async def parse_filtered(stream, item_ids, chunk_size=PARSE_CHUNK_SIZE):
+    parser = FilteredPayloadParser(item_ids)
+    async for chunk in stream.iter_chunked(chunk_size):
+        parser.feed(chunk)
+    parser.close()
+    return parser
+
+
+# Which item ids changed between two consecutive snapshots of an endpoint, and for which of
+# them the time of the last high/low trade moved (all as int item ids)
+class PriceDelta:
+    def __init__(self, version, changed, high_moved, low_moved):
+        self.version = version
+        self.changed = changed
+        self.high_moved = high_moved
+        self.low_moved = low_moved
+
+    def touches(self, item_ids):
+        return not self.changed.isdisjoint(item_ids)
+
+
+def diff_snapshots(old, new, version):
+    changed, high_moved, low_moved = diff_tables(old, new)
+    ids = new.index.ids
+    return PriceDelta(
+        version,
+        {ids[row] for row in np.flatnonzero(changed).tolist()},
+        {ids[row] for row in np.flatnonzero(high_moved).tolist()},
+        {ids[row] for row in np.flatnonzero(low_moved).tolist()},
+    )
+
+
+# One fetched payload of an endpoint as a PriceTable, kept together with the time it was fetched.
+# `version` only increases when the data actually changed, `deltas` holds the most recent
+# PriceDelta objects so results derived from an older version can be patched instead of rebuilt.
+# `timestamp` is the start of the period the averaged endpoints cover (None for /latest).
+class PriceSnapshot:
+    def __init__(self, endpoint, table, fetched_at, version=0, deltas=(), etag=None, last_modified=None, timestamp=None):
+        self.endpoint = endpoint
+        self.table = table
+        self.fetched_at = fetched_at
+        self.version = version
+        self.deltas = deltas
+        self.etag = etag
+        self.last_modified = last_modified
+        self.timestamp = timestamp
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+    # Warning to show next to results computed from old prices, empty while the snapshot is fresh
+    def stale_note(self, stale_after=PRICE_STALE_AFTER):
+        if self.age < stale_after:
+            return ""
+        return f"\n:warning: The price API is unreachable, these prices are {int(self.age // 60)} minutes old."
+
+    # Item ids changed since `version`, or None if that version is too old to patch from
+    def changed_since(self, version):
+        if version == self.version:
+            return set()
+        deltas = [delta for delta in self.deltas if delta.version > version]
+        if not deltas or deltas[0].version != version + 1:
+            return None
+        return set().union(*(delta.changed for delta in deltas))
+
+    # Same data confirmed unchanged by the server (HTTP 304)
+    def revalidated(self, fetched_at):
+        return PriceSnapshot(self.endpoint, self.table, fetched_at, self.version, self.deltas, self.etag, self.last_modified, self.timestamp)
+
+
+# Shared, non-blocking price cache used by every command.
+# Holds one pooled HTTP session, caches each endpoint for `ttl` seconds and coalesces
+# concurrent misses so that only one request per endpoint is ever in flight.
+# Refreshes are conditional (ETag / If-Modified-Since) and listeners are called with every new version.
+# With a SnapshotStore attached every new version is persisted, and the last stored one is
+# served (flagged as stale) whenever the wiki API is unreachable.
+# Payloads are streamed through FilteredPayloadParser and only the items in `interest` (the ids
+# registered by data/items.py) end up in the snapshots, except for the endpoints in `full_parse`
+# (a list of endpoints, or True for all of them) which keep every item.
+# `endpoints` limits the store to some of the ENDPOINTS, and a `label` tells its metrics apart
+# from the ones of the commands' store (e.g. "market" for the market-wide snapshots).
+class PriceStore:
+    delta_history = 32
+
+    def __init__(self, headers=HEADERS, ttl=PRICE_TTL, refresh_interval=PRICE_REFRESH_INTERVAL, timeout=PRICE_TIMEOUT,
+                 snapshot_store=None, retry_after=PRICE_RETRY_AFTER, full_parse=PRICE_FULL_PARSE,
+                 interest=item_index.tracked, endpoints=tuple(ENDPOINTS), label=None):
+        self.headers = headers
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self.snapshot_store = snapshot_store
+        self.retry_after = retry_after
+        self.full_parse = full_parse
+        self.interest = interest
+        self.endpoints = endpoints
+        self.label = label
+        self._failed_at = {}
+        self._pruned_at = time.time()
+        self._session = None
+        self._snapshots = {}
+        self._inflight = {}
+        self._refresher = None
+        self._listeners = []
+
+    # Registers `callback(snapshot)`, called after every refresh that produced a new version
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    # Seeds the cache from the snapshot store, call before the first command can arrive
+    async def load_persisted(self):
+        if self.snapshot_store is None:
+            return
+        for endpoint in self.endpoints:
+            if endpoint in self._snapshots:
+                continue
+            stored = await asyncio.to_thread(self.snapshot_store.load_latest, endpoint)
+            if stored is not None:
+                data, fetched_at, etag, last_modified = stored
+                self._snapshots[endpoint] = PriceSnapshot(
+                    endpoint, PriceTable.from_payload(data), fetched_at, etag=etag, last_modified=last_modified)
+                log.info("Loaded %s prices stored %.0fs ago", endpoint, time.time() - fetched_at)
+
+    async def start(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        if self._refresher is None and self.refresh_interval:
+            self._refresher = asyncio.create_task(self._refresh_loop(), name="price-refresher")
+
+    async def close(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+        # background revalidations still running
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    # Returns the cached snapshot for an endpoint. Only the very first request of an endpoint waits
+    # on the network: once there is a snapshot, one older than the TTL is still returned right away
+    # and refreshed in the background (stale-while-revalidate), so no command waits on a fetch.
+    async def get(self, endpoint):
+        if endpoint not in self.endpoints:
+            raise ValueError(f"Unknown price endpoint: {endpoint}")
+        snapshot = self._snapshots.get(endpoint)
+        if snapshot is None:
+            metrics.inc("price_cache_total", endpoint=metric_endpoint(endpoint, self.label), result="miss")
+            return await self.refresh(endpoint)
+        if snapshot.age < self.ttl:
+            metrics.inc("price_cache_total", endpoint=metric_endpoint(endpoint, self.label), result="hit")
+            return snapshot
+        # while the API is known to be down, don't even start a fetch before retry_after has passed
+        if time.time() - self._failed_at.get(endpoint, 0) < self.retry_after:
+            metrics.inc("price_cache_total", endpoint=metric_endpoint(endpoint, self.label), result="stale")
+            return snapshot
+        metrics.inc("price_cache_total", endpoint=metric_endpoint(endpoint, self.label), result="revalidate")
+        self._start_fetch(endpoint).add_done_callback(lambda done: self._revalidated(endpoint, snapshot, done))
+        return snapshot
+
+    def _revalidated(self, endpoint, snapshot, task):
+        if not task.cancelled() and task.exception() is not None:
+            log.warning("Refreshing %s prices failed, serving snapshot from %.0fs ago", endpoint, snapshot.age, exc_info=task.exception())
+
+    # Cached snapshot of an endpoint without fetching, None before the first fetch
+    def peek(self, endpoint):
+        return self._snapshots.get(endpoint)
+
+    # 5m/1h/6h/24h averages of one item as the API's list of dicts (timestamp, avgHighPrice,
+    # avgLowPrice, highPriceVolume, lowPriceVolume), oldest first, up to 365 entries
+    async def timeseries(self, item_id, timestep="5m"):
+        if self._session is None:
+            await self.start()
+        with metrics.timer("price_fetch_seconds", endpoint="timeseries"):
+            async with self._session.get(TIMESERIES_URL, params={"id": item_id, "timestep": timestep}) as response:
+                metrics.inc("price_fetch_total", endpoint="timeseries", status=response.status)
+                response.raise_for_status()
+                payload = await response.json()
+        if "data" not in payload:
+            raise ValueError("Error fetching data from API")
+        return payload["data"]
+
+    # Fetches an endpoint now; callers arriving while a fetch is running share its result
+    async def refresh(self, endpoint):
+        # shield so one cancelled interaction does not cancel the fetch for everybody else
+        return await asyncio.shield(self._start_fetch(endpoint))
+
+    # The running fetch task of an endpoint, started if there is none
+    def _start_fetch(self, endpoint):
+        task = self._inflight.get(endpoint)
+        if task is None:
+            task = asyncio.create_task(self._fetch(endpoint))
+            self._inflight[endpoint] = task
+            task.add_done_callback(lambda done: self._fetch_done(endpoint, done))
+        return task
+
+    def _fetch_done(self, endpoint, task):
+        self._inflight.pop(endpoint, None)
+        if task.cancelled() or task.exception() is not None:
+            error = "CancelledError" if task.cancelled() else type(task.exception()).__name__
+            metrics.inc("price_fetch_errors_total", endpoint=metric_endpoint(endpoint, self.label), error=error)
+            self._failed_at[endpoint] = time.time()
+        else:
+            self._failed_at.pop(endpoint, None)
+
+    async def _fetch(self, endpoint):
+        if self._session is None:
+            await self.start()
+        previous = self._snapshots.get(endpoint)
+        headers = {}
+        if previous is not None:
+            if previous.etag:
+                headers["If-None-Match"] = previous.etag
+            if previous.last_modified:
+                headers["If-Modified-Since"] = previous.last_modified
+        label = metric_endpoint(endpoint, self.label)
+        with metrics.timer("price_fetch_seconds", endpoint=label):
+            async with self._session.get(ENDPOINTS[endpoint], headers=headers) as response:
+                metrics.inc("price_fetch_total", endpoint=label, status=response.status)
+                if response.status == 304 and previous is not None:
+                    snapshot = previous.revalidated(time.time())
+                    self._snapshots[endpoint] = snapshot
+                    return snapshot
+                response.raise_for_status()
+                if self.full_parse is True or endpoint in (self.full_parse or ()) or not self.interest:
+                    body = await response.read()
+                    payload = json.loads(body)
+                    if "data" not in payload:
+                        raise ValueError("Error fetching data from API")
+                    data, size, timestamp = payload["data"], len(body), payload.get("timestamp")
+                else:
+                    parser = await parse_filtered(response.content, self.interest)
+                    data, size, timestamp = parser.data, parser.size, parser.timestamp
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        metrics.inc("price_payload_bytes_total", size, endpoint=label)
+        metrics.set("price_payload_bytes", size, endpoint=label)
+        metrics.set("price_payload_items", len(data), endpoint=label)
+        table = PriceTable.from_payload(data)
+
+        if previous is None:
+            snapshot = PriceSnapshot(endpoint, table, time.time(), etag=etag, last_modified=last_modified, timestamp=timestamp)
+        else:
+            delta = diff_snapshots(previous.table, table, previous.version + 1)
+            if not delta.changed:
+                snapshot = previous.revalidated(time.time())
+                snapshot.etag, snapshot.last_modified = etag, last_modified
+                self._snapshots[endpoint] = snapshot
+                return snapshot
+            deltas = previous.deltas[-(self.delta_history - 1):] + (delta,)
+            snapshot = PriceSnapshot(endpoint, table, time.time(), delta.version, deltas, etag, last_modified, timestamp)
+        self._snapshots[endpoint] = snapshot
+        metrics.set("price_snapshot_version", snapshot.version, endpoint=label)
+        metrics.set("price_table_bytes", table.nbytes, endpoint=label)
+        if self.snapshot_store is not None:
+            try:
+                await asyncio.to_thread(
+                    self.snapshot_store.save, endpoint, data, snapshot.fetched_at, etag, last_modified)
+            except sqlite3.Error:
+                log.exception("Persisting %s prices failed", endpoint)
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception:
+                log.exception("Price listener %r failed", callback)
+        return snapshot
+
+    # Anything a refresh raises is logged and the loop carries on, it must outlive any one failure
+    async def _refresh_loop(self):
+        while True:
+            for endpoint in self.endpoints:
+                try:
+                    await self.refresh(endpoint)
+                except PRICE_ERRORS:
+                    log.warning("Background refresh of %s prices failed", endpoint, exc_info=True)
+                except Exception:
+                    log.exception("Background refresh of %s prices failed", endpoint)
+            try:
+                await self.maintain()
+            except Exception:
+                log.exception("Maintaining the snapshot store failed")
+            await asyncio.sleep(self.refresh_interval)
+
+    # Prunes and compacts the snapshot store at most once per SNAPSHOT_PRUNE_INTERVAL
+    async def maintain(self):
+        if self.snapshot_store is None or time.time() - self._pruned_at <= SNAPSHOT_PRUNE_INTERVAL:
+            return
+        self._pruned_at = time.time()
+        try:
+            removed = await asyncio.to_thread(self.snapshot_store.prune)
+            await asyncio.to_thread(self.snapshot_store.compact)
+            log.info("Pruned %d stored price snapshots", removed)
+        except sqlite3.Error:
+            log.exception("Pruning stored price snapshots failed")
+
+
+# The snapshot a command answers from, or None after telling the user (ephemerally) that there
+# are no prices: the very first fetch failed and there was nothing stored to fall back on
+async def snapshot_for(interaction, prices, endpoint):
+    try:
+        return await prices.get(endpoint)
+    except PRICE_ERRORS:
+        log.warning("No %s prices to answer a command with", endpoint, exc_info=True)
+        await interaction.response.send_message(PRICES_UNAVAILABLE, ephemeral=True)
+        return None
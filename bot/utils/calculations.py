@@ -1,104 +1,304 @@
-from bot.utils.helpers import generate_estimated_yield
-from config.settings import DEBUG
+import math
+
+import numpy as np
+
+from bot.utils.price_table import as_price_table
+from bot.utils.metrics import TRACING, trace
+
+
+COMPOST_LIFE = {'None': 0, 'Compost': 1, 'Supercompost': 2, 'Ultracompost': 3}
+HIGH_CTS = 80
+SIMULATION_PERCENTILES = (10, 50, 90)
+
+
+def _column(values):
+    return values.reshape(-1, 1)
+
+
+def kandarin_bonus(kandarin_diary):
+    if isinstance(kandarin_diary, str):
+        return float(kandarin_diary.split('%')[0]) / 100 if kandarin_diary != 'None' else 0
+    return float(kandarin_diary)
+
+
+# A batch of player setups for calculate_batch_profit, one element per setup in every array.
+# Each argument may be a scalar or a sequence; scalars are broadcast to the other lengths.
+# compost takes the command's names ('Ultracompost', ...) and kandarin_diary its '5%' style values.
+class HerbSetups:
+    def __init__(self, farming_level, patches, weiss, trollheim, hosidius, fortis, compost, kandarin_diary, kourend, magic_secateurs, farming_cape, attas):
+        compost = [COMPOST_LIFE.get(value, 0) for value in np.atleast_1d(compost).tolist()]
+        kandarin = [kandarin_bonus(value) for value in np.atleast_1d(kandarin_diary).tolist()]
+        (self.farming_level, self.patches, self.weiss, self.trollheim, self.hosidius, self.fortis, self.compost_life,
+         self.kandarin_bonus, self.kourend, self.magic_secateurs, self.farming_cape, self.attas) = np.broadcast_arrays(
+            np.asarray(farming_level), np.asarray(patches), np.asarray(weiss, dtype=bool), np.asarray(trollheim, dtype=bool),
+            np.asarray(hosidius, dtype=bool), np.asarray(fortis, dtype=bool), np.asarray(compost), np.asarray(kandarin, dtype=float),
+            np.asarray(kourend, dtype=bool), np.asarray(magic_secateurs, dtype=bool), np.asarray(farming_cape, dtype=bool),
+            np.asarray(attas, dtype=bool))
+        self.kandarin_values, self.kandarin_code = np.unique(self.kandarin_bonus.reshape(-1), return_inverse=True)
+
+    def __len__(self):
+        return self.farming_level.size
+
+
+# 1 - chance_to_save of helpers.generate_estimated_yield, broadcasting over all of its arguments.
+# Operations are kept in the same order so the results are bit-identical to the scalar version.
+def save_denominator_batch(farming_level, low_cts, high_cts, item_bonus, diary_bonus, attas_bonus):
+    low_cts_final = np.floor(low_cts * (1 + item_bonus))
+    low_cts_final = low_cts_final + diary_bonus
+    low_cts_final = np.floor(low_cts_final * (1 + attas_bonus))
+
+    high_cts_final = np.floor(high_cts * (1 + item_bonus))
+    high_cts_final = high_cts_final + diary_bonus
+    high_cts_final = np.floor(high_cts_final * (1 + attas_bonus))
+
+    # skill_interp
+    value = low_cts_final * (99 - farming_level)
+    value /= 98
+    value += (high_cts_final * (farming_level - 1) / 98)
+    value += 1
+    value /= 256
+    chance_to_save = np.clip(value, 0, 1, out=value)
+    return np.subtract(1, chance_to_save, out=chance_to_save)
+
+
+def estimated_yield_batch(farming_level, low_cts, high_cts, harvest_lives, item_bonus, diary_bonus, attas_bonus):
+    return harvest_lives / save_denominator_batch(farming_level, low_cts, high_cts, item_bonus, diary_bonus, attas_bonus)
+
+
+# Only a handful of (item, diary, attas) bonus combinations exist, so the save denominators of
+# every farming level are tabulated once per combination and batches just gather from them.
+# Combination codes are ((item * n_diary) + diary) * 2 + attas, with item = secateurs * 2 + cape
+# and diary = kandarin * 2 + kourend, or n_kandarin * 2 for the Kourend-only protected patch.
+TABLE_LEVELS = 127
+_denominator_tables = {}
+
+
+def _denominator_table(low_cts, kandarin_values):
+    key = (low_cts, kandarin_values)
+    table = _denominator_tables.get(key)
+    if table is None:
+        if len(_denominator_tables) >= 64:  # kandarin_diary is free text, don't let odd values pile up
+            _denominator_tables.clear()
+        item_bonus = np.array([0, 0.05, 0.1, 0.1 + 0.05])
+        diary_bonus = np.array([kandarin + kourend for kandarin in kandarin_values for kourend in (0, 0.05)] + [0.05])
+        attas_bonus = np.array([0, 0.05])
+        table = save_denominator_batch(
+            np.arange(TABLE_LEVELS, dtype=float)[None, None, None, :, None],
+            np.asarray(low_cts, dtype=float)[None, None, None, None, :],
+            HIGH_CTS,
+            item_bonus[:, None, None, None, None],
+            diary_bonus[None, :, None, None, None],
+            attas_bonus[None, None, :, None, None],
+        ).reshape(-1, TABLE_LEVELS, len(low_cts))
+        _denominator_tables[key] = table
+    return table
+
+
+# Disease-free and other patches of every setup, as columns
+def _patch_counts(setups):
+    protected_patches = _column(setups.weiss.astype(int) + setups.trollheim + setups.hosidius + setups.fortis)
+    return _column(setups.patches) - protected_patches, protected_patches
+
+
+# 1 - chance_to_save of the unprotected and the protected patches of every (setup, herb) pair,
+# both of shape (len(setups), len(low_cts))
+def herb_save_denominators(setups, low_cts):
+    low_cts = tuple(low_cts)
+    level = setups.farming_level.reshape(-1)
+    kourend = setups.kourend.reshape(-1)
+
+    if level.dtype.kind in "iu" and level.min(initial=0) >= 0 and level.max(initial=0) < TABLE_LEVELS:
+        table = _denominator_table(low_cts, tuple(setups.kandarin_values.tolist()))
+        n_diary = 2 * len(setups.kandarin_values) + 1
+        item_code = setups.magic_secateurs.reshape(-1) * 2 + setups.farming_cape.reshape(-1)
+        diary_code = setups.kandarin_code * 2 + kourend
+        # disease-free patches don't get the Kourend bonus unless it is the Hosidius patch itself
+        protected_diary_code = np.where(setups.hosidius.reshape(-1) & kourend, n_diary - 1, setups.kandarin_code * 2)
+        attas_code = setups.attas.reshape(-1)
+        rows = table.reshape(-1, len(low_cts))
+        unprotected_denominator = rows.take(((item_code * n_diary + diary_code) * 2 + attas_code) * TABLE_LEVELS + level, axis=0)
+        protected_denominator = rows.take(((item_code * n_diary + protected_diary_code) * 2 + attas_code) * TABLE_LEVELS + level, axis=0)
+    else:
+        item_bonus = _column(np.where(setups.magic_secateurs, 0.1, 0) + np.where(setups.farming_cape, 0.05, 0))
+        kourend_bonus = np.where(setups.kourend, 0.05, 0)
+        diary_bonus = _column(setups.kandarin_bonus + kourend_bonus)
+        protected_bonus = _column(np.where(setups.hosidius & setups.kourend, kourend_bonus, setups.kandarin_bonus))
+        attas_bonus = _column(np.where(setups.attas, 0.05, 0))
+        low = np.asarray(low_cts, dtype=float)[None, :]
+        unprotected_denominator = save_denominator_batch(_column(level), low, HIGH_CTS, item_bonus, diary_bonus, attas_bonus)
+        protected_denominator = save_denominator_batch(_column(level), low, HIGH_CTS, item_bonus, protected_bonus, attas_bonus)
+    return unprotected_denominator, protected_denominator
+
+
+# Expected herbs per run for every (setup, herb) pair, shape (len(setups), len(low_cts))
+def herb_yield_batch(setups, low_cts):
+    unprotected_patches, protected_patches = _patch_counts(setups)
+    harvest_lives = _column(3 + setups.compost_life)
+    unprotected_denominator, protected_denominator = herb_save_denominators(setups, low_cts)
+
+    yield_unprotected = np.divide(harvest_lives, unprotected_denominator, out=unprotected_denominator)
+    yield_protected = np.divide(harvest_lives, protected_denominator, out=protected_denominator)
+
+    # protected yields have always been summed one patch at a time: y+y+y rounds like 3*y,
+    # but a fourth addition does not, so that one is added separately
+    total_protected = yield_protected * np.minimum(protected_patches, 3)
+    np.add(total_protected, yield_protected, out=total_protected, where=protected_patches >= 4)
+    total = yield_unprotected
+    total *= unprotected_patches
+    total += total_protected
+    return total
+
+
+# Herbs per run of one setup in `trials` simulated runs, shape (trials, len(low_cts)). Every harvest
+# keeps the patch's life with the chance to save of herb_yield_batch, so a patch with L lives yields
+# L + NB(L, 1 - chance_to_save) herbs: L lost lives plus the saves before the last one. Patches that
+# share a save chance are independent, so their sum is drawn as one NB with all their lives, which
+# has the same distribution as drawing each patch and is what keeps 100k runs well under a second.
+def simulate_herb_yields(setups, low_cts, trials, rng=None):
+    rng = np.random.default_rng() if rng is None else rng
+    unprotected_patches, protected_patches = _patch_counts(setups)
+    harvest_lives = 3 + int(setups.compost_life.reshape(-1)[0])
+    if unprotected_patches[0, 0] < 0:
+        raise ValueError("patches is less than the number of disease-free patches")
+    unprotected_denominator, protected_denominator = herb_save_denominators(setups, low_cts)
+    yields = np.zeros((trials, len(low_cts)), dtype=np.int64)
+    for patches, denominator in ((int(unprotected_patches[0, 0]), unprotected_denominator[0]), (int(protected_patches[0, 0]), protected_denominator[0])):
+        if patches > 0:
+            lives = patches * harvest_lives
+            yields += lives + rng.negative_binomial(lives, denominator, size=yields.shape)
+    return yields
+
+
+# p10/p50/p90 of herbs and of profit per run for one setup, keyed by the herbs with both prices.
+# Profit rises linearly with the yield, so its percentiles are those of the yield priced up.
+def simulate_herb_profit(prices, herbs, setups, price_key, trials, rng=None):
+    seed_prices, herb_prices = herb_price_arrays(prices, herbs, price_key)
+    priced = ~(np.isnan(seed_prices) | np.isnan(herb_prices))
+    names = [name for name, present in zip(herbs, priced.tolist()) if present]
+    if not names:
+        return {}
+    yields = simulate_herb_yields(setups, [info["lowCTS"] for info, present in zip(herbs.values(), priced.tolist()) if present], trials, rng)
+    yield_percentiles = np.percentile(yields, SIMULATION_PERCENTILES, axis=0)
+    profit_percentiles = herb_prices[priced] * yield_percentiles - seed_prices[priced] * float(setups.patches.reshape(-1)[0])
+    results = {}
+    for position, name in enumerate(names):
+        results[name] = {"Yield": tuple(yield_percentiles[:, position].tolist())}
+        for percentile, profit in zip(SIMULATION_PERCENTILES, profit_percentiles[:, position].tolist()):
+            results[name][f"Profit p{percentile}"] = profit
+    return results
+
+
+# Seed/herb prices of every herb, NaN where the API has no price
+def herb_price_arrays(prices, herbs, price_key):
+    prices = as_price_table(prices)
+    seed_prices, seed_present = prices.gather(price_key, [info["seed_idx"] for info in herbs.values()])
+    herb_prices, herb_present = prices.gather(price_key, [info["herb_idx"] for info in herbs.values()])
+    seed_prices = np.where(seed_present, seed_prices, np.nan)
+    herb_prices = np.where(herb_present, herb_prices, np.nan)
+    return seed_prices, herb_prices
+
+
+# Profit per run of every herb for every setup in one vectorised pass.
+# Returns an array of shape (len(setups), len(herbs)), NaN for herbs without a price.
+def calculate_batch_profit(prices, herbs, setups, price_key):
+    seed_prices, herb_prices = herb_price_arrays(prices, herbs, price_key)
+    return herb_profit_batch(seed_prices, herb_prices, herbs, setups)
+
+
+def herb_profit_batch(seed_prices, herb_prices, herbs, setups):
+    total_yield = herb_yield_batch(setups, [info["lowCTS"] for info in herbs.values()])
+    return (herb_prices * total_yield) - (seed_prices * _column(setups.patches))
 
 
 # Calculate profit based on user inputs and real-time prices
 def calculate_custom_profit(prices, herbs, farming_level, patches, weiss, trollheim, hosidius, fortis, compost, kandarin_diary, kourend, magic_secateurs, farming_cape, bottomless_bucket, attas, price_key):
-    # Constants and multipliers
-    compost_life_value = {'None': 0, 'Compost': 1, 'Supercompost': 2, 'Ultracompost': 3}
-    item_bonus = 0.1 if magic_secateurs else 0
-    item_bonus += 0.05 if farming_cape else 0
-    kandarin_bonus = float(kandarin_diary.split('%')[0]) / 100 if kandarin_diary != 'None' else 0
-    kourend_bonus = 0.05 if kourend else 0
-    diary_bonus = kandarin_bonus + kourend_bonus
-    compost_life = compost_life_value.get(compost, 0)
-    attas_bonus = 0.05 if attas else 0  # Assuming animaType can be checked similarly
-
     # Disease removed since we do not resurrect crops
-
-    # Adjust patches based on disease-free options
-    protected_patches = 0
-    protected_names = []
-    if weiss:
-        protected_patches += 1
-        protected_names.append('Weiss')
-    if trollheim:
-        protected_patches += 1
-        protected_names.append('Trollheim')
-    if hosidius:
-        protected_patches += 1
-        protected_names.append('Hosidius')
-    if fortis:
-        protected_patches += 1
-        protected_names.append('Civitas illa Fortis')
-
-    unprotected_patches = patches - protected_patches
+    setups = HerbSetups(farming_level, patches, weiss, trollheim, hosidius, fortis, compost, kandarin_diary, kourend, magic_secateurs, farming_cape, attas)
+    seed_prices, herb_prices = herb_price_arrays(prices, herbs, price_key)
+    profits = herb_profit_batch(seed_prices, herb_prices, herbs, setups)[0]
 
     results = []
-    for herb, info in herbs.items():
-        seed_id_str = str(info["seed_id"])
-        herb_id_str = str(info["herb_id"])
-        low_cts = info["lowCTS"]
-        high_cts = 80
-        harvest_lives = 3 + compost_life
-
-        if seed_id_str not in prices or herb_id_str not in prices:
-            continue
+    for herb, seed_price, herb_price, profit_per_run in zip(herbs, seed_prices.tolist(), herb_prices.tolist(), profits.tolist()):
+        if TRACING:
+            trace("herb_profit.row", price_key=price_key, herb=herb, seed_price=seed_price, herb_price=herb_price, profit=profit_per_run)
 
-        seed_price = prices[seed_id_str][price_key]
-        herb_price = prices[herb_id_str][price_key]
-        
-        if DEBUG:
-            print(f"price type: {price_key}\n")
-            print(f"Herb: {herb}, Seed Price: {seed_price}, Herb Price: {herb_price}")
-            
-        if seed_price is None or herb_price is None:
+        if math.isnan(seed_price) or math.isnan(herb_price):
             continue
 
-        # Calculate expected yield using detailed mechanics
-        expected_yield_unprotected = generate_estimated_yield(
-            farming_level, low_cts, high_cts, harvest_lives, item_bonus, diary_bonus, attas_bonus)
-
-        # Calculate total yield and profit for unprotected patches
-        total_yield_unprotected = expected_yield_unprotected * unprotected_patches
-        
-        # Calculate expected yield for protected patches
-        total_yield_protected = 0
-        if protected_patches > 0:
-            for _ in range(protected_patches):
-                if "Hosidius" in protected_names and kourend:
-                    expected_yield_protected = generate_estimated_yield(
-                        farming_level, low_cts, high_cts, harvest_lives, item_bonus, kourend_bonus, attas_bonus)
-                else:  # change logic to check for kandarin patches (Catherby)
-                    expected_yield_protected = generate_estimated_yield(
-                        farming_level, low_cts, high_cts, harvest_lives, item_bonus, kandarin_bonus, attas_bonus)
-                total_yield_protected += expected_yield_protected
-        
-        total_patches = unprotected_patches + protected_patches
-        
-        total_yield = total_yield_unprotected + total_yield_protected
-        profit_per_run = (herb_price * total_yield) - (seed_price * total_patches)
-
-        # Debug print statements
-        if DEBUG:
-            print(f"Herb: {herb}")
-            print(f"Seed Price: {seed_price}")
-            print(f"Herb Price: {herb_price}")
-            print(f"CTSLow: {low_cts}")
-            print(f"Expected Yield (Unprotected): {expected_yield_unprotected}")
-            print(f"Expected Yield (Protected): {expected_yield_protected}")
-            print(f"Total Yield (Unprotected): {total_yield_unprotected}")
-            print(f"Total Yield (Protected): {total_yield_protected}")
-            print(f"Total Yield: {total_yield}")
-            print(f"Total Patches: {total_patches}")
-            print(f"Profit per Run: {profit_per_run}")
-            print("-" * 40)
-
         results.append({
             "Herb": herb,
-            "Seed Price": seed_price,
-            "Grimy Herb Price": herb_price,
+            "Seed Price": int(seed_price),
+            "Grimy Herb Price": int(herb_price),
             "Profit per Run": profit_per_run
         })
 
     return results
+
+
+# Searches compost, Attas and herb choices on top of a player's fixed unlocks and returns the
+# top_k (herb, compost, Attas) combinations by profit per run after paying for compost.
+# Owned secateurs/cape only ever raise the save chance, so they are always used rather than searched.
+def optimize_herb_setup(prices, herbs, composts, farming_level, patches, weiss, trollheim, hosidius, fortis, kandarin_diary, kourend, magic_secateurs, farming_cape, attas, price_key, top_k=5):
+    if patches < weiss + trollheim + hosidius + fortis:
+        raise ValueError("patches is less than the number of disease-free patches")
+    prices = as_price_table(prices)
+    compost_options = [("None", 0)]
+    for name, info in composts.items():
+        cost, present = prices.gather(price_key, [info["item_idx"]])
+        if present[0]:
+            compost_options.append((name, cost[0].item()))
+    attas_options = [False, True] if attas else [False]
+    choices = [(name, cost, planted) for name, cost in compost_options for planted in attas_options]
+
+    setups = HerbSetups(
+        farming_level, patches, weiss, trollheim, hosidius, fortis, [choice[0] for choice in choices], kandarin_diary,
+        kourend, magic_secateurs, farming_cape, [choice[2] for choice in choices])
+    seed_prices, herb_prices = herb_price_arrays(prices, herbs, price_key)
+    profits = herb_profit_batch(seed_prices, herb_prices, herbs, setups)
+    profits -= _column(np.array([choice[1] for choice in choices], dtype=float)) * patches
+
+    flat = np.where(np.isnan(profits), -np.inf, profits).reshape(-1)
+    top_k = min(top_k, int(np.isfinite(flat).sum()))
+    if top_k <= 0:
+        return []
+    best = np.argpartition(-flat, top_k - 1)[:top_k]
+    best = best[np.argsort(-flat[best], kind="stable")]
+
+    names = list(herbs)
+    results = []
+    for position in best.tolist():
+        choice, herb = divmod(position, len(names))
+        compost_name, compost_cost, planted = choices[choice]
+        results.append({
+            "Herb": names[herb],
+            "Compost": compost_name,
+            "Attas": planted,
+            "Compost Cost": compost_cost * patches,
+            "Profit per Run": flat[position].item()
+        })
+    return results
+
+
+# Calculate cooking profit for every raw/cooked fish pair
+def calculate_fish_profit(prices, fish, price_key, cooking_rate=1435):
+    prices = as_price_table(prices)
+    raw_prices, raw_present = prices.gather(price_key, [info["raw_idx"] for info in fish.values()])
+    cooked_prices, cooked_present = prices.gather(price_key, [info["cooked_idx"] for info in fish.values()])
+    # missing prices count as 0, which the check below skips just like the API's nulls
+    raw_prices = (raw_prices * raw_present).tolist()
+    cooked_prices = (cooked_prices * cooked_present).tolist()
+
+    results = []
+    for (fish_name, info), raw_price, cooked_price in zip(fish.items(), raw_prices, cooked_prices):
+        if raw_price and cooked_price:
+            profit_fish = cooked_price - raw_price
+            results.append({
+                "Fish": fish_name,
+                "Raw Price": raw_price,
+                "Cooked Price": cooked_price,
+                "Profit": profit_fish,
+                "XP/hr": cooking_rate * info["xp_each"],
+                "GP/hr": cooking_rate * profit_fish
+            })
+
+    return results
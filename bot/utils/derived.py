@@ -0,0 +1,72 @@
+from bot.utils.cache import LRUCache
+from bot.utils.calculations import COMPOST_LIFE, calculate_custom_profit, kandarin_bonus
+from bot.utils.metrics import metrics
+from data.items import herbs
+
+
+# Per-item results derived from a few prices of a snapshot (one row per herb).
+# Rows live in an LRU cache keyed by (endpoint, price_key, normalized args); a lookup against
+# the snapshot version they were computed from is a plain hit, a lookup against a newer one
+# recomputes only the items whose input ids show up in the deltas since then ("patched").
+class DerivedTable:
+    def __init__(self, items, inputs, compute, key_field, normalize=None, cache=None):
+        self.items = items
+        self.inputs = {name: set(inputs(info)) for name, info in items.items()}
+        self.compute = compute
+        self.key_field = key_field
+        self.normalize = normalize
+        self.cache = cache if cache is not None else LRUCache()
+        self.patched = 0
+
+    def rows(self, snapshot, price_key, *args):
+        if self.normalize is not None:
+            args = self.normalize(*args)
+        key = (snapshot.endpoint, price_key) + tuple(args)
+        cached = self.cache.get(key)
+        if cached is not None and cached[0] == snapshot.version:
+            return cached[2]
+
+        changed = snapshot.changed_since(cached[0]) if cached is not None else None
+        if changed is None:
+            by_name = {}
+            stale = self.items
+        else:
+            self.patched += 1
+            by_name = {name: row for name, row in cached[1].items() if self.inputs[name].isdisjoint(changed)}
+            stale = {name: info for name, info in self.items.items() if not self.inputs[name].isdisjoint(changed)}
+        if stale:
+            for row in self.compute(snapshot.table, stale, price_key, *args):
+                by_name[row[self.key_field]] = row
+
+        ordered = [by_name[name] for name in self.items if name in by_name]
+        self.cache.put(key, (snapshot.version, by_name, ordered))
+        return ordered
+
+    # PriceStore listener: drops entries of the refreshed endpoint that are too old to be patched
+    def on_snapshot(self, snapshot):
+        for key in self.cache:
+            cached = self.cache.peek(key)
+            if key[0] == snapshot.endpoint and cached is not None and snapshot.changed_since(cached[0]) is None:
+                self.cache.pop(key)
+
+    @property
+    def stats(self):
+        return dict(self.cache.stats, patched=self.patched)
+
+
+# Canonical /herb_profit parameters, so equivalent requests share one cache entry
+# (e.g. "15%" and "15", or runs that only differ by the bottomless bucket, which doesn't change yields)
+def _herb_params(farming_level, patches, weiss, trollheim, hosidius, fortis, compost, kandarin_diary, kourend, magic_secateurs, farming_cape, bottomless_bucket, attas):
+    return (
+        int(farming_level), int(patches), bool(weiss), bool(trollheim), bool(hosidius), bool(fortis),
+        compost if compost in COMPOST_LIFE else 'None', float(kandarin_bonus(kandarin_diary)), bool(kourend),
+        bool(magic_secateurs), bool(farming_cape), False, bool(attas),
+    )
+
+
+def _herb_rows(prices, items, price_key, *setup):
+    return calculate_custom_profit(prices, items, *setup, price_key)
+
+
+herb_results = DerivedTable(herbs, lambda info: (info["seed_id"], info["herb_id"]), _herb_rows, "Herb", normalize=_herb_params)
+metrics.register_cache("herb_results", herb_results.cache)
@@ -0,0 +1,253 @@
+import asyncio
+import logging
+
+import aiohttp
+import numpy as np
+import data.items  # noqa: F401 - registers the tracked items before the history is laid out
+from bot.utils.metrics import metrics
+from config.settings import HISTORY_BACKFILL_DELAY, HISTORY_WINDOW
+from data.item_index import item_index
+
+log = logging.getLogger(__name__)
+
+STEP = 300  # seconds per /5m sample
+
+
+# Volume-weighted price and total volume of one period from the averaged endpoints' fields,
+# NaN price where nothing traded
+def period_prices(high, high_present, high_volume, low, low_present, low_volume):
+    high_volume = np.where(high_present, high_volume, 0).astype(np.float64)
+    low_volume = np.where(low_present, low_volume, 0).astype(np.float64)
+    volume = high_volume + low_volume
+    value = np.where(high_present, high, 0) * high_volume + np.where(low_present, low, 0) * low_volume
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(volume > 0, value / volume, np.nan), volume
+
+
+# Last `window` 5-minute prices of the tracked items in preallocated ring buffers, one row per item.
+# Rolling count/mean/variance (sliding Welford) and volume-weighted sums are updated in O(1) per
+# item and sample, rolling min/max use the van Herk/Gil-Werman split: a running min/max of the
+# current block of `window` samples plus suffix minima/maxima of the previous block, computed
+# once per block. Everything is also recomputed exactly once per block to stop float drift.
+class PriceHistory:
+    def __init__(self, item_ids, window=HISTORY_WINDOW):
+        self.item_ids = list(item_ids)
+        self.rows = {item_id: row for row, item_id in enumerate(self.item_ids)}
+        self.table_rows = np.array([item_index.resolve(item_id) for item_id in self.item_ids], dtype=np.intp)
+        self.window = window
+        size = len(self.item_ids)
+        self.prices = np.full((size, window), np.nan)
+        self.volumes = np.zeros((size, window))
+        self.times = np.zeros(window, dtype=np.int64)
+        self.samples = 0
+        self.last_time = 0
+        self.version = 0
+        self._reset_stats()
+
+    def _reset_stats(self):
+        size = len(self.item_ids)
+        self.count = np.zeros(size)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.value = np.zeros(size)
+        self.volume = np.zeros(size)
+        self._block_min = np.full(size, np.nan)
+        self._block_max = np.full(size, np.nan)
+        self._suffix_min = np.full((size, self.window), np.nan)
+        self._suffix_max = np.full((size, self.window), np.nan)
+        # sample numbers (not ring slots) of each item's last trade and of a trade at or before its
+        # first one in the window, which summary() moves forward as old samples drop out
+        self._last_traded = np.full(size, -1, dtype=np.int64)
+        self._first_traded = np.zeros(size, dtype=np.int64)
+
+    def append(self, timestamp, prices, volumes):
+        position = self.samples % self.window
+        if self.samples >= self.window:
+            self._remove(self.prices[:, position].copy(), self.volumes[:, position].copy())
+        self._add(prices, volumes)
+        self.prices[:, position] = prices
+        self.volumes[:, position] = volumes
+        self.times[position] = timestamp
+        self._block_min = np.fmin(self._block_min, prices)
+        self._block_max = np.fmax(self._block_max, prices)
+        self._last_traded[~np.isnan(prices)] = self.samples
+        self.samples += 1
+        self.last_time = timestamp
+        self.version += 1
+        if position == self.window - 1:
+            self._close_block()
+        metrics.set("price_history_samples", min(self.samples, self.window))
+
+    def _add(self, prices, volumes):
+        valid = ~np.isnan(prices)
+        values = np.where(valid, prices, self.mean)
+        delta = values - self.mean
+        self.count += valid
+        self.mean += delta / np.maximum(self.count, 1)
+        self.m2 += delta * (values - self.mean)
+        self.value += np.where(valid, values * volumes, 0)
+        self.volume += np.where(valid, volumes, 0)
+
+    def _remove(self, prices, volumes):
+        valid = ~np.isnan(prices)
+        values = np.where(valid, prices, self.mean)
+        delta = values - self.mean
+        self.count -= valid
+        left = self.count > 0
+        self.mean = np.where(left, self.mean - delta / np.maximum(self.count, 1), 0)
+        self.m2 = np.where(left, np.maximum(self.m2 - delta * (values - self.mean), 0), 0)
+        self.value -= np.where(valid, values * volumes, 0)
+        self.volume -= np.where(valid, volumes, 0)
+
+    # The ring now holds exactly one block: keep its suffix minima/maxima for the next block and
+    # recompute the running sums from scratch
+    def _close_block(self):
+        self._suffix_min = np.fmin.accumulate(self.prices[:, ::-1], axis=1)[:, ::-1]
+        self._suffix_max = np.fmax.accumulate(self.prices[:, ::-1], axis=1)[:, ::-1]
+        self._block_min[:] = np.nan
+        self._block_max[:] = np.nan
+        valid = ~np.isnan(self.prices)
+        self.count = valid.sum(axis=1).astype(np.float64)
+        filled = np.where(valid, self.prices, 0)
+        self.mean = filled.sum(axis=1) / np.maximum(self.count, 1)
+        self.m2 = (np.where(valid, self.prices - self.mean[:, None], 0) ** 2).sum(axis=1)
+        self.value = (filled * self.volumes).sum(axis=1)
+        self.volume = np.where(valid, self.volumes, 0).sum(axis=1)
+
+    # Rolling min/max over the window: this block's samples so far plus the rest of the last block
+    @property
+    def minimum(self):
+        return np.fmin(self._block_min, self._suffix_min[:, self.samples % self.window])
+
+    @property
+    def maximum(self):
+        return np.fmax(self._block_max, self._suffix_max[:, self.samples % self.window])
+
+    @property
+    def std(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+
+    # Standard deviation relative to the mean price, NaN without enough samples
+    @property
+    def volatility(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.mean > 0, self.std / self.mean, np.nan)
+
+    @property
+    def vwap(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.volume > 0, self.value / self.volume, np.nan)
+
+    # Rolling stats of one item as plain values (None where unknown), or None for untracked items.
+    # Reads only the item's own running state and ring slots, so it costs O(1) amortized.
+    def summary(self, item_id):
+        row = self.rows.get(item_id)
+        if row is None:
+            return None
+        count, mean = self.count[row], self.mean[row]
+        std = np.sqrt(self.m2[row] / (count - 1)) if count > 1 else np.nan
+        slot = self.samples % self.window
+        # first and last periods in the window the item actually traded in
+        first = last = np.nan
+        oldest = max(self.samples - self.window, 0)
+        if self._last_traded[row] >= oldest:
+            first_traded = max(int(self._first_traded[row]), oldest)
+            while np.isnan(self.prices[row, first_traded % self.window]):
+                first_traded += 1
+            self._first_traded[row] = first_traded
+            first = self.prices[row, first_traded % self.window]
+            last = self.prices[row, self._last_traded[row] % self.window]
+        values = {
+            "samples": int(count),
+            "hours": min(self.samples, self.window) * STEP / 3600,
+            "last": last,
+            "mean": mean if count else np.nan,
+            "std": std,
+            "volatility": std / mean if mean > 0 else np.nan,
+            "min": np.fmin(self._block_min[row], self._suffix_min[row, slot]),
+            "max": np.fmax(self._block_max[row], self._suffix_max[row, slot]),
+            "vwap": self.value[row] / self.volume[row] if self.volume[row] > 0 else np.nan,
+            "change": (last - first) / first if first > 0 else np.nan,
+        }
+        return {name: (None if np.isnan(value) else float(value)) if isinstance(value, float) else value for name, value in values.items()}
+
+    def volatility_of(self, item_id):
+        row = self.rows.get(item_id)
+        if row is None or np.isnan(self.volatility[row]):
+            return None
+        return float(self.volatility[row])
+
+    # PriceStore listener: every new /5m version is one sample
+    def on_snapshot(self, snapshot):
+        if snapshot.endpoint != "5m":
+            return
+        timestamp = snapshot.timestamp or int(snapshot.fetched_at // STEP * STEP)
+        if timestamp <= self.last_time:
+            return
+        table = snapshot.table
+        prices, volumes = period_prices(
+            *table.gather("avgHighPrice", self.table_rows), table.gather("highPriceVolume", self.table_rows)[0],
+            *table.gather("avgLowPrice", self.table_rows), table.gather("lowPriceVolume", self.table_rows)[0])
+        self.append(timestamp, prices, volumes)
+
+    # Samples in the ring oldest first, as (times, prices, volumes)
+    def ordered(self):
+        filled = min(self.samples, self.window)
+        order = (np.arange(filled) + (self.samples - filled)) % self.window
+        return self.times[order], self.prices[:, order], self.volumes[:, order]
+
+    # Rebuilds the history from older samples (e.g. /timeseries), keeping live samples newer than them
+    def load(self, times, prices, volumes):
+        live_times, live_prices, live_volumes = self.ordered()
+        newer = live_times > (times[-1] if len(times) else 0)
+        times = np.concatenate([times, live_times[newer]])[-self.window:]
+        prices = np.concatenate([prices, live_prices[:, newer]], axis=1)[:, -self.window:]
+        volumes = np.concatenate([volumes, live_volumes[:, newer]], axis=1)[:, -self.window:]
+        self.prices[:] = np.nan
+        self.volumes[:] = 0
+        self.samples = 0
+        self.last_time = 0
+        self._reset_stats()
+        for column, timestamp in enumerate(times.tolist()):
+            self.append(timestamp, prices[:, column], volumes[:, column])
+
+    # Fills the history from the /timeseries endpoint, one tracked item at a time and `delay`
+    # seconds apart to stay polite to the API. Items that fail are left empty until live samples arrive.
+    async def backfill(self, store, delay=HISTORY_BACKFILL_DELAY):
+        series = {}
+        for item_id in self.item_ids:
+            try:
+                series[item_id] = await store.timeseries(item_id, "5m")
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                log.warning("Fetching the price history of item %d failed", item_id, exc_info=True)
+            await asyncio.sleep(delay)
+        times = sorted({entry["timestamp"] for entries in series.values() for entry in entries})[-self.window:]
+        if not times:
+            return
+        columns = {timestamp: column for column, timestamp in enumerate(times)}
+        fields = {name: np.zeros((len(self.item_ids), len(times))) for name in ("avgHighPrice", "highPriceVolume", "avgLowPrice", "lowPriceVolume")}
+        present = {name: np.zeros((len(self.item_ids), len(times)), dtype=bool) for name in ("avgHighPrice", "avgLowPrice")}
+        for item_id, entries in series.items():
+            row = self.rows[item_id]
+            for entry in entries:
+                column = columns.get(entry["timestamp"])
+                if column is None:
+                    continue
+                for name, values in fields.items():
+                    if entry.get(name) is not None:
+                        values[row, column] = entry[name]
+                        if name in present:
+                            present[name][row, column] = True
+        prices, volumes = period_prices(
+            fields["avgHighPrice"], present["avgHighPrice"], fields["highPriceVolume"],
+            fields["avgLowPrice"], present["avgLowPrice"], fields["lowPriceVolume"])
+        self.load(np.array(times, dtype=np.int64), prices, volumes)
+        log.info("Loaded %d price history samples for %d items", len(times), len(series))
+
+
+def format_volatility(value):
+    return "n/a" if value is None else f"{value:.1%}"
+
+
+price_history = PriceHistory(sorted(item_index.tracked))
@@ -0,0 +1,208 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
+import time
+
+import aiohttp
+import numpy as np
+from bot.utils.api import fetch_mapping
+from bot.utils.cache import LRUCache
+from bot.utils.metrics import metrics
+from config.settings import MARGINS_MAPPING_MAX_AGE, MARGINS_MAPPING_PATH, MARGINS_MAX_PRICE_AGE
+
+log = logging.getLogger(__name__)
+
+# Grand Exchange tax on the sell side: 2% rounded down, at most 5M per item, nothing below 50gp
+GE_TAX_RATE = 0.02
+GE_TAX_CAP = 5_000_000
+GE_TAX_FREE_BELOW = 50
+
+# Fields /top_margins can rank by
+SORTS = ("margin", "roi", "limit_profit")
+DEFAULT_COUNT = 10
+DEFAULT_MIN_VOLUME = 100
+
+
+def ge_tax(sell_prices):
+    tax = np.minimum(np.floor(sell_prices * GE_TAX_RATE), GE_TAX_CAP)
+    return np.where(sell_prices < GE_TAX_FREE_BELOW, 0, tax)
+
+
+# Local copy of /mapping as (entries, modified time), None when there is none
+def read_mapping(path):
+    try:
+        with open(path, "r") as file:
+            return json.load(file), os.path.getmtime(path)
+    except (OSError, ValueError):
+        return None
+
+
+def write_mapping(path, entries):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as file:
+        json.dump(entries, file, separators=(",", ":"))
+    os.replace(temporary, path)
+
+
+# The item mapping as (entries, time of the copy), from the local copy while it is younger than
+# `max_age` and otherwise fetched again and saved (when `fetch` is set). Falls back to an old
+# copy if the API is unreachable, None when there is nothing at all.
+async def load_mapping(path=MARGINS_MAPPING_PATH, max_age=MARGINS_MAPPING_MAX_AGE, fetch=True):
+    cached = await asyncio.to_thread(read_mapping, path)
+    if cached is not None and (not fetch or time.time() - cached[1] < max_age):
+        return cached
+    if fetch:
+        try:
+            entries = await fetch_mapping()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            log.warning("Fetching the item mapping failed", exc_info=True)
+        else:
+            try:
+                await asyncio.to_thread(write_mapping, path, entries)
+            except OSError:
+                log.warning("Saving the item mapping to %s failed", path, exc_info=True)
+            return entries, time.time()
+    return cached
+
+
+# Flip margins of every item with a fresh instant buy and sell price in one snapshot: buy at the
+# low (instant sell) price, sell at the high price and pay GE tax on the sale. One element per
+# candidate in every array, with the last hour's traded volume and the 4-hour buy limit (0 when unknown).
+class MarginTable:
+    def __init__(self, version, item_ids, buy, sell, volume, limit, names):
+        self.version = version
+        self.item_ids = item_ids
+        self.buy = buy
+        self.sell = sell
+        self.tax = ge_tax(sell)
+        self.margin = sell - buy - self.tax
+        self.volume = volume
+        self.limit = limit
+        self.names = names
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.roi = np.where(buy > 0, self.margin / buy, np.nan)
+        self.limit_profit = np.where(limit > 0, self.margin * limit, np.nan)
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    # The `count` best candidates by `sort` passing the filters: one vectorized mask, then a
+    # bounded heap over the survivors instead of sorting them all
+    def top(self, sort, count, min_volume=0, min_limit=0):
+        key = getattr(self, sort)
+        mask = (self.margin > 0) & (self.volume >= min_volume) & (self.limit >= min_limit) & np.isfinite(key)
+        positions = np.flatnonzero(mask)
+        best = heapq.nlargest(count, zip(key[positions].tolist(), positions.tolist()))
+        return [self.row(position) for _, position in best]
+
+    def row(self, position):
+        item_id = int(self.item_ids[position])
+        return {
+            "Item": self.names.get(item_id, str(item_id)),
+            "Buy": int(self.buy[position]),
+            "Sell": int(self.sell[position]),
+            "Tax": int(self.tax[position]),
+            "Margin": int(self.margin[position]),
+            "ROI": float(self.roi[position]),
+            "Volume": int(self.volume[position]),
+            "Limit": int(self.limit[position]) or None,
+            "Limit Profit": None if np.isnan(self.limit_profit[position]) else int(self.limit_profit[position]),
+        }
+
+
+# Rebuilds the MarginTable whenever a new /latest or /1h version arrives (a PriceStore listener),
+# and answers the default query of every sort right away, so /top_margins only reads results.
+# Other filter combinations are computed on first use and cached until the next rebuild.
+class MarginScanner:
+    def __init__(self, max_price_age=MARGINS_MAX_PRICE_AGE):
+        self.max_price_age = max_price_age
+        self.snapshots = {}
+        self.names = {}
+        self.mapping_ids = np.zeros(0, dtype=np.int64)
+        self.mapping_limits = np.zeros(0)
+        self.mapping_version = 0
+        self.table = None
+        self.results = LRUCache(maxsize=64)
+        metrics.register_cache("margin_results", self.results)
+
+    def set_mapping(self, entries):
+        entries = sorted(entries, key=lambda entry: entry["id"])
+        self.names = {entry["id"]: entry["name"] for entry in entries}
+        self.mapping_ids = np.array([entry["id"] for entry in entries], dtype=np.int64)
+        self.mapping_limits = np.array([entry.get("limit") or 0 for entry in entries], dtype=float)
+        self.mapping_version += 1
+        self.rebuild()
+
+    # PriceStore listener
+    def on_snapshot(self, snapshot):
+        if snapshot.endpoint in ("latest", "1h"):
+            self.snapshots[snapshot.endpoint] = snapshot
+            self.rebuild()
+
+    def rebuild(self):
+        latest = self.snapshots.get("latest")
+        if latest is None:
+            return
+        with metrics.timer("margin_scan_seconds"):
+            table = latest.table
+            fields = ("high", "low", "highTime", "lowTime")
+            if not all(field in table.columns for field in fields):
+                return
+            fresh = table.present["high"] & table.present["low"] & table.present["highTime"] & table.present["lowTime"]
+            if not fresh.any():
+                return
+            # ages are relative to the newest trade in the snapshot rather than the local clock
+            newest = max(table.columns["highTime"][fresh].max(), table.columns["lowTime"][fresh].max())
+            oldest = newest - self.max_price_age
+            fresh &= (table.columns["highTime"] >= oldest) & (table.columns["lowTime"] >= oldest)
+            rows = np.flatnonzero(fresh)
+            item_ids = table.item_ids[rows]
+
+            volume = np.zeros(len(rows))
+            hourly = self.snapshots.get("1h")
+            if hourly is not None:
+                for field in ("highPriceVolume", "lowPriceVolume"):
+                    values, present = hourly.table.gather(field, rows)
+                    volume += np.where(present, values, 0)
+
+            limit = np.zeros(len(rows))
+            if len(self.mapping_ids):
+                found = np.minimum(np.searchsorted(self.mapping_ids, item_ids), len(self.mapping_ids) - 1)
+                limit = np.where(self.mapping_ids[found] == item_ids, self.mapping_limits[found], 0)
+
+            version = (latest.version, hourly.version if hourly is not None else None, self.mapping_version)
+            self.table = MarginTable(
+                version, item_ids, table.columns["low"][rows].astype(float), table.columns["high"][rows].astype(float),
+                volume, limit, self.names)
+            for sort in SORTS:
+                self.top(sort)
+        metrics.set("margin_candidates", len(self.table))
+
+    # Cached top-k of the current table, None before the first /latest snapshot
+    def top(self, sort="margin", count=DEFAULT_COUNT, min_volume=DEFAULT_MIN_VOLUME, min_limit=0):
+        table = self.table
+        if table is None:
+            return None
+        key = (table.version, sort, count, min_volume, min_limit)
+        rows = self.results.get(key)
+        if rows is None:
+            rows = table.top(sort, count, min_volume, min_limit)
+            self.results.put(key, rows)
+        return rows
+
+    # Keeps the item names and buy limits current. Shard processes pass fetch=False and only
+    # reread the copy the price fetcher process saves.
+    async def keep_mapping(self, fetch=True, interval=600):
+        loaded_at = None
+        while True:
+            mapping = await load_mapping(fetch=fetch)
+            if mapping is not None and mapping[1] != loaded_at:
+                entries, loaded_at = mapping
+                self.set_mapping(entries)
+            await asyncio.sleep(interval if mapping is not None else 30)
+
+
+margin_scanner = MarginScanner()
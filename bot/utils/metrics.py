@@ -0,0 +1,256 @@
+import asyncio
+import bisect
+import functools
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+
+from config.settings import DEBUG, METRICS_TRACE_SAMPLE_RATE
+
+log = logging.getLogger(__name__)
+trace_log = logging.getLogger("bot.trace")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Trace events replace the old DEBUG prints. Guard call sites with `if TRACING:` so that with
+# tracing off (the default) not even the event's fields get built; debug: true traces everything.
+TRACE_SAMPLE_RATE = 1.0 if DEBUG else METRICS_TRACE_SAMPLE_RATE
+TRACING = TRACE_SAMPLE_RATE > 0
+
+
+def trace(event, **fields):
+    if TRACE_SAMPLE_RATE < 1.0 and random.random() >= TRACE_SAMPLE_RATE:
+        return
+    trace_log.info(json.dumps({"event": event, "at": time.time(), **fields}, default=str))
+
+
+# Fixed-bucket histogram: counts[i] holds the observations in (buckets[i-1], buckets[i]], the last
+# slot everything above; render() turns them into Prometheus' cumulative `le` buckets
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # Estimated from the buckets by linear interpolation, values above the last bucket report its bound
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in pairs) + "}"
+
+
+# Process-wide metric registry: counters, gauges and histograms keyed by name and labels.
+# Recording is a dict lookup and an add so it can sit on every command and fetch; caches are
+# registered once and only read when the metrics are rendered.
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._caches = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _labels(labels))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        self.gauges[(name, _labels(labels))] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, _labels(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # Decorator timing every call of a coroutine function, e.g. a view callback
+    def timed(self, name, **labels):
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # Exposes an LRUCache's stats as cache_* metrics labelled with `name`, replacing any earlier
+    # cache registered under the same name (e.g. after a cog reload)
+    def register_cache(self, name, cache):
+        self._caches[name] = cache
+
+    def _cache_samples(self):
+        for name, cache in self._caches.items():
+            stats = cache.stats
+            for field in ("hits", "misses", "evictions", "expirations"):
+                yield f"cache_{field}_total", "counter", (("cache", name),), stats[field]
+            yield "cache_size", "gauge", (("cache", name),), stats["size"]
+
+    # Prometheus text exposition format
+    def render(self):
+        families = {}
+        for (name, labels), value in self.counters.items():
+            families.setdefault((name, "counter"), []).append((labels, value))
+        for (name, labels), value in self.gauges.items():
+            families.setdefault((name, "gauge"), []).append((labels, value))
+        for name, kind, labels, value in self._cache_samples():
+            families.setdefault((name, kind), []).append((labels, value))
+        families.setdefault(("uptime_seconds", "gauge"), []).append(((), time.time() - self.started))
+
+        lines = []
+        for (name, kind), samples in sorted(families.items()):
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{_format_labels(labels)} {value}" for labels, value in sorted(samples))
+        histograms = {}
+        for (name, labels), histogram in self.histograms.items():
+            histograms.setdefault(name, []).append((labels, histogram))
+        for name, entries in sorted(histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(entries, key=lambda entry: entry[0]):
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    # Written to a temporary file and renamed, so a scraper never reads half a file
+    def write(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            file.write(self.render())
+        os.replace(temporary, path)
+
+    def histogram(self, name, **labels):
+        return self.histograms.get((name, _labels(labels)))
+
+    # Histograms of one metric by the value of one of their labels
+    def histograms_by(self, name, label):
+        return {dict(labels).get(label): histogram for (metric, labels), histogram in self.histograms.items() if metric == name}
+
+    def counters_by(self, name, label):
+        totals = {}
+        for (metric, labels), value in self.counters.items():
+            if metric == name:
+                key = dict(labels).get(label)
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def cache_stats(self):
+        return {name: cache.stats for name, cache in self._caches.items()}
+
+
+metrics = Metrics()
+
+
+# Samples event-loop lag: how much later than requested a short sleep wakes up. Anything
+# blocking the loop (a slow calculation, sync I/O) shows up here as lag for every command.
+async def sample_loop_lag(interval, registry=metrics):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - start - interval)
+        registry.observe("event_loop_lag_seconds", lag, buckets=LAG_BUCKETS)
+        registry.set("event_loop_lag_last_seconds", lag)
+
+
+# Background tasks publishing the registry: the event-loop lag sampler, a Prometheus text file
+# rewritten every `write_interval` seconds (for node_exporter's textfile collector) and/or a
+# local HTTP endpoint serving /metrics. Each part is off when its setting is empty or 0.
+class MetricsExporter:
+    def __init__(self, registry=metrics, textfile_path=None, write_interval=15, http_host="127.0.0.1", http_port=0,
+                 loop_lag_interval=0.5):
+        self.registry = registry
+        self.textfile_path = textfile_path
+        self.write_interval = write_interval
+        self.http_host = http_host
+        self.http_port = http_port
+        self.loop_lag_interval = loop_lag_interval
+        self._tasks = []
+        self._runner = None
+
+    async def start(self):
+        if self._tasks or self._runner is not None:
+            return
+        if self.loop_lag_interval:
+            self._tasks.append(asyncio.create_task(sample_loop_lag(self.loop_lag_interval, self.registry), name="loop-lag"))
+        if self.textfile_path:
+            self._tasks.append(asyncio.create_task(self._write_loop(), name="metrics-writer"))
+        if self.http_port:
+            from aiohttp import web
+            app = web.Application()
+            app.router.add_get("/metrics", self._handle)
+            self._runner = web.AppRunner(app)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, self.http_host, self.http_port).start()
+            log.info("Serving metrics on http://%s:%d/metrics", self.http_host, self.http_port)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self.textfile_path:
+            self._write()
+
+    async def _handle(self, request):
+        from aiohttp import web
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8")
+
+    def _write(self):
+        try:
+            self.registry.write(self.textfile_path)
+        except OSError:
+            log.exception("Writing metrics to %s failed", self.textfile_path)
+
+    async def _write_loop(self):
+        while True:
+            self._write()
+            await asyncio.sleep(self.write_interval)
@@ -0,0 +1,102 @@
+import numpy as np
+
+from data.item_index import item_index
+
+# Every field the wiki price endpoints return per item, with the column type used to store it.
+# Prices always fit in 32 bits (the max cash stack), timestamps and volumes are kept in 64.
+FIELDS = {
+    "high": np.int32,
+    "low": np.int32,
+    "highTime": np.int64,
+    "lowTime": np.int64,
+    "avgHighPrice": np.int32,
+    "avgLowPrice": np.int32,
+    "highPriceVolume": np.int64,
+    "lowPriceVolume": np.int64,
+}
+
+
+# Column-oriented price snapshot. Rows follow the shared ItemIndex, every field is one typed
+# array plus a boolean `present` mask that replaces the API's nulls/missing items.
+# Fields an endpoint does not return (e.g. "high" in /1h) simply have no column.
+class PriceTable:
+    def __init__(self, columns, present, size, index=item_index):
+        self.columns = columns
+        self.present = present
+        self.size = size
+        self.index = index
+
+    @classmethod
+    def from_payload(cls, data, index=item_index):
+        rows = [index.resolve(int(item_id)) for item_id in data]
+        size = len(index)
+        items = list(data.values())
+        columns = {}
+        present = {}
+        for field, dtype in FIELDS.items():
+            values = [item.get(field) for item in items]
+            mask = np.zeros(size, dtype=bool)
+            mask[rows] = [value is not None for value in values]
+            if not mask.any():
+                continue
+            column = np.zeros(size, dtype=dtype)
+            column[rows] = [0 if value is None else value for value in values]
+            columns[field] = column
+            present[field] = mask
+        return cls(columns, present, size, index)
+
+    # Back to the API's dict shape (keyed by id strings), e.g. for persisting or printing
+    def to_payload(self):
+        data = {}
+        for field, column in self.columns.items():
+            mask = self.present[field]
+            for row in np.flatnonzero(mask).tolist():
+                data.setdefault(str(self.index.ids[row]), {})[field] = column[row].item()
+        return data
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values()) + sum(mask.nbytes for mask in self.present.values())
+
+    @property
+    def item_ids(self):
+        return np.asarray(self.index.ids[:self.size], dtype=np.int64)
+
+    # Values and presence of one field for an array of rows, rows outside the table are missing
+    def gather(self, field, rows):
+        rows = np.asarray(rows, dtype=np.intp)
+        column = self.columns.get(field)
+        if column is None:
+            return np.zeros(len(rows), dtype=FIELDS[field]), np.zeros(len(rows), dtype=bool)
+        inside = rows < self.size
+        safe = np.where(inside, rows, 0)
+        return column[safe], self.present[field][safe] & inside
+
+    # Single value as a Python int, or None when the item or field is missing
+    def get(self, item_id, field):
+        row = self.index.get(item_id)
+        if row is None or row >= self.size or field not in self.columns or not self.present[field][row]:
+            return None
+        return self.columns[field][row].item()
+
+
+def as_price_table(prices):
+    if isinstance(prices, PriceTable):
+        return prices
+    return PriceTable.from_payload(prices)
+
+
+# Rows whose values differ between two tables, as a boolean mask over the larger one, plus
+# the masks of rows whose highTime / lowTime moved
+def diff_tables(old, new):
+    size = max(old.size, new.size)
+    changed = np.zeros(size, dtype=bool)
+    moved = {}
+    for field in set(old.columns) | set(new.columns):
+        old_values, old_present = old.gather(field, np.arange(size))
+        new_values, new_present = new.gather(field, np.arange(size))
+        differs = (old_present != new_present) | (new_present & (old_values != new_values))
+        changed |= differs
+        moved[field] = differs
+    empty = np.zeros(size, dtype=bool)
+    return changed, moved.get("highTime", empty), moved.get("lowTime", empty)
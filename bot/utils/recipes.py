@@ -0,0 +1,165 @@
+import numpy as np
+
+from bot.utils.cache import LRUCache
+from bot.utils.calculations import herb_yield_batch
+from bot.utils.metrics import metrics
+from data.item_index import item_index
+from data.items import recipes
+
+
+# Herb runs: one action is one run over every patch, so seeds scale with the patch count and
+# herbs with the expected yield of the setup (a single-setup calculations.HerbSetups)
+def herb_yield(params, setups):
+    output_scale = herb_yield_batch(setups, [param["lowCTS"] for param in params])[0]
+    return np.full(len(params), float(setups.patches.reshape(-1)[0])), output_scale
+
+
+# Yield models by the name recipes use in "yield". A model takes the "params" of its recipes and
+# a setup and returns per-recipe (input scale, output scale) arrays.
+YIELD_MODELS = {
+    "herb": herb_yield,
+}
+
+
+# Profit, GP/hr and XP/hr of a RecipeBook's recipes for one price snapshot, one array element
+# per recipe; `valid` is False where a price is missing or a yield model had no setup
+class RecipeResults:
+    def __init__(self, book, cost, value, valid, modelled):
+        self.book = book
+        self.cost = cost
+        self.value = value
+        self.valid = valid
+        self.modelled = modelled
+        self.profit = value - cost
+        self.gp_hr = self.profit * book.actions_per_hour
+        self.xp_hr = book.xp * book.actions_per_hour
+
+    # Plain rows of the valid recipes in `group` (every group when None), in definition order
+    def rows(self, group=None, name_field="Recipe"):
+        selected = self.valid if group is None else self.valid & (self.book.groups == group)
+        rows = []
+        for position in np.flatnonzero(selected).tolist():
+            rows.append({
+                name_field: self.book.names[position],
+                "Input Cost": self.cost[position].item(),
+                "Output Value": self.value[position].item(),
+                "Profit": self.profit[position].item(),
+                "XP/hr": self.xp_hr[position].item(),
+                "GP/hr": self.gp_hr[position].item(),
+                "output_id": self.book.main_output[position],
+            })
+        return rows
+
+
+# Every recipe compiled into flat (recipe, row, quantity) term arrays, so one evaluation gathers
+# the prices of all the items involved once and sums them per recipe with np.bincount: cost is
+# O(terms) no matter how many recipes or groups there are. Results without a setup only depend
+# on the snapshot and are cached per (endpoint, price_key, version); a newer version only
+# recomputes the recipes whose items show up in its deltas ("patched"), like DerivedTable.
+# With track=False the items get rows but aren't added to the tracked set, so filtered price
+# fetches don't start keeping them.
+class RecipeBook:
+    def __init__(self, recipes, index=item_index, cache=None, track=True):
+        self.names = list(recipes)
+        self.positions = {name: position for position, name in enumerate(self.names)}
+        self.groups = np.array([recipe.get("group", "") for recipe in recipes.values()], dtype=object)
+        self.actions_per_hour = np.array([recipe.get("actions_per_hour", np.nan) for recipe in recipes.values()], dtype=float)
+        self.xp = np.array([recipe.get("xp", 0) for recipe in recipes.values()], dtype=float)
+        self.main_output = [next(iter(recipe["outputs"]), None) for recipe in recipes.values()]
+        self.items = [set(recipe["inputs"]) | set(recipe["outputs"]) for recipe in recipes.values()]
+        self.inputs = self._terms(recipes, "inputs", index.track if track else index.resolve)
+        self.outputs = self._terms(recipes, "outputs", index.track if track else index.resolve)
+        self.models = {}
+        for position, recipe in enumerate(recipes.values()):
+            if "yield" in recipe:
+                if recipe["yield"] not in YIELD_MODELS:
+                    raise ValueError(f"Unknown yield model {recipe['yield']!r} in recipe {self.names[position]!r}")
+                self.models.setdefault(recipe["yield"], ([], []))
+                self.models[recipe["yield"]][0].append(position)
+                self.models[recipe["yield"]][1].append(recipe.get("params", {}))
+        self.models = {name: (np.array(positions), params) for name, (positions, params) in self.models.items()}
+        self.cache = cache if cache is not None else LRUCache(maxsize=8)
+        # newest (version, results) per (endpoint, price_key), what the next version is patched from
+        self.latest = {}
+        self.patched = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    # (recipe positions, unique table rows, position of each term's row in them, quantities)
+    @staticmethod
+    def _terms(recipes, side, row_of):
+        positions, item_ids, quantities = [], [], []
+        for position, recipe in enumerate(recipes.values()):
+            for item_id, quantity in recipe[side].items():
+                positions.append(position)
+                item_ids.append(item_id)
+                quantities.append(quantity)
+        rows = np.array([row_of(item_id) for item_id in item_ids], dtype=np.intp)
+        unique_rows, term_rows = np.unique(rows, return_inverse=True)
+        return np.array(positions, dtype=np.intp), unique_rows, term_rows.reshape(-1), np.array(quantities, dtype=float)
+
+    # Per recipe sum of quantity * scale * price, and whether every term had a price.
+    # With `selected` only the terms of those recipes are priced, the others come out as 0.
+    def _sum(self, table, price_key, terms, scale, selected=None):
+        positions, unique_rows, term_rows, quantities = terms
+        if selected is not None:
+            keep = selected[positions]
+            positions, unique_rows, term_rows, quantities = positions[keep], unique_rows[term_rows[keep]], np.arange(keep.sum()), quantities[keep]
+        prices, present = table.gather(price_key, unique_rows)
+        weights = quantities * scale[positions] * prices.astype(float)[term_rows]
+        total = np.bincount(positions, weights=weights, minlength=len(self))
+        missing = np.bincount(positions, weights=~present[term_rows], minlength=len(self))
+        return total, missing == 0
+
+    # Evaluates every recipe against a snapshot, cached per version when there are no setups
+    def evaluate(self, snapshot, price_key, setups=None):
+        if setups:
+            return self.compute(snapshot.table, price_key, setups)
+        key = (snapshot.endpoint, price_key, snapshot.version)
+        results = self.cache.get(key)
+        if results is None:
+            latest = self.latest.get(key[:2])
+            changed = snapshot.changed_since(latest[0]) if latest is not None else None
+            if changed is None:
+                results = self.compute(snapshot.table, price_key)
+            else:
+                results = self.patch(latest[1], snapshot.table, price_key, changed)
+            self.cache.put(key, results)
+            if latest is None or snapshot.version > latest[0]:
+                self.latest[key[:2]] = (snapshot.version, results)
+        return results
+
+    # Setup-less `results` of an older version with the recipes using any of the `changed` item ids recomputed
+    def patch(self, results, table, price_key, changed):
+        self.patched += 1
+        stale = np.array([not items.isdisjoint(changed) for items in self.items], dtype=bool)
+        if not stale.any():
+            return results
+        ones = np.ones(len(self))
+        cost, inputs_priced = self._sum(table, price_key, self.inputs, ones, stale)
+        value, outputs_priced = self._sum(table, price_key, self.outputs, ones, stale)
+        cost = np.where(stale, cost, results.cost)
+        value = np.where(stale, value, results.value)
+        valid = np.where(stale, inputs_priced & outputs_priced & results.modelled, results.valid)
+        return RecipeResults(self, cost, value, valid, results.modelled)
+
+    # Evaluates every recipe against a PriceTable. `setups` maps yield model names to a setup;
+    # recipes whose model has none are left invalid.
+    def compute(self, table, price_key, setups=None):
+        input_scale = np.ones(len(self))
+        output_scale = np.ones(len(self))
+        modelled = np.ones(len(self), dtype=bool)
+        for name, (positions, params) in self.models.items():
+            setup = (setups or {}).get(name)
+            if setup is None:
+                modelled[positions] = False
+                continue
+            input_scale[positions], output_scale[positions] = YIELD_MODELS[name](params, setup)
+        cost, inputs_priced = self._sum(table, price_key, self.inputs, input_scale)
+        value, outputs_priced = self._sum(table, price_key, self.outputs, output_scale)
+        return RecipeResults(self, cost, value, inputs_priced & outputs_priced & modelled, modelled)
+
+
+recipe_book = RecipeBook(recipes)
+metrics.register_cache("recipe_results", recipe_book.cache)
@@ -0,0 +1,42 @@
+import discord
+
+# Plain-record replacements for the DataFrame sort + iterrows the commands used to do.
+# A column is (label, field, width, format) where format is an optional callable applied to the value.
+
+
+def sort_records(records, field, descending=True):
+    return sorted(records, key=lambda record: record[field], reverse=descending)
+
+
+def _value(record, column):
+    _, field, _, fmt = column
+    value = record[field]
+    return fmt(value) if fmt is not None else value
+
+
+# Fixed-width table inside a markdown code block, optionally with a title line
+def render_markdown(columns, records, title=None):
+    table_header = " ".join(f"{label:<{width}}" for label, _, width, _ in columns) + "\n"
+    table_header += " ".join("-" * width for _, _, width, _ in columns) + "\n"
+    table_rows = ""
+    for record in records:
+        table_rows += " ".join(f"{_value(record, column):<{column[2]}}" for column in columns) + "\n"
+    title = f"{title}\n" if title else ""
+    return f"```{title}{table_header}{table_rows}```"
+
+
+# (name, value) pairs for discord.Embed.add_field, one per record
+def render_embed_fields(name_field, columns, records):
+    fields = []
+    for record in records:
+        value = "".join(f"**{column[0]}:** {_value(record, column)}\n" for column in columns)
+        fields.append((record[name_field], value))
+    return fields
+
+
+def build_embed(title, color, fields, user):
+    embed = discord.Embed(title=title, color=color)
+    embed.set_author(name=user.display_name, icon_url=user.display_avatar.url)
+    for name, value in fields:
+        embed.add_field(name=name, value=value, inline=False)
+    return embed
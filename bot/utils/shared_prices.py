@@ -0,0 +1,346 @@
+import asyncio
+import logging
+import mmap
+import os
+import time
+
+import numpy as np
+from bot.utils.api import ENDPOINTS, MARKET_ENDPOINTS, PRICE_ERRORS, PriceSnapshot, PriceStore, diff_snapshots, metric_endpoint
+from bot.utils.metrics import metrics
+from bot.utils.price_table import FIELDS, PriceTable
+from config.settings import (
+    MARGINS_REFRESH_INTERVAL, PRICE_REFRESH_INTERVAL, SHARED_PRICES_CAPACITY, SHARED_PRICES_PATH, SHARED_PRICES_POLL_INTERVAL,
+    SHARED_PRICES_SLOTS, SHARED_PRICES_WAIT,
+)
+from data.item_index import item_index
+
+log = logging.getLogger(__name__)
+
+MAGIC = 0x4F53525350524943  # "OSRSPRIC"
+LAYOUT = 2
+HEADER = np.dtype([
+    ("magic", "<u8"), ("layout", "<u4"), ("slots", "<u4"), ("capacity", "<u8"),
+    ("seq", "<u8"), ("version", "<u8"), ("slot", "<u4"), ("fields", "<u4"), ("size", "<u8"), ("fetched_at", "<f8"),
+    ("timestamp", "<i8"),
+])
+HEADER_SIZE = 128
+FIELD_BITS = {field: 1 << bit for bit, field in enumerate(FIELDS)}
+
+
+def shared_path(endpoint, path=SHARED_PRICES_PATH):
+    return f"{path}.{endpoint}"
+
+
+# Where the fetcher publishes the market-wide snapshots, e.g. data/shared_prices.market.latest
+def market_path(path=SHARED_PRICES_PATH):
+    return f"{path}.market"
+
+
+# File layout shared by writer and readers: a header, then `slots` snapshot slots each holding
+# the item ids of its rows followed by every FIELDS column and its present mask, `capacity` rows each.
+# The header is guarded by a seqlock (`seq` is odd while it is being updated).
+class _Layout:
+    def __init__(self, capacity, slots):
+        self.capacity = capacity
+        self.slots = slots
+        self.offsets = {"ids": 0}
+        offset = capacity * 8
+        for field, dtype in FIELDS.items():
+            self.offsets[field] = offset
+            offset += capacity * np.dtype(dtype).itemsize
+            self.offsets[field + ":present"] = offset
+            offset += capacity
+        self.slot_size = offset
+        self.size = HEADER_SIZE + slots * self.slot_size
+
+    def array(self, buffer, slot, name, dtype, count):
+        offset = HEADER_SIZE + slot * self.slot_size + self.offsets[name]
+        return np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+
+
+# Publishes snapshots of one endpoint into a memory-mapped file, used by the single price
+# fetcher process. A new table goes into the slot after the active one and only then becomes
+# visible through the header, so readers never see a half-written snapshot.
+class SharedPriceWriter:
+    def __init__(self, path, capacity=SHARED_PRICES_CAPACITY, slots=SHARED_PRICES_SLOTS, label=None):
+        capacity = -(-capacity // 8) * 8  # keeps every column 8-byte aligned
+        self.path = path
+        self.label = label
+        self.layout = _Layout(capacity, slots)
+        self._table = None
+        self._map = self._open()
+        self.header = np.ndarray((), dtype=HEADER, buffer=self._map)
+
+    # Reuses an existing file with the same layout so versions keep increasing across restarts,
+    # anything else is replaced by a new file (readers notice the new inode and remap)
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path) == self.layout.size:
+            with open(self.path, "r+b") as file:
+                mapped = mmap.mmap(file.fileno(), self.layout.size)
+            header = np.ndarray((), dtype=HEADER, buffer=mapped)
+            if (header["magic"], header["layout"], header["slots"], header["capacity"]) == (MAGIC, LAYOUT, self.layout.slots, self.layout.capacity):
+                return mapped
+            del header
+            mapped.close()
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "wb") as file:
+            file.truncate(self.layout.size)
+        with open(temporary, "r+b") as file:
+            mapped = mmap.mmap(file.fileno(), self.layout.size)
+        header = np.ndarray((), dtype=HEADER, buffer=mapped)
+        header["magic"], header["layout"] = MAGIC, LAYOUT
+        header["slots"], header["capacity"] = self.layout.slots, self.layout.capacity
+        os.replace(temporary, self.path)
+        return mapped
+
+    @property
+    def version(self):
+        return int(self.header["version"])
+
+    def publish(self, snapshot):
+        if snapshot.table is self._table:
+            self._update(fetched_at=snapshot.fetched_at)
+            return
+        table = snapshot.table
+        if table.size > self.layout.capacity:
+            raise ValueError(f"{table.size} items do not fit the shared price capacity of {self.layout.capacity}")
+        slot = (int(self.header["slot"]) + 1) % self.layout.slots
+        self.layout.array(self._map, slot, "ids", np.int64, table.size)[:] = table.item_ids
+        fields = 0
+        for field, dtype in FIELDS.items():
+            if field in table.columns:
+                self.layout.array(self._map, slot, field, dtype, table.size)[:] = table.columns[field][:table.size]
+                self.layout.array(self._map, slot, field + ":present", bool, table.size)[:] = table.present[field][:table.size]
+                fields |= FIELD_BITS[field]
+        self._update(version=self.version + 1, slot=slot, fields=fields, size=table.size, fetched_at=snapshot.fetched_at,
+                     timestamp=snapshot.timestamp or 0)
+        self._table = table
+        metrics.set("shared_price_version", self.version, endpoint=metric_endpoint(snapshot.endpoint, self.label))
+
+    def _update(self, **values):
+        self.header["seq"] += 1
+        for name, value in values.items():
+            self.header[name] = value
+        self.header["seq"] += 1
+
+    def close(self):
+        del self.header
+        self._map.close()
+
+
+# Read-only view of a SharedPriceWriter's file. table() returns PriceTables whose columns are
+# numpy views straight into the mapping, so every shard process shares one resident copy.
+class SharedPriceReader:
+    def __init__(self, path, index=item_index):
+        self.path = path
+        self.index = index
+        self._map = None
+        self._inode = None
+        self.layout = None
+
+    def _remap(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if stat.st_ino == self._inode and self._map is not None:
+            return True
+        with open(self.path, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.ndarray((), dtype=HEADER, buffer=mapped)
+        if header["magic"] != MAGIC or header["layout"] != LAYOUT:
+            return False
+        # the previous mapping is left to the garbage collector, tables still in use may point into it
+        self._map, self._inode = mapped, stat.st_ino
+        self.layout = _Layout(int(header["capacity"]), int(header["slots"]))
+        return True
+
+    # Consistent copy of the header fields, or None when nothing was published yet
+    def header(self):
+        if not self._remap():
+            return None
+        header = np.ndarray((), dtype=HEADER, buffer=self._map)
+        while True:
+            seq = int(header["seq"])
+            if seq % 2 == 0:
+                values = header.copy()
+                if int(header["seq"]) == seq:
+                    break
+            time.sleep(0)
+        return None if values["version"] == 0 else values
+
+    def table(self, header):
+        size, slot, fields = int(header["size"]), int(header["slot"]), int(header["fields"])
+        ids = self.layout.array(self._map, slot, "ids", np.int64, size)
+        columns = {}
+        present = {}
+        for field, dtype in FIELDS.items():
+            if fields & FIELD_BITS[field]:
+                columns[field] = self.layout.array(self._map, slot, field, dtype, size)
+                present[field] = self.layout.array(self._map, slot, field + ":present", bool, size)
+        if self._align(ids):
+            return PriceTable(columns, present, size, self.index)
+        # this process resolved ids the fetcher never saw, fall back to a re-ordered copy
+        log.warning("Local item index differs from the shared snapshot, copying %s", self.path)
+        rows = np.fromiter((self.index.resolve(item_id) for item_id in ids.tolist()), dtype=np.intp, count=size)
+        table_size = len(self.index)
+        copied = {field: np.zeros(table_size, dtype=column.dtype) for field, column in columns.items()}
+        copied_present = {field: np.zeros(table_size, dtype=bool) for field in columns}
+        for field, column in columns.items():
+            copied[field][rows] = column
+            copied_present[field][rows] = present[field]
+        return PriceTable(copied, copied_present, table_size, self.index)
+
+    # Extends the local ItemIndex with the fetcher's ids so shared rows line up with local rows
+    def _align(self, ids):
+        local = len(self.index)
+        for item_id in ids[local:].tolist():
+            self.index.resolve(item_id)
+        return np.array_equal(np.asarray(self.index.ids[:len(ids)], dtype=np.int64), ids)
+
+    def close(self):
+        self._map = None
+
+
+# Drop-in replacement for PriceStore in shard processes: snapshots come from the fetcher's
+# shared files instead of the network. Each get() (and a poll every `poll_interval` seconds)
+# checks the header; a new version is mapped, diffed against the previous one for DerivedTable
+# patching and handed to the listeners.
+class SharedPriceStore:
+    delta_history = PriceStore.delta_history
+
+    def __init__(self, path=SHARED_PRICES_PATH, poll_interval=SHARED_PRICES_POLL_INTERVAL, wait=SHARED_PRICES_WAIT,
+                 endpoints=tuple(ENDPOINTS), label=None):
+        self.readers = {endpoint: SharedPriceReader(shared_path(endpoint, path)) for endpoint in endpoints}
+        self.endpoints = endpoints
+        self.label = label
+        self.poll_interval = poll_interval
+        self.wait = wait
+        self._snapshots = {}
+        self._listeners = []
+        self._poller = None
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    # Waits (up to `wait` seconds) for the fetcher to have published every endpoint
+    async def load_persisted(self):
+        deadline = time.monotonic() + self.wait
+        while any(self._poll(endpoint) is None for endpoint in self.endpoints) and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+
+    async def start(self):
+        if self._poller is None and self.poll_interval:
+            self._poller = asyncio.create_task(self._poll_loop(), name="shared-price-poller")
+
+    async def close(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+        for reader in self.readers.values():
+            reader.close()
+
+    def peek(self, endpoint):
+        return self._snapshots.get(endpoint)
+
+    async def get(self, endpoint):
+        if endpoint not in self.endpoints:
+            raise ValueError(f"Unknown price endpoint: {endpoint}")
+        snapshot = self._poll(endpoint)
+        if snapshot is None:
+            raise ValueError(f"No {endpoint} prices published by the fetcher process yet")
+        return snapshot
+
+    async def refresh(self, endpoint):
+        return await self.get(endpoint)
+
+    def _poll(self, endpoint):
+        previous = self._snapshots.get(endpoint)
+        header = self.readers[endpoint].header()
+        if header is None:
+            return previous
+        version, fetched_at = int(header["version"]), float(header["fetched_at"])
+        if previous is not None and previous.version == version:
+            if previous.fetched_at != fetched_at:
+                previous = self._snapshots[endpoint] = previous.revalidated(fetched_at)
+            return previous
+
+        table = self.readers[endpoint].table(header)
+        if previous is not None and version == previous.version + 1:
+            delta = diff_snapshots(previous.table, table, version)
+            deltas = previous.deltas[-(self.delta_history - 1):] + (delta,)
+        else:
+            # first snapshot, missed versions or a recreated file: consumers rebuild from scratch
+            deltas = ()
+        timestamp = int(header["timestamp"]) or None
+        snapshot = self._snapshots[endpoint] = PriceSnapshot(endpoint, table, fetched_at, version, deltas, timestamp=timestamp)
+        metrics.set("price_snapshot_version", version, endpoint=metric_endpoint(endpoint, self.label))
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception:
+                log.exception("Price listener %r failed", callback)
+        return snapshot
+
+    async def _poll_loop(self):
+        while True:
+            for endpoint in self.endpoints:
+                try:
+                    self._poll(endpoint)
+                except Exception:
+                    log.exception("Reading shared %s prices failed", endpoint)
+            await asyncio.sleep(self.poll_interval)
+
+
+# Refreshes every endpoint of `store` and publishes each result through its writer
+async def _publish(store, writers):
+    for endpoint, writer in writers.items():
+        try:
+            writer.publish(await store.refresh(endpoint))
+        except PRICE_ERRORS:
+            log.warning("Refreshing %s prices failed", metric_endpoint(endpoint, store.label), exc_info=True)
+        except Exception:
+            log.exception("Refreshing %s prices failed", metric_endpoint(endpoint, store.label))
+
+
+# Main loop of the price fetcher process: the only process talking to the wiki API and the
+# snapshot store, it refreshes every endpoint and publishes each result for the shards. The
+# market-wide snapshots of /top_margins and /watch are refreshed every `market_interval` seconds.
+async def run_fetcher(path=SHARED_PRICES_PATH, interval=PRICE_REFRESH_INTERVAL, snapshot_store=None, market_interval=MARGINS_REFRESH_INTERVAL):
+    import data.items  # noqa: F401 - tracked items get the same rows as in the shard processes
+    store = PriceStore(snapshot_store=snapshot_store, refresh_interval=0)
+    market = PriceStore(refresh_interval=0, full_parse=True, endpoints=MARKET_ENDPOINTS, label="market")
+    writers = {endpoint: SharedPriceWriter(shared_path(endpoint, path)) for endpoint in ENDPOINTS}
+    market_writers = {endpoint: SharedPriceWriter(shared_path(endpoint, market_path(path)), label="market") for endpoint in MARKET_ENDPOINTS}
+    market_due = 0.0
+    await store.load_persisted()
+    await store.start()
+    await market.start()
+    try:
+        for endpoint, writer in writers.items():
+            if store.peek(endpoint) is not None:
+                writer.publish(store.peek(endpoint))
+        while True:
+            await _publish(store, writers)
+            if time.monotonic() >= market_due:
+                market_due = time.monotonic() + market_interval
+                await _publish(market, market_writers)
+            try:
+                await store.maintain()
+            except Exception:
+                log.exception("Maintaining the snapshot store failed")
+            await asyncio.sleep(interval)
+    finally:
+        await store.close()
+        await market.close()
+        for writer in list(writers.values()) + list(market_writers.values()):
+            writer.close()
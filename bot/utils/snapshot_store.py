@@ -0,0 +1,80 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from config.settings import SNAPSHOT_DB_PATH, SNAPSHOT_FULL_RESOLUTION_HOURS, SNAPSHOT_RETENTION_DAYS
+
+
+# On-disk history of every price payload we fetched, so the bot can start warm and keep
+# answering from the last known prices while the wiki API is unreachable.
+# Payloads are stored zlib-compressed; old rows are thinned out to one per hour and
+# eventually dropped by prune(), and compact() hands the freed pages back to the filesystem.
+class SnapshotStore:
+    def __init__(self, path=SNAPSHOT_DB_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            # must be set before the first table is created to take effect
+            self._db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self._db.execute("PRAGMA journal_mode = WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " endpoint TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL,"
+                " etag TEXT,"
+                " last_modified TEXT,"
+                " payload BLOB NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS snapshots_endpoint_time ON snapshots (endpoint, fetched_at)")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def save(self, endpoint, data, fetched_at, etag=None, last_modified=None):
+        payload = zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO snapshots (endpoint, fetched_at, etag, last_modified, payload) VALUES (?, ?, ?, ?, ?)",
+                (endpoint, fetched_at, etag, last_modified, payload))
+
+    # Most recent stored payload of an endpoint at or before `before`, as
+    # (data, fetched_at, etag, last_modified), or None if nothing was stored yet
+    def load_latest(self, endpoint, before=None):
+        query = "SELECT payload, fetched_at, etag, last_modified FROM snapshots WHERE endpoint = ?"
+        params = [endpoint]
+        if before is not None:
+            query += " AND fetched_at <= ?"
+            params.append(before)
+        with self._lock:
+            row = self._db.execute(query + " ORDER BY fetched_at DESC LIMIT 1", params).fetchone()
+        if row is None:
+            return None
+        payload, fetched_at, etag, last_modified = row
+        return json.loads(zlib.decompress(payload)), fetched_at, etag, last_modified
+
+    # Keeps every snapshot from the last `full_resolution_hours`, one per hour up to
+    # `retention_days` and nothing older. Returns the number of rows removed.
+    def prune(self, retention_days=SNAPSHOT_RETENTION_DAYS, full_resolution_hours=SNAPSHOT_FULL_RESOLUTION_HOURS, now=None):
+        now = time.time() if now is None else now
+        retention_cutoff = now - retention_days * 86400
+        resolution_cutoff = now - full_resolution_hours * 3600
+        with self._lock, self._db:
+            removed = self._db.execute("DELETE FROM snapshots WHERE fetched_at < ?", (retention_cutoff,)).rowcount
+            removed += self._db.execute(
+                "DELETE FROM snapshots WHERE fetched_at < ? AND id NOT IN ("
+                " SELECT MIN(id) FROM snapshots WHERE fetched_at < ?"
+                " GROUP BY endpoint, CAST(fetched_at / 3600 AS INTEGER))",
+                (resolution_cutoff, resolution_cutoff)).rowcount
+        return removed
+
+    def compact(self):
+        with self._lock:
+            self._db.execute("PRAGMA incremental_vacuum")
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
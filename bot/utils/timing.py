@@ -0,0 +1,47 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+
+# Wall-clock duration of each startup phase (imports, config, extension load, price warmup,
+# gateway ready...), reported once the bot is ready so restart-to-ready latency can be compared
+# across deploys.
+class StartupTimer:
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.phases = {}
+        self.finished = False
+        self._last = self.started
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._last = time.perf_counter()
+            self.phases[name] = self.phases.get(name, 0) + self._last - start
+
+    # Records the time since the end of the previous phase, for things we wait on rather than run
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases[name] = now - self._last
+        self._last = now
+
+    @property
+    def total(self):
+        return self._last - self.started
+
+    def report(self, path=None):
+        self.finished = True
+        summary = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in self.phases.items())
+        log.info("Startup took %.3fs (%s)", self.total, summary)
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "a") as file:
+                record = {"at": time.time(), "total": round(self.total, 4), "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()}}
+                file.write(json.dumps(record) + "\n")
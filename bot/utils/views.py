@@ -0,0 +1,55 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+import discord
+from bot.utils.metrics import metrics
+from config.settings import VIEW_MAX_LIVE, VIEW_TIMEOUT
+
+log = logging.getLogger(__name__)
+
+# Every view still waiting for its selection, oldest first
+_live = OrderedDict()
+# Message edits of closed views, referenced until done so they are not garbage collected
+_closing = set()
+
+
+# Base for the reply-format views. Each one only holds what it needs to answer (rendered tables or
+# result rows, never a price dump), times out after `timeout` seconds and stops after the first
+# selection. At most `max_live` are pending at once: creating one more closes the oldest.
+# Closed views have their select menu removed from the message so nobody clicks a dead menu.
+class BoundedView(discord.ui.View):
+    max_live = VIEW_MAX_LIVE
+
+    def __init__(self, interaction, timeout=VIEW_TIMEOUT):
+        super().__init__(timeout=timeout)
+        self.interaction = interaction
+        _live[self] = None
+        while len(_live) > self.max_live:
+            next(iter(_live)).close("evicted")
+        metrics.set("live_views", len(_live))
+
+    # Stops listening and takes the view off the live list, call it first thing in a callback
+    def stop(self, reason="selected"):
+        super().stop()
+        if self in _live:
+            del _live[self]
+            metrics.set("live_views", len(_live))
+            metrics.inc("views_closed_total", reason=reason)
+
+    # Stops the view and removes its menu from the message
+    def close(self, reason):
+        self.stop(reason)
+        task = asyncio.get_running_loop().create_task(self._remove_menu())
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+
+    async def on_timeout(self):
+        self.stop("timeout")
+        await self._remove_menu()
+
+    async def _remove_menu(self):
+        try:
+            await self.interaction.edit_original_response(content="This selection expired, run the command again.", view=None)
+        except discord.HTTPException:
+            log.debug("Could not remove an expired view", exc_info=True)
@@ -0,0 +1,282 @@
+import asyncio
+import bisect
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+import discord
+import numpy as np
+from bot.utils.margins import ge_tax, margin_scanner
+from bot.utils.metrics import metrics
+from bot.utils.recipes import recipe_book
+from config.settings import ALERTS_DB_PATH, ALERTS_DM_INTERVAL, ALERTS_FLUSH_INTERVAL
+from data.item_index import item_index
+from data.items import recipes
+
+log = logging.getLogger(__name__)
+
+# What a watch can follow: item metrics target an item id, recipe metrics a recipe name.
+# Everything is priced from /latest (instant buy prices).
+METRICS = {
+    "price": "price",
+    "margin": "margin",
+    "profit": "profit",
+    "gp_hr": "GP/hr",
+}
+ITEM_METRICS = ("price", "margin")
+DIRECTIONS = ("above", "below")
+# Recipes priced without a player's setup. Herb runs depend on each player's farming setup, so
+# they can't be watched (/herb_profit answers them per setup instead).
+WATCHABLE_RECIPES = [name for name, recipe in recipes.items() if "yield" not in recipe]
+
+
+# Persistent watches, one row per (user, metric, target, direction, threshold).
+# Several processes may share the file; changed() tells when another connection wrote to it.
+class WatchStore:
+    def __init__(self, path=ALERTS_DB_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode = WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS watches ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " user_id INTEGER NOT NULL,"
+                " metric TEXT NOT NULL,"
+                " target TEXT NOT NULL,"
+                " direction TEXT NOT NULL,"
+                " threshold REAL NOT NULL,"
+                " created_at REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS watches_user ON watches (user_id)")
+        self._data_version = self._version()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _version(self):
+        with self._lock:
+            return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    # True once after another connection (e.g. another shard process) changed the watches
+    def changed(self):
+        version = self._version()
+        changed, self._data_version = version != self._data_version, version
+        return changed
+
+    def add(self, user_id, metric, target, direction, threshold):
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO watches (user_id, metric, target, direction, threshold, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, metric, str(target), direction, threshold, time.time()))
+        return cursor.lastrowid
+
+    def remove(self, user_id, watch_id):
+        with self._lock, self._db:
+            return self._db.execute("DELETE FROM watches WHERE id = ? AND user_id = ?", (watch_id, user_id)).rowcount > 0
+
+    def count(self, user_id):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM watches WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def for_user(self, user_id):
+        with self._lock:
+            return [dict(row) for row in self._db.execute("SELECT * FROM watches WHERE user_id = ? ORDER BY id", (user_id,))]
+
+    def all(self):
+        with self._lock:
+            return [dict(row) for row in self._db.execute("SELECT * FROM watches")]
+
+
+# Thresholds of one metric, sorted per direction, plus the metric's last value. A new value only
+# touches the watches whose threshold lies between the last value and the new one: two bisects
+# find that slice, so the cost doesn't grow with the number of watches that did not cross.
+class ThresholdIndex:
+    def __init__(self):
+        self.above = []
+        self.below = []
+        self.last = None
+
+    def __len__(self):
+        return len(self.above) + len(self.below)
+
+    def add(self, watch_id, direction, threshold):
+        bisect.insort(self.above if direction == "above" else self.below, (threshold, watch_id))
+
+    def remove(self, watch_id, direction, threshold):
+        entries = self.above if direction == "above" else self.below
+        position = bisect.bisect_left(entries, (threshold, watch_id))
+        if position < len(entries) and entries[position] == (threshold, watch_id):
+            del entries[position]
+
+    # Watch ids that crossed with this value: "above" thresholds in (last, value] when rising,
+    # "below" thresholds in [value, last) when falling. The first value only sets the baseline.
+    def update(self, value):
+        previous, self.last = self.last, value
+        if previous is None or value == previous:
+            return []
+        if value > previous:
+            start = bisect.bisect_right(self.above, (previous, math.inf))
+            end = bisect.bisect_right(self.above, (value, math.inf))
+            return [watch_id for _, watch_id in self.above[start:end]]
+        start = bisect.bisect_left(self.below, (value, -math.inf))
+        end = bisect.bisect_left(self.below, (previous, -math.inf))
+        return [watch_id for _, watch_id in self.below[start:end]]
+
+
+def item_name(item_id):
+    return margin_scanner.names.get(item_id, f"item {item_id}")
+
+
+# "Shark GP/hr", "Ranarr seed margin", ...
+def describe(watch):
+    target = item_name(int(watch["target"])) if watch["metric"] in ITEM_METRICS else watch["target"]
+    return f"{target} {METRICS[watch['metric']]}"
+
+
+# Every user's watches grouped into one ThresholdIndex per (metric, target). Each new /latest
+# snapshot computes only the metrics somebody watches, in one batch per kind, and returns the
+# watches that crossed. The store is only touched from worker threads: add/remove write through
+# it, and sync() picks up other processes' changes (call it periodically, see bot/commands/watch.py).
+class Watchlists:
+    def __init__(self, store):
+        self.store = store
+        self.watches = {}
+        self.indexes = {}
+
+    # Loads every watch, keeping the last value of the metrics that are still watched
+    async def load(self):
+        self.reload(await asyncio.to_thread(self.store.all))
+
+    # Reloads when another connection (e.g. another shard process) changed the watches
+    async def sync(self):
+        try:
+            if await asyncio.to_thread(self.store.changed):
+                await self.load()
+        except sqlite3.Error:
+            log.exception("Reloading the watches failed")
+
+    def reload(self, watches):
+        last = {key: index.last for key, index in self.indexes.items()}
+        self.watches = {}
+        self.indexes = {}
+        for watch in watches:
+            self._index(watch)
+        for key, value in last.items():
+            if key in self.indexes:
+                self.indexes[key].last = value
+        metrics.set("watches", len(self.watches))
+
+    def _index(self, watch):
+        self.watches[watch["id"]] = watch
+        key = (watch["metric"], watch["target"])
+        if key not in self.indexes:
+            self.indexes[key] = ThresholdIndex()
+        self.indexes[key].add(watch["id"], watch["direction"], watch["threshold"])
+
+    # Stores and indexes a watch; `current` (the metric's value now) is the baseline to cross from
+    async def add(self, user_id, metric, target, direction, threshold, current=None):
+        watch_id = await asyncio.to_thread(self.store.add, user_id, metric, target, direction, threshold)
+        key = (metric, str(target))
+        self._index({"id": watch_id, "user_id": user_id, "metric": metric, "target": str(target), "direction": direction, "threshold": threshold})
+        if self.indexes[key].last is None:
+            self.indexes[key].last = current
+        metrics.set("watches", len(self.watches))
+        return watch_id
+
+    async def remove(self, user_id, watch_id):
+        if not await asyncio.to_thread(self.store.remove, user_id, watch_id):
+            return False
+        watch = self.watches.pop(watch_id, None)
+        if watch is not None:
+            key = (watch["metric"], watch["target"])
+            self.indexes[key].remove(watch_id, watch["direction"], watch["threshold"])
+            if not self.indexes[key]:
+                del self.indexes[key]
+        metrics.set("watches", len(self.watches))
+        return True
+
+    # Current values of the given (metric, target) keys from a /latest table, missing ones left out
+    def values(self, table, keys):
+        values = {}
+        items = [key for key in keys if key[0] in ITEM_METRICS]
+        if items:
+            rows = [item_index.resolve(int(target)) for _, target in items]
+            high, high_present = table.gather("high", rows)
+            low, low_present = table.gather("low", rows)
+            high = high.astype(float)
+            margin = high - low - ge_tax(high)
+            for position, key in enumerate(items):
+                if key[0] == "price" and high_present[position]:
+                    values[key] = high[position].item()
+                elif key[0] == "margin" and high_present[position] and low_present[position]:
+                    values[key] = margin[position].item()
+        recipes = [key for key in keys if key[0] not in ITEM_METRICS and key[1] in recipe_book.positions]
+        if recipes:
+            # recipes that need a setup come out invalid, so herb run watches stored earlier never fire
+            results = recipe_book.compute(table, "high")
+            for metric, target in recipes:
+                position = recipe_book.positions[target]
+                if results.valid[position]:
+                    value = (results.profit if metric == "profit" else results.gp_hr)[position]
+                    if not np.isnan(value):
+                        values[(metric, target)] = value.item()
+        return values
+
+    def current(self, table, metric, target):
+        return self.values(table, [(metric, str(target))]).get((metric, str(target)))
+
+    # PriceStore listener body: the (watch, value) pairs that crossed with this snapshot
+    def evaluate(self, snapshot):
+        if snapshot.endpoint != "latest" or not self.indexes:
+            return []
+        triggered = []
+        with metrics.timer("watch_evaluate_seconds"):
+            for key, value in self.values(snapshot.table, list(self.indexes)).items():
+                for watch_id in self.indexes[key].update(value):
+                    triggered.append((self.watches[watch_id], value))
+        if triggered:
+            metrics.inc("watch_triggers_total", len(triggered))
+        return triggered
+
+
+# Collects alert lines per user and sends them every `flush_interval` seconds as one DM per user,
+# `dm_interval` seconds apart, so a price swing that trips many watches can't burst the API.
+class AlertSender:
+    def __init__(self, bot, flush_interval=ALERTS_FLUSH_INTERVAL, dm_interval=ALERTS_DM_INTERVAL):
+        self.bot = bot
+        self.flush_interval = flush_interval
+        self.dm_interval = dm_interval
+        self.pending = {}
+
+    def queue(self, user_id, line):
+        self.pending.setdefault(user_id, []).append(line)
+
+    async def flush(self):
+        pending, self.pending = self.pending, {}
+        for user_id, lines in pending.items():
+            await self.send(user_id, lines)
+            await asyncio.sleep(self.dm_interval)
+
+    async def send(self, user_id, lines):
+        text = "Price alerts:\n"
+        for number, line in enumerate(lines):
+            if len(text) + len(line) > 1900:
+                text += f"...and {len(lines) - number} more"
+                break
+            text += f"- {line}\n"
+        try:
+            user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+            await user.send(text)
+            metrics.inc("alert_dms_total", result="sent")
+        except discord.HTTPException:
+            # DMs closed or the user is gone, the watches stay until they remove them
+            log.info("Could not DM price alerts to user %d", user_id, exc_info=True)
+            metrics.inc("alert_dms_total", result="failed")
@@ -1,15 +1,85 @@
 from dotenv import load_dotenv
-import discord
 import yaml
 
 load_dotenv()
 
 # Load additional settings from config.yaml
 with open("config/config.yaml", "r") as file:
-    config = yaml.safe_load(file)
+    config = yaml.load(file, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
 
 BOT_PREFIX = config["bot_prefix"]
-INTENTS = discord.Intents(**config["intents"])
 HEADERS = config["headers"]
 
 DEBUG = config.get("debug", False)
+
+PRICES = config.get("prices", {})
+PRICE_API_BASE = PRICES.get("api_base", "https://prices.runescape.wiki/api/v1/osrs")
+PRICE_TTL = PRICES.get("ttl", 60)
+PRICE_REFRESH_INTERVAL = PRICES.get("refresh_interval", 60)
+PRICE_TIMEOUT = PRICES.get("timeout", 10)
+PRICE_STALE_AFTER = PRICES.get("stale_after", 600)
+PRICE_RETRY_AFTER = PRICES.get("retry_after", 30)
+PRICE_FULL_PARSE = PRICES.get("full_parse", False)
+
+SNAPSHOTS = config.get("snapshots", {})
+SNAPSHOT_DB_PATH = SNAPSHOTS.get("path", "data/prices.sqlite3")
+SNAPSHOT_FULL_RESOLUTION_HOURS = SNAPSHOTS.get("full_resolution_hours", 24)
+SNAPSHOT_RETENTION_DAYS = SNAPSHOTS.get("retention_days", 30)
+SNAPSHOT_PRUNE_INTERVAL = SNAPSHOTS.get("prune_interval", 3600)
+
+CACHE = config.get("cache", {})
+CACHE_MAXSIZE = CACHE.get("maxsize", 512)
+CACHE_MAX_AGE = CACHE.get("max_age", 900)
+
+STARTUP = config.get("startup", {})
+COMMAND_HASH_PATH = STARTUP.get("command_hash_path", "data/command_tree.sha256")
+STARTUP_TIMINGS_PATH = STARTUP.get("timings_path", "data/startup_timings.jsonl")
+
+MARGINS = config.get("margins", {})
+MARGINS_MAPPING_PATH = MARGINS.get("mapping_path", "data/item_mapping.json")
+MARGINS_MAPPING_MAX_AGE = MARGINS.get("mapping_max_age", 86400)
+MARGINS_MAX_PRICE_AGE = MARGINS.get("max_price_age", 3600)
+MARGINS_REFRESH_INTERVAL = MARGINS.get("refresh_interval", 120)
+
+ALERTS = config.get("alerts", {})
+ALERTS_DB_PATH = ALERTS.get("path", "data/watchlists.sqlite3")
+ALERTS_MAX_PER_USER = ALERTS.get("max_per_user", 25)
+ALERTS_FLUSH_INTERVAL = ALERTS.get("flush_interval", 10)
+ALERTS_DM_INTERVAL = ALERTS.get("dm_interval", 1.0)
+
+SHARDING = config.get("sharding", {})
+SHARED_PRICES_PATH = SHARDING.get("shared_prices_path", "data/shared_prices")
+SHARED_PRICES_CAPACITY = SHARDING.get("capacity", 32768)
+SHARED_PRICES_SLOTS = SHARDING.get("slots", 3)
+SHARED_PRICES_POLL_INTERVAL = SHARDING.get("poll_interval", 1.0)
+SHARED_PRICES_WAIT = SHARDING.get("wait_for_prices", 30)
+
+HISTORY = config.get("history", {})
+HISTORY_WINDOW = HISTORY.get("window", 288)
+HISTORY_BACKFILL = HISTORY.get("backfill", True)
+HISTORY_BACKFILL_DELAY = HISTORY.get("backfill_delay", 0.2)
+
+SIMULATION = config.get("simulation", {})
+SIMULATION_TRIALS = SIMULATION.get("trials", 100000)
+
+VIEWS = config.get("views", {})
+VIEW_TIMEOUT = VIEWS.get("timeout", 120)
+VIEW_MAX_LIVE = VIEWS.get("max_live", 500)
+
+METRICS = config.get("metrics", {})
+METRICS_TEXTFILE_PATH = METRICS.get("textfile_path")
+METRICS_WRITE_INTERVAL = METRICS.get("write_interval", 15)
+METRICS_HTTP_HOST = METRICS.get("http_host", "127.0.0.1")
+METRICS_HTTP_PORT = METRICS.get("http_port", 0)
+METRICS_LOOP_LAG_INTERVAL = METRICS.get("loop_lag_interval", 0.5)
+METRICS_TRACE_SAMPLE_RATE = METRICS.get("trace_sample_rate", 0.0)
+
+
+# INTENTS is built on first access so importing settings (e.g. from the calculation modules)
+# doesn't pay for importing discord.py
+def __getattr__(name):
+    if name == "INTENTS":
+        import discord
+        intents = globals()["INTENTS"] = discord.Intents(**config["intents"])
+        return intents
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
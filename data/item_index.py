@@ -0,0 +1,35 @@
+# Dense, stable row numbers for OSRS item ids. Every PriceTable lays its columns out in this
+# order, so an index resolved once (e.g. for the items below in data/items.py) stays valid
+# for every later snapshot.
+# `tracked` is the interest set: ids some item table actually prices, the only ones the
+# filtered price parser in bot/utils/api.py keeps.
+class ItemIndex:
+    def __init__(self):
+        self._rows = {}
+        self.ids = []
+        self.tracked = set()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, item_id):
+        return item_id in self._rows
+
+    # Row of an item id, registering it if it was never seen before
+    def resolve(self, item_id):
+        row = self._rows.get(item_id)
+        if row is None:
+            row = self._rows[item_id] = len(self.ids)
+            self.ids.append(item_id)
+        return row
+
+    # Row of an item id that is priced by one of the item tables, adding it to the interest set
+    def track(self, item_id):
+        self.tracked.add(item_id)
+        return self.resolve(item_id)
+
+    def get(self, item_id, default=None):
+        return self._rows.get(item_id, default)
+
+
+item_index = ItemIndex()
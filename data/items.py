@@ -1,3 +1,5 @@
+from data.item_index import item_index
+
 # Items are referenced from here: https://oldschool.runescape.wiki/w/Module:GEIDs/data.json
 herbs = {
     "Guam": {"seed_id": 5291, "herb_id": 199, "lowCTS": 25, "highCTS": 80},
@@ -25,3 +27,70 @@ fish = {
     "Anglerfish": {"raw_id": 13439, "cooked_id": 13441, "xp_each": 230},
     "Manta Ray": {"raw_id": 389, "cooked_id": 391, "xp_each": 216.3}
 }
+
+# Compost bought to treat every patch, keyed by the same names the commands use for compost
+compost = {
+    "Compost": {"item_id": 6032},
+    "Supercompost": {"item_id": 6034},
+    "Ultracompost": {"item_id": 21483}
+}
+
+# Grimy herb id -> clean herb id and the Herblore XP for cleaning it
+clean_herbs = {
+    199: (249, 2.5), 201: (251, 3.8), 203: (253, 5), 205: (255, 6.3), 207: (257, 7.5), 3049: (2998, 8),
+    209: (259, 8.8), 211: (261, 10), 213: (263, 11.3), 3051: (3000, 11.8), 215: (265, 12.5),
+    2485: (2481, 13.1), 217: (267, 13.8), 219: (269, 15),
+}
+
+# Money making methods as data. Each recipe consumes "inputs" and produces "outputs" ({item_id:
+# quantity}) once per action, "actions_per_hour" times an hour, for "xp" XP in "skill".
+# "yield" names a yield model of bot/utils/recipes.py that scales the quantities by a player
+# setup, with the recipe's own model parameters in "params" (see the herb runs).
+# Every group listed in recipe_groups gets a generated slash command.
+recipes = {}
+for name, info in fish.items():
+    recipes[name] = {
+        "group": "fish", "inputs": {info["raw_id"]: 1}, "outputs": {info["cooked_id"]: 1},
+        "actions_per_hour": 1435, "skill": "Cooking", "xp": info["xp_each"],
+    }
+for name, info in herbs.items():
+    recipes[f"{name} run"] = {
+        "group": "herb_runs", "inputs": {info["seed_id"]: 1}, "outputs": {info["herb_id"]: 1},
+        "skill": "Farming", "yield": "herb", "params": {"lowCTS": info["lowCTS"]},
+    }
+    clean_id, xp = clean_herbs[info["herb_id"]]
+    recipes[f"Clean {name.lower()}"] = {
+        "group": "herb_cleaning", "inputs": {info["herb_id"]: 1}, "outputs": {clean_id: 1},
+        "actions_per_hour": 5000, "skill": "Herblore", "xp": xp,
+    }
+
+# Generated recipe commands: command name, description, reply title, the labels of the
+# name/input/output price columns and the field the table is sorted by
+recipe_groups = {
+    "fish": {
+        "command": "fish_profit", "description": "Calculate the potential profit from cooking fish.", "title": "Fish Cooking Profit",
+        "name_label": "Fish", "input_label": "Raw Price", "output_label": "Cooked Price", "sort": "GP/hr",
+    },
+    "herb_cleaning": {
+        "command": "herb_cleaning", "description": "Calculate the profit and XP from cleaning grimy herbs.", "title": "Herb Cleaning Profit",
+        "name_label": "Herb", "input_label": "Grimy Price", "output_label": "Clean Price", "sort": "GP/hr",
+    },
+}
+
+
+# Resolve every item to its PriceTable row once, so commands gather prices by index.
+# track() also adds them to the interest set, new item tables should do the same.
+for info in herbs.values():
+    info["seed_idx"] = item_index.track(info["seed_id"])
+    info["herb_idx"] = item_index.track(info["herb_id"])
+
+for info in fish.values():
+    info["raw_idx"] = item_index.track(info["raw_id"])
+    info["cooked_idx"] = item_index.track(info["cooked_id"])
+
+for info in compost.values():
+    info["item_idx"] = item_index.track(info["item_id"])
+
+for recipe in recipes.values():
+    for item_id in (*recipe["inputs"], *recipe["outputs"]):
+        item_index.track(item_id)
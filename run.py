@@ -1,15 +1,103 @@
+import argparse
+import asyncio
+import multiprocessing
 import os
-from bot.bot import bot  # imported bot class from bot.py
+
+from bot.utils.timing import StartupTimer
+
+timer = StartupTimer()
 
 
 # defines the async function to setup and start the bot
-async def main():
-    await bot.setup_hook()
-    await bot.load_extension("bot.commands.herb_profit")
-    await bot.load_extension("bot.commands.fish_profit")
-    await bot.start(os.getenv("DISCORD_BOT_TOKEN"))
+async def main(shard_ids=None, shard_count=None, shared_prices=False):
+    # heavy imports happen here rather than at module level so they show up in the startup timings
+    with timer.phase("config"):
+        import config.settings  # noqa: F401
+    with timer.phase("imports"):
+        import discord
+        from bot.bot import MyBot
+
+    discord.utils.setup_logging()
+    bot = MyBot(timer=timer, shard_ids=shard_ids, shard_count=shard_count, shared_prices=shared_prices)
+    # setup_hook (price warmup, extensions, command sync) runs exactly once inside start()
+    async with bot:
+        await bot.start(os.getenv("DISCORD_BOT_TOKEN"))
+
+
+# Price fetcher process of the multi-process mode: fetches, persists and publishes prices
+async def fetch_prices():
+    import discord
+    from bot.bot import process_metrics
+    from bot.utils.margins import margin_scanner
+    from bot.utils.metrics import MetricsExporter
+    from bot.utils.shared_prices import run_fetcher
+    from bot.utils.snapshot_store import SnapshotStore
+    from config.settings import METRICS_LOOP_LAG_INTERVAL, METRICS_TEXTFILE_PATH, METRICS_WRITE_INTERVAL
+
+    discord.utils.setup_logging()
+    textfile_path, _ = process_metrics(METRICS_TEXTFILE_PATH, 0, "fetcher", 0)
+    exporter = MetricsExporter(textfile_path=textfile_path, write_interval=METRICS_WRITE_INTERVAL, loop_lag_interval=METRICS_LOOP_LAG_INTERVAL)
+    snapshots = SnapshotStore()
+    await exporter.start()
+    # keeps the saved item mapping fresh for the shard processes' /top_margins
+    mapping = asyncio.create_task(margin_scanner.keep_mapping(), name="item-mapping")
+    try:
+        await run_fetcher(snapshot_store=snapshots)
+    finally:
+        mapping.cancel()
+        await exporter.close()
+        snapshots.close()
+
+
+def run_shards(shard_ids, shard_count):
+    asyncio.run(main(shard_ids, shard_count, shared_prices=True))
+
+
+def run_fetcher():
+    asyncio.run(fetch_prices())
+
+
+# Starts the fetcher plus `processes` bot processes splitting `shard_count` shards between them
+def launch(processes, shard_count):
+    context = multiprocessing.get_context("spawn")
+    children = [context.Process(target=run_fetcher, name="price-fetcher")]
+    for number in range(processes):
+        shard_ids = list(range(number, shard_count, processes))
+        children.append(context.Process(target=run_shards, args=(shard_ids, shard_count), name=f"shards-{number}"))
+    for child in children:
+        child.start()
+    try:
+        for child in children:
+            child.join()
+    except KeyboardInterrupt:
+        for child in children:
+            child.terminate()
+
+
+def parse_shard_ids(text):
+    shard_ids = []
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        shard_ids.extend(range(int(first), int(last or first) + 1))
+    return shard_ids
+
 
 # checks to see if script is run directly
 if __name__ == "__main__":
-    import asyncio  # asyncio to allow for async code to be run
-    asyncio.run(main())  # running main as event loop
+    parser = argparse.ArgumentParser(description="Run the bot. Without options one process runs every shard.")
+    parser.add_argument("--processes", type=int, help="run a price fetcher plus this many bot processes sharing its prices")
+    parser.add_argument("--shard-count", type=int, help="total number of shards (default: --processes)")
+    parser.add_argument("--shard-ids", type=parse_shard_ids, help="run only these shards (e.g. 0-3 or 0,2) on shared prices")
+    parser.add_argument("--fetcher", action="store_true", help="run only the price fetcher of the multi-process mode")
+    args = parser.parse_args()
+
+    if args.fetcher:
+        run_fetcher()
+    elif args.processes:
+        launch(args.processes, args.shard_count or args.processes)
+    elif args.shard_ids is not None:
+        if args.shard_count is None:
+            parser.error("--shard-ids needs --shard-count")
+        run_shards(args.shard_ids, args.shard_count)
+    else:
+        asyncio.run(main())  # running main as event loop
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import random
+import time
+
+import pytest
+
+from benchmarks.price_server import PriceServer
+from bot.utils import api
+from bot.utils.api import MARKET_ENDPOINTS, PRICES_UNAVAILABLE, FilteredPayloadParser, PriceStore, snapshot_for
+from bot.utils.metrics import metrics
+
+
+def payload(rng, items=3000):
+    data = {}
+    for item_id in rng.sample(range(1, 30000), items):
+        item = {"high": rng.randint(1, 10**6), "highTime": rng.randint(10**9, 2 * 10**9), "low": None}
+        if rng.random() < 0.5:
+            item["low"] = rng.randint(1, 10**6)
+        data[str(item_id)] = item
+    return {"data": data, "timestamp": 1700000000}
+
+
+def parse(body, item_ids, rng):
+    parser = FilteredPayloadParser(item_ids)
+    position = 0
+    while position < len(body):
+        size = rng.randint(1, 4096)
+        parser.feed(body[position:position + size])
+        position += size
+    return parser.close(), parser
+
+
+@pytest.mark.parametrize("dumps", [
+    lambda value: json.dumps(value, separators=(",", ":")),
+    json.dumps,
+    lambda value: json.dumps(value, indent=2),
+], ids=["compact", "spaced", "indented"])
+def test_filtered_parser_matches_a_full_parse_at_any_chunk_boundary(dumps):
+    rng = random.Random(11)
+    full = payload(rng)
+    ids = [int(item_id) for item_id in rng.sample(sorted(full["data"]), 60)] + [99999, 7, 12345]
+    expected = {item_id: item for item_id, item in full["data"].items() if int(item_id) in ids}
+    body = dumps(full).encode()
+    for _ in range(20):
+        data, parser = parse(body, ids, rng)
+        assert data == expected
+        assert parser.timestamp == 1700000000
+        assert parser.size == len(body)
+
+
+def test_filtered_parser_rejects_payloads_without_data():
+    parser = FilteredPayloadParser([1, 2])
+    parser.feed(b'{"error": "rate limited"}')
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+def body(high):
+    return json.dumps({"data": {"249": {"high": high, "low": 90}, "199": {"high": 40, "low": 35}}}).encode()
+
+
+# Runs `test(server)` against a local PriceServer that the store's endpoints point at
+def with_server(monkeypatch, test):
+    async def run():
+        server = await PriceServer().start()
+        for endpoint in api.ENDPOINTS:
+            monkeypatch.setitem(api.ENDPOINTS, endpoint, f"{server.api_base}/{endpoint}")
+            server.set_body(endpoint, body(100))
+        try:
+            await test(server)
+        finally:
+            await server.stop()
+    asyncio.run(run())
+
+
+def test_concurrent_misses_share_one_request(monkeypatch):
+    async def test(server):
+        server.latency = 0.2
+        store = PriceStore(refresh_interval=0, full_parse=True)
+        snapshots = await asyncio.gather(*(store.get("latest") for _ in range(10)))
+        await store.close()
+        assert server.requests == 1
+        assert all(snapshot is snapshots[0] for snapshot in snapshots)
+    with_server(monkeypatch, test)
+
+
+def test_unchanged_prices_are_revalidated_with_the_etag(monkeypatch):
+    async def test(server):
+        store = PriceStore(refresh_interval=0, full_parse=True)
+        first = await store.refresh("latest")
+        assert first.etag
+        not_modified = metrics.counters_by("price_fetch_total", "status").get(304, 0)
+        second = await store.refresh("latest")
+        await store.close()
+        assert server.requests == 2
+        assert metrics.counters_by("price_fetch_total", "status").get(304, 0) == not_modified + 1
+        # the server answered 304, so the same table is kept under the same version
+        assert second.table is first.table
+        assert second.version == first.version
+        assert second.fetched_at >= first.fetched_at
+    with_server(monkeypatch, test)
+
+
+def test_stale_snapshot_is_served_while_it_is_refreshed(monkeypatch):
+    async def test(server):
+        store = PriceStore(refresh_interval=0, ttl=0, retry_after=0, full_parse=True)
+        first = await store.get("latest")
+        server.set_body("latest", body(150))
+        server.latency = 0.5
+        started = time.monotonic()
+        assert await store.get("latest") is first
+        assert time.monotonic() - started < 0.2
+        # the revalidation runs in the background and swaps in the new version
+        await store.refresh("latest")
+        await store.close()
+        updated = store.peek("latest")
+        assert updated.version == first.version + 1
+        assert updated.changed_since(first.version) == {249}
+        assert server.requests == 2
+    with_server(monkeypatch, test)
+
+
+def test_commands_parse_tracked_items_and_the_market_store_keeps_every_item(monkeypatch):
+    async def test(server):
+        server.set_body("latest", json.dumps({"data": {"249": {"high": 100}, "999999": {"high": 7}}}).encode())
+        prices = PriceStore(refresh_interval=0, interest={249})
+        market = PriceStore(refresh_interval=0, full_parse=True, endpoints=MARKET_ENDPOINTS, label="market")
+        commands = await prices.get("latest")
+        everything = await market.get("latest")
+        with pytest.raises(ValueError):
+            await market.get("5m")
+        await prices.close()
+        await market.close()
+        rows = [commands.table.index.resolve(249), commands.table.index.resolve(999999)]
+        assert commands.table.gather("high", rows)[1].tolist() == [True, False]
+        assert everything.table.gather("high", rows)[1].tolist() == [True, True]
+        assert metrics.counters_by("price_fetch_total", "endpoint").get("market_latest")
+    with_server(monkeypatch, test)
+
+
+class Response:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, content, ephemeral=False):
+        self.sent.append((content, ephemeral))
+
+
+class Interaction:
+    def __init__(self):
+        self.response = Response()
+
+
+def test_commands_reply_when_no_prices_can_be_fetched(monkeypatch):
+    async def test(server):
+        server.fail_next = 1
+        store = PriceStore(refresh_interval=0, full_parse=True)
+        interaction = Interaction()
+        assert await snapshot_for(interaction, store, "latest") is None
+        assert interaction.response.sent == [(PRICES_UNAVAILABLE, True)]
+        # the next command fetches again and gets an answer
+        assert (await snapshot_for(Interaction(), store, "latest")).version == 0
+        await store.close()
+    with_server(monkeypatch, test)
+
+
+def test_refresh_loop_outlives_unexpected_errors():
+    async def run():
+        store = PriceStore(refresh_interval=0.01, full_parse=True)
+        calls = []
+
+        async def refresh(endpoint):
+            calls.append(endpoint)
+            raise RuntimeError("boom")
+        store.refresh = refresh
+        await store.start()
+        await asyncio.sleep(0.1)
+        assert not store._refresher.done()
+        await store.close()
+        assert len(calls) > len(api.ENDPOINTS)
+    asyncio.run(run())
@@ -0,0 +1,97 @@
+import json
+import random
+
+import pytest
+
+import batch
+from bot.utils.calculations import calculate_custom_profit, calculate_fish_profit
+from data.items import fish, herbs
+
+
+def random_payload(rng):
+    data = {}
+    for info in herbs.values():
+        for item_id in (info["seed_id"], info["herb_id"]):
+            if rng.random() < 0.9:
+                data[str(item_id)] = {"high": rng.randint(1, 200_000)}
+    for info in fish.values():
+        for item_id in (info["raw_id"], info["cooked_id"]):
+            data[str(item_id)] = {"high": rng.randint(1, 5_000)}
+    return data
+
+
+def test_setups_are_typed_and_defaulted():
+    records = [
+        {"id": "main", "farming_level": "99", "patches": "9", "weiss": "yes", "fortis": "1", "compost": "Ultracompost", "kandarin_diary": "15%", "attas": "true"},
+        {"farming_level": 50, "patches": 4, "kandarin_diary": 0.1},
+        {"name": "alt", "farming_level": "70", "patches": "5", "kandarin_diary": "5", "kourend": ""},
+    ]
+    setups = list(batch.parse_setups(records, "herbs"))
+    assert setups[0] == {
+        "setup": "main", "farming_level": 99, "patches": 9, "weiss": True, "trollheim": False, "hosidius": False, "fortis": True,
+        "compost": "Ultracompost", "kandarin_diary": 0.15, "kourend": False, "magic_secateurs": False, "farming_cape": False, "attas": True,
+    }
+    assert setups[1]["setup"] == 2 and setups[1]["kandarin_diary"] == 0.1 and setups[1]["compost"] == "None"
+    assert setups[2]["setup"] == "alt" and setups[2]["kandarin_diary"] == 0.05 and setups[2]["kourend"] is False
+    assert list(batch.parse_setups([{}], "fish")) == [{"setup": 1, "cooking_rate": 1435}]
+
+
+@pytest.mark.parametrize("record, message", [
+    ({"patches": 9}, "setup 2: farming_level: missing"),
+    ({"farming_level": 99, "patches": 9, "kandarin_diary": "20%"}, "setup 2: kandarin_diary: must be None, 5%, 10% or 15%"),
+    ({"farming_level": 99, "patches": 9, "kandarin_diary": "elite"}, "setup 2: kandarin_diary: must be None, 5%, 10% or 15%"),
+    ({"farming_level": 99, "patches": 9, "weiss": "maybe"}, "setup 2: weiss: not a true/false value"),
+    ({"farming_level": 99, "patches": 9, "compost": "Bonemeal"}, "setup 2: compost: compost must be one of"),
+    ({"farming_level": 99, "patches": 1, "weiss": True, "hosidius": True}, "setup 2: patches: 1 is less than its 2 disease-free patches"),
+])
+def test_bad_setups_stop_the_run_with_their_number(record, message):
+    records = [{"farming_level": 99, "patches": 9}, record]
+    with pytest.raises(SystemExit, match=message):
+        list(batch.parse_setups(records, "herbs"))
+
+
+def expected_herbs(payload, setup, top):
+    rows = calculate_custom_profit(
+        payload, herbs, setup["farming_level"], setup["patches"], setup["weiss"], setup["trollheim"], setup["hosidius"],
+        setup["fortis"], setup["compost"], f"{setup['kandarin_diary'] * 100:g}%", setup["kourend"], setup["magic_secateurs"],
+        setup["farming_cape"], False, setup["attas"], "high")
+    rows = sorted(rows, key=lambda row: row["Profit per Run"], reverse=True)[:top]
+    return [dict(row, setup=setup["setup"], rank=rank) for rank, row in enumerate(rows, start=1)]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_process_ranks_every_setup_like_the_commands(workers):
+    rng = random.Random(workers)
+    payload = random_payload(rng)
+    records = []
+    for _ in range(25):
+        protected = [rng.random() < 0.5 for _ in range(4)]
+        records.append({
+            "farming_level": rng.randint(1, 99), "patches": rng.randint(sum(protected), 12), "weiss": protected[0],
+            "trollheim": protected[1], "hosidius": protected[2], "fortis": protected[3], "compost": rng.choice(list(batch.COMPOST_LIFE)),
+            "kandarin_diary": rng.choice(["None", "5%", "10%", "15%"]), "kourend": rng.random() < 0.5,
+            "magic_secateurs": rng.random() < 0.5, "farming_cape": rng.random() < 0.5, "attas": rng.random() < 0.5,
+        })
+    setups = list(batch.parse_setups(records, "herbs"))
+    chunks = list(batch.process("herbs", iter(setups), payload, "high", workers, 4, 3))
+    assert [processed for processed, _ in chunks] == [4] * 6 + [1]
+    rows = [row for _, chunk in chunks for row in chunk]
+    assert rows == [row for setup in setups for row in expected_herbs(payload, setup, 3)]
+
+    fish_setups = list(batch.parse_setups([{"cooking_rate": 1000}, {}], "fish"))
+    rows = [row for _, chunk in batch.process("fish", fish_setups, payload, "high", workers, 1, 2) for row in chunk]
+    for setup in fish_setups:
+        expected = sorted(calculate_fish_profit(payload, fish, "high", setup["cooking_rate"]), key=lambda row: row["GP/hr"], reverse=True)[:2]
+        assert [row for row in rows if row["setup"] == setup["setup"]] == [dict(setup=setup["setup"], rank=rank, **row) for rank, row in enumerate(expected, start=1)]
+
+
+def test_main_writes_ranked_rows(tmp_path, capsys):
+    prices = tmp_path / "prices.json"
+    prices.write_text(json.dumps({"data": random_payload(random.Random(9))}))
+    setups = tmp_path / "setups.csv"
+    setups.write_text("id,farming_level,patches,weiss,kandarin_diary\nfirst,99,9,yes,15%\nsecond,40,3,,\n")
+    output = tmp_path / "ranked.jsonl"
+    batch.main(["herbs", str(setups), "--prices", str(prices), "--output", str(output), "--workers", "1", "--top", "2"])
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [(row["setup"], row["rank"]) for row in rows] == [("first", 1), ("first", 2), ("second", 1), ("second", 2)]
+    assert "2 setups -> 4 rows" in capsys.readouterr().err
@@ -0,0 +1,61 @@
+from bot.utils import cache as cache_module
+from bot.utils.api import PriceSnapshot
+from bot.utils.cache import LRUCache
+from bot.utils.derived import DerivedTable, _herb_params, _herb_rows
+from bot.utils.price_table import PriceTable
+from data.items import herbs
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    cache = LRUCache(maxsize=3, max_age=60)
+    for key in "abc":
+        cache.put(key, key.upper())
+    assert cache.get("a") == "A"
+    cache.put("d", "D")
+    assert list(cache) == ["c", "a", "d"]
+    assert cache.get("b") is None
+    # peek reads without refreshing recency or counting a lookup
+    assert cache.peek("c") == "C"
+    cache.put("e", "E")
+    assert "c" not in list(cache)
+    assert cache.stats == {"size": 3, "maxsize": 3, "hits": 1, "misses": 1, "hit_rate": 0.5, "evictions": 2, "expirations": 0}
+
+
+def test_entries_expire_after_max_age(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    cache = LRUCache(maxsize=3, max_age=10)
+    cache.put("a", 1)
+    now[0] += 10
+    assert cache.get("a") == 1
+    now[0] += 10.5
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.expirations == 1
+
+
+def test_rows_are_cached_per_snapshot_version_and_normalized_setup():
+    computed = []
+
+    def compute(prices, items, price_key, *setup):
+        computed.append(len(items))
+        return _herb_rows(prices, items, price_key, *setup)
+    table = DerivedTable(herbs, lambda info: (info["seed_id"], info["herb_id"]), compute, "Herb", normalize=_herb_params)
+    data = {str(info[field]): {"high": 1000 + number} for number, info in enumerate(herbs.values()) for field in ("seed_id", "herb_id")}
+    snapshot = PriceSnapshot("latest", PriceTable.from_payload(data), 0.0, version=3)
+
+    setup = [80, 8, True, True, False, False, "Ultracompost", "15%", True, True, False, False, True]
+    rows = table.rows(snapshot, "high", *setup)
+    # "15" is the same diary as "15%", and the bottomless bucket doesn't change yields
+    same = setup[:7] + ["15"] + setup[8:11] + [True, True]
+    assert table.rows(snapshot, "high", *same) is rows
+    assert len(computed) == 1
+    # another price key or endpoint is another entry
+    table.rows(snapshot, "low", *setup)
+    assert len(computed) == 2
+    assert len(table.cache) == 2
+    # a newer version with no deltas to patch from is recomputed in full
+    newer = PriceSnapshot("latest", snapshot.table, 0.0, version=4)
+    table.rows(newer, "high", *setup)
+    assert computed[-1] == len(herbs)
+    assert len(computed) == 3
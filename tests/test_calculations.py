@@ -0,0 +1,128 @@
+import random
+
+import numpy as np
+import pytest
+
+from bot.utils.calculations import (
+    COMPOST_LIFE, HerbSetups, calculate_batch_profit, calculate_custom_profit, herb_yield_batch, optimize_herb_setup,
+    simulate_herb_yields,
+)
+from bot.utils.helpers import generate_estimated_yield
+from data.items import compost, herbs
+
+
+# The herb-by-herb loop calculate_custom_profit used before the batch engine, kept as the reference
+def scalar_custom_profit(prices, herbs, farming_level, patches, weiss, trollheim, hosidius, fortis, compost, kandarin_diary, kourend, magic_secateurs, farming_cape, attas, price_key):
+    item_bonus = 0.1 if magic_secateurs else 0
+    item_bonus += 0.05 if farming_cape else 0
+    kandarin_bonus = float(kandarin_diary.split('%')[0]) / 100 if kandarin_diary != 'None' else 0
+    kourend_bonus = 0.05 if kourend else 0
+    diary_bonus = kandarin_bonus + kourend_bonus
+    attas_bonus = 0.05 if attas else 0
+    protected_patches = weiss + trollheim + hosidius + fortis
+    unprotected_patches = patches - protected_patches
+    harvest_lives = 3 + COMPOST_LIFE.get(compost, 0)
+
+    results = []
+    for herb, info in herbs.items():
+        seed = prices.get(str(info["seed_id"]), {}).get(price_key)
+        herb_price = prices.get(str(info["herb_id"]), {}).get(price_key)
+        if seed is None or herb_price is None:
+            continue
+        expected_yield_unprotected = generate_estimated_yield(
+            farming_level, info["lowCTS"], 80, harvest_lives, item_bonus, diary_bonus, attas_bonus)
+        total_yield_protected = 0
+        for _ in range(protected_patches):
+            bonus = kourend_bonus if hosidius and kourend else kandarin_bonus
+            total_yield_protected += generate_estimated_yield(
+                farming_level, info["lowCTS"], 80, harvest_lives, item_bonus, bonus, attas_bonus)
+        total_yield = expected_yield_unprotected * unprotected_patches + total_yield_protected
+        results.append((herb, seed, herb_price, (herb_price * total_yield) - (seed * patches)))
+    return results
+
+
+def random_prices(rng):
+    prices = {}
+    for info in herbs.values():
+        for item_id in (info["seed_id"], info["herb_id"]):
+            if rng.random() < 0.9:
+                prices[str(item_id)] = {"high": rng.randint(1, 200_000), "low": rng.randint(1, 200_000)}
+    return prices
+
+
+def random_setup(rng):
+    protected = [rng.random() < 0.5 for _ in range(4)]
+    return (
+        rng.randint(1, 99), rng.randint(sum(protected), 12), *protected, rng.choice(list(COMPOST_LIFE)),
+        rng.choice(["None", "5%", "10%", "15%"]), rng.random() < 0.5, rng.random() < 0.5, rng.random() < 0.5,
+        rng.random() < 0.5,
+    )
+
+
+def test_custom_profit_is_bit_identical_to_the_scalar_loop():
+    rng = random.Random(5)
+    for _ in range(300):
+        prices = random_prices(rng)
+        setup = random_setup(rng)
+        (farming_level, patches, weiss, trollheim, hosidius, fortis, compost, kandarin_diary, kourend,
+         magic_secateurs, farming_cape, attas) = setup
+        rows = calculate_custom_profit(
+            prices, herbs, farming_level, patches, weiss, trollheim, hosidius, fortis, compost, kandarin_diary,
+            kourend, magic_secateurs, farming_cape, False, attas, "high")
+        expected = scalar_custom_profit(prices, herbs, *setup, "high")
+        assert [(row["Herb"], row["Seed Price"], row["Grimy Herb Price"], row["Profit per Run"]) for row in rows] == expected
+
+
+def test_batch_profit_matches_single_setups():
+    rng = random.Random(7)
+    prices = random_prices(rng)
+    setups = [random_setup(rng) for _ in range(50)]
+    batch = calculate_batch_profit(prices, herbs, HerbSetups(*(list(column) for column in zip(*setups))), "high")
+    for position, setup in enumerate(setups):
+        single = calculate_batch_profit(prices, herbs, HerbSetups(*setup), "high")[0]
+        np.testing.assert_array_equal(batch[position], single)
+
+
+def test_simulated_yields_average_to_the_expected_yield():
+    setups = HerbSetups(75, 8, True, True, True, False, "Supercompost", "10%", True, True, False, True)
+    low_cts = [info["lowCTS"] for info in herbs.values()]
+    yields = simulate_herb_yields(setups, low_cts, 50_000, np.random.default_rng(0))
+    assert yields.shape == (50_000, len(low_cts))
+    np.testing.assert_allclose(yields.mean(axis=0), herb_yield_batch(setups, low_cts)[0], rtol=0.01)
+
+
+def test_simulation_rejects_more_disease_free_than_total_patches():
+    setups = HerbSetups(99, 2, True, True, True, True, "None", "None", False, False, False, False)
+    with pytest.raises(ValueError):
+        simulate_herb_yields(setups, [25], 10)
+
+
+def test_optimizer_ranks_every_compost_and_attas_choice():
+    rng = random.Random(9)
+    for _ in range(20):
+        prices = random_prices(rng)
+        for info in compost.values():
+            prices[str(info["item_id"])] = {"high": rng.randint(1, 20_000)}
+        farming_level, patches, weiss, trollheim, hosidius, fortis, _, kandarin_diary, kourend, magic_secateurs, farming_cape, attas = random_setup(rng)
+        expected = []
+        for compost_name in ["None"] + list(compost):
+            cost = prices[str(compost[compost_name]["item_id"])]["high"] if compost_name in compost else 0
+            for planted in ([False, True] if attas else [False]):
+                rows = calculate_custom_profit(
+                    prices, herbs, farming_level, patches, weiss, trollheim, hosidius, fortis, compost_name, kandarin_diary,
+                    kourend, magic_secateurs, farming_cape, False, planted, "high")
+                expected += [(row["Profit per Run"] - cost * patches, row["Herb"], compost_name, planted) for row in rows]
+        expected.sort(key=lambda row: -row[0])
+
+        best = optimize_herb_setup(
+            prices, herbs, compost, farming_level, patches, weiss, trollheim, hosidius, fortis, kandarin_diary, kourend,
+            magic_secateurs, farming_cape, attas, "high", top_k=5)
+        assert len(best) == min(5, len(expected))
+        np.testing.assert_allclose([row["Profit per Run"] for row in best], [row[0] for row in expected[:5]])
+        for row in best:
+            assert (row["Herb"], row["Compost"], row["Attas"]) in {entry[1:] for entry in expected}
+
+
+def test_optimizer_rejects_more_disease_free_than_total_patches():
+    with pytest.raises(ValueError):
+        optimize_herb_setup({}, herbs, compost, 99, 3, True, True, True, True, "None", False, False, False, False, "high")
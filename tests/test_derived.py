@@ -0,0 +1,83 @@
+import random
+
+from bot.utils.api import PriceSnapshot, diff_snapshots
+from bot.utils.derived import DerivedTable, _herb_params, _herb_rows
+from bot.utils.price_table import PriceTable
+from data.items import herbs
+
+SETUP = (80, 8, True, True, False, False, "Ultracompost", "10%", True, True, False, False, True)
+
+
+def random_data(rng):
+    data = {}
+    for info in herbs.values():
+        for item_id in (info["seed_id"], info["herb_id"]):
+            data[str(item_id)] = {"high": rng.randint(1, 200_000), "low": rng.randint(1, 200_000)}
+    return data
+
+
+# The next snapshot of an endpoint, versioned and diffed the way PriceStore does it
+def next_snapshot(previous, data):
+    table = PriceTable.from_payload(data)
+    if previous is None:
+        return PriceSnapshot("latest", table, 0.0)
+    delta = diff_snapshots(previous.table, table, previous.version + 1)
+    return PriceSnapshot("latest", table, 0.0, delta.version, previous.deltas + (delta,))
+
+
+def herb_table(computed):
+    def compute(prices, items, price_key, *setup):
+        computed.append(set(items))
+        return _herb_rows(prices, items, price_key, *setup)
+    return DerivedTable(herbs, lambda info: (info["seed_id"], info["herb_id"]), compute, "Herb", normalize=_herb_params)
+
+
+def test_deltas_list_the_changed_items():
+    rng = random.Random(1)
+    data = random_data(rng)
+    first = next_snapshot(None, data)
+    herb = next(iter(herbs.values()))
+    data = dict(data, **{str(herb["herb_id"]): {"high": 1, "low": 1}})
+    second = next_snapshot(first, data)
+    assert second.changed_since(first.version) == {herb["herb_id"]}
+    assert second.changed_since(second.version) == set()
+    # versions older than the deltas kept can't be patched
+    assert second.changed_since(first.version - 1) is None
+
+
+def test_only_rows_whose_inputs_moved_are_recomputed():
+    rng = random.Random(4)
+    computed = []
+    table = herb_table(computed)
+    data = random_data(rng)
+    snapshot = next_snapshot(None, data)
+    table.rows(snapshot, "high", *SETUP)
+    assert computed == [set(herbs)]
+
+    for _ in range(10):
+        moved = rng.sample(sorted(herbs), 2)
+        for name in moved:
+            data[str(herbs[name]["seed_id"])] = {"high": rng.randint(1, 200_000), "low": 1}
+        snapshot = next_snapshot(snapshot, data)
+        computed.clear()
+        rows = table.rows(snapshot, "high", *SETUP)
+        assert computed == [set(moved)]
+        # patched rows are the same as a full recompute against the new snapshot
+        assert rows == _herb_rows(snapshot.table, herbs, "high", *_herb_params(*SETUP))
+    assert table.patched == 10
+
+
+def test_entries_too_old_to_patch_are_rebuilt():
+    rng = random.Random(6)
+    computed = []
+    table = herb_table(computed)
+    snapshot = next_snapshot(None, random_data(rng))
+    table.rows(snapshot, "high", *SETUP)
+    # a snapshot whose deltas don't reach back to the cached version
+    rebuilt = PriceSnapshot("latest", PriceTable.from_payload(random_data(rng)), 0.0, snapshot.version + 5)
+    table.on_snapshot(rebuilt)
+    assert len(table.cache) == 0
+    computed.clear()
+    table.rows(rebuilt, "high", *SETUP)
+    assert computed == [set(herbs)]
+    assert table.patched == 0
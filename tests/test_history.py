@@ -0,0 +1,82 @@
+import numpy as np
+
+from bot.utils.history import PriceHistory
+from data.items import herbs
+
+
+def brute_force(prices, volumes):
+    valid = ~np.isnan(prices)
+    stats = {"count": valid.sum(axis=1), "mean": [], "std": [], "min": [], "max": [], "vwap": []}
+    for row_prices, row_volumes, row_valid in zip(prices, volumes, valid):
+        values = row_prices[row_valid]
+        stats["mean"].append(values.mean() if len(values) else np.nan)
+        stats["std"].append(values.std(ddof=1) if len(values) > 1 else np.nan)
+        stats["min"].append(values.min() if len(values) else np.nan)
+        stats["max"].append(values.max() if len(values) else np.nan)
+        volume = row_volumes[row_valid].sum()
+        stats["vwap"].append((values * row_volumes[row_valid]).sum() / volume if volume > 0 else np.nan)
+    return stats
+
+
+def test_rolling_stats_match_a_recompute_of_the_window():
+    rng = np.random.default_rng(2)
+    item_ids = [info["herb_id"] for info in herbs.values()]
+    window = 16
+    history = PriceHistory(item_ids, window=window)
+    all_prices = []
+    all_volumes = []
+    for step in range(5 * window + 3):
+        prices = rng.uniform(100, 10_000, len(item_ids))
+        prices[rng.random(len(item_ids)) < 0.2] = np.nan
+        prices[0] = np.nan  # an item that never trades
+        volumes = rng.integers(0, 500, len(item_ids)).astype(float)
+        history.append(1_000_000 + step * 300, prices, volumes)
+        all_prices.append(prices)
+        all_volumes.append(volumes)
+
+        expected = brute_force(np.array(all_prices[-window:]).T, np.array(all_volumes[-window:]).T)
+        np.testing.assert_array_equal(history.count, expected["count"])
+        mean = np.where(history.count > 0, history.mean, np.nan)
+        np.testing.assert_allclose(mean, expected["mean"], rtol=1e-9)
+        np.testing.assert_allclose(history.std, expected["std"], rtol=1e-6)
+        np.testing.assert_array_equal(history.minimum, expected["min"])
+        np.testing.assert_array_equal(history.maximum, expected["max"])
+        np.testing.assert_allclose(history.vwap, expected["vwap"], rtol=1e-9)
+
+
+def test_summary_of_untracked_and_never_traded_items():
+    history = PriceHistory([info["herb_id"] for info in herbs.values()], window=4)
+    assert history.summary(-1) is None
+    summary = history.summary(next(iter(herbs.values()))["herb_id"])
+    assert summary["samples"] == 0
+    assert summary["mean"] is None
+
+
+def test_summary_matches_the_window_it_summarizes():
+    rng = np.random.default_rng(8)
+    item_ids = [info["herb_id"] for info in herbs.values()]
+    window = 12
+    history = PriceHistory(item_ids, window=window)
+    all_prices = []
+    for step in range(4 * window + 5):
+        prices = rng.uniform(100, 10_000, len(item_ids))
+        # sparse traders whose first and last trades keep dropping out of the window
+        prices[rng.random(len(item_ids)) < 0.7] = np.nan
+        history.append(1_000_000 + step * 300, prices, rng.integers(1, 500, len(item_ids)).astype(float))
+        all_prices.append(prices)
+
+        window_prices = np.array(all_prices[-window:]).T
+        for row, item_id in enumerate(item_ids):
+            traded = window_prices[row][~np.isnan(window_prices[row])]
+            summary = history.summary(item_id)
+            assert summary["samples"] == len(traded)
+            if not len(traded):
+                assert summary["last"] is None and summary["change"] is None and summary["min"] is None
+                continue
+            assert summary["last"] == traded[-1]
+            assert summary["change"] == (traded[-1] - traded[0]) / traded[0]
+            assert summary["min"] == traded.min() and summary["max"] == traded.max()
+            np.testing.assert_allclose(summary["mean"], traded.mean(), rtol=1e-9)
+            if len(traded) > 1:
+                np.testing.assert_allclose(summary["std"], traded.std(ddof=1), rtol=1e-6)
+                np.testing.assert_allclose(summary["volatility"], history.volatility_of(item_id), rtol=1e-12)
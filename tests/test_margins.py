@@ -0,0 +1,54 @@
+import random
+
+import numpy as np
+import pytest
+
+from bot.utils.api import PriceSnapshot
+from bot.utils.margins import SORTS, MarginScanner, MarginTable, ge_tax
+from bot.utils.price_table import PriceTable
+
+
+def test_ge_tax_is_two_percent_rounded_down_capped_and_free_below_50():
+    prices = np.array([1, 49, 50, 99, 100, 12_345, 249_999_999, 250_000_000, 2_147_483_647], dtype=float)
+    assert ge_tax(prices).tolist() == [0, 0, 1, 1, 2, 246, 4_999_999, 5_000_000, 5_000_000]
+
+
+def random_table(rng, size=500):
+    buy = np.array([rng.randint(1, 10**7) for _ in range(size)], dtype=float)
+    sell = np.maximum(buy + np.array([rng.randint(-10**5, 10**5) for _ in range(size)]), 1)
+    volume = np.array([rng.choice([0, rng.randint(0, 10**4)]) for _ in range(size)], dtype=float)
+    limit = np.array([rng.choice([0, 100, 5000, 25_000]) for _ in range(size)], dtype=float)
+    item_ids = np.arange(1, size + 1, dtype=np.int64)
+    return MarginTable(1, item_ids, buy, sell, volume, limit, {})
+
+
+@pytest.mark.parametrize("sort", SORTS)
+def test_top_matches_a_sorted_scan_of_every_candidate(sort):
+    rng = random.Random(sort)
+    table = random_table(rng)
+    for count, min_volume, min_limit in [(10, 0, 0), (5, 100, 0), (20, 1000, 5000), (700, 0, 0)]:
+        expected = []
+        for position in range(len(table)):
+            row = table.row(position)
+            key = {"margin": row["Margin"], "roi": row["ROI"], "limit_profit": row["Limit Profit"]}[sort]
+            if row["Margin"] > 0 and row["Volume"] >= min_volume and (row["Limit"] or 0) >= min_limit and key is not None and np.isfinite(key):
+                expected.append((key, position))
+        expected.sort(reverse=True)
+        rows = table.top(sort, count, min_volume, min_limit)
+        assert rows == [table.row(position) for _, position in expected[:count]]
+
+
+def test_scanner_skips_stale_prices_and_uses_the_hourly_volume():
+    data = {
+        "1": {"high": 1000, "low": 900, "highTime": 10_000, "lowTime": 10_000},
+        "2": {"high": 5000, "low": 4000, "highTime": 10_000, "lowTime": 10_000 - 7200},
+        "3": {"high": 100, "low": 90, "highTime": 9_000, "lowTime": 9_500},
+    }
+    scanner = MarginScanner(max_price_age=3600)
+    scanner.set_mapping([{"id": 1, "name": "One", "limit": 70}, {"id": 3, "name": "Three"}])
+    scanner.on_snapshot(PriceSnapshot("1h", PriceTable.from_payload({"1": {"highPriceVolume": 30, "lowPriceVolume": 20}}), 0.0))
+    scanner.on_snapshot(PriceSnapshot("latest", PriceTable.from_payload(data), 0.0))
+    rows = scanner.top("margin", 10, min_volume=0)
+    assert [row["Item"] for row in rows] == ["One", "Three"]
+    assert rows[0] == {"Item": "One", "Buy": 900, "Sell": 1000, "Tax": 20, "Margin": 80, "ROI": 80 / 900, "Volume": 50, "Limit": 70, "Limit Profit": 5600}
+    assert scanner.top("margin", 10, min_volume=40) == rows[:1]
@@ -0,0 +1,92 @@
+import random
+
+import numpy as np
+
+from bot.commands.recipes import RecipeCommands
+from bot.utils.api import PriceSnapshot, diff_snapshots
+from bot.utils.calculations import HerbSetups, calculate_custom_profit, calculate_fish_profit
+from bot.utils.price_table import PriceTable
+from bot.utils.recipes import RecipeBook
+from data.items import fish, herbs, recipe_groups, recipes
+
+
+def random_data(rng):
+    data = {}
+    for recipe in recipes.values():
+        for item_id in (*recipe["inputs"], *recipe["outputs"]):
+            if rng.random() < 0.95:
+                data[str(item_id)] = {"high": rng.randint(1, 200_000)}
+    return data
+
+
+def next_snapshot(previous, data):
+    table = PriceTable.from_payload(data)
+    if previous is None:
+        return PriceSnapshot("latest", table, 0.0)
+    delta = diff_snapshots(previous.table, table, previous.version + 1)
+    return PriceSnapshot("latest", table, 0.0, delta.version, previous.deltas + (delta,))
+
+
+def test_fish_recipes_match_the_fish_calculation():
+    rng = random.Random(2)
+    data = random_data(rng)
+    rows = RecipeBook(recipes).compute(PriceTable.from_payload(data), "high").rows("fish", "Fish")
+    expected = calculate_fish_profit(data, fish, "high")
+    assert [row["Fish"] for row in rows] == [row["Fish"] for row in expected]
+    for row, reference in zip(rows, expected):
+        assert (row["Input Cost"], row["Output Value"], row["Profit"], row["GP/hr"]) == (
+            reference["Raw Price"], reference["Cooked Price"], reference["Profit"], reference["GP/hr"])
+        assert row["XP/hr"] == reference["XP/hr"]
+
+
+def test_herb_runs_need_a_setup_and_match_the_herb_calculation():
+    rng = random.Random(3)
+    data = random_data(rng)
+    table = PriceTable.from_payload(data)
+    book = RecipeBook(recipes)
+    assert book.compute(table, "high").rows("herb_runs") == []
+
+    setup = (85, 9, True, False, True, False, "Ultracompost", "10%", True, True, False, True)
+    rows = book.compute(table, "high", {"herb": HerbSetups(*setup)}).rows("herb_runs")
+    expected = calculate_custom_profit(data, herbs, *setup[:11], False, setup[11], "high")
+    assert [row["Recipe"] for row in rows] == [f"{row['Herb']} run" for row in expected]
+    np.testing.assert_allclose([row["Profit"] for row in rows], [row["Profit per Run"] for row in expected], rtol=1e-12)
+
+
+def test_new_versions_only_recompute_the_recipes_whose_items_changed():
+    rng = random.Random(4)
+    book = RecipeBook(recipes)
+    data = random_data(rng)
+    snapshot = next_snapshot(None, data)
+    book.evaluate(snapshot, "high")
+    for _ in range(5):
+        for item_id in rng.sample(sorted(data), 3):
+            data[item_id] = {"high": rng.randint(1, 200_000)}
+        data.pop(rng.choice(sorted(data)))
+        snapshot = next_snapshot(snapshot, data)
+        patched = book.evaluate(snapshot, "high")
+        full = book.compute(snapshot.table, "high")
+        np.testing.assert_array_equal(patched.valid, full.valid)
+        np.testing.assert_array_equal(patched.cost[full.valid], full.cost[full.valid])
+        np.testing.assert_array_equal(patched.value[full.valid], full.value[full.valid])
+        assert patched.rows() == full.rows()
+    assert book.patched == 5
+
+
+class Bot:
+    tree = None
+
+
+def test_generated_commands_render_their_group():
+    cog = RecipeCommands(Bot())
+    assert sorted(command.name for command in cog.generated) == sorted(group["command"] for group in recipe_groups.values())
+
+    data = {str(item_id): {"high": 1000} for recipe in recipes.values() for item_id in (*recipe["inputs"], *recipe["outputs"])}
+    snapshot = PriceSnapshot("latest", PriceTable.from_payload(data), 0.0)
+    table, fields = cog.render("fish", recipe_groups["fish"], snapshot, "high")
+    assert table.startswith("```Fish") and "Raw Price" in table
+    # fractional XP/hr is kept (Manta Ray: 1435 * 216.3)
+    manta = dict(fields)["Manta Ray"]
+    assert "**XP/hr:** 310390.5\n" in manta
+    assert "**GP/hr:** 0\n" in manta
+    assert cog.render("fish", recipe_groups["fish"], snapshot, "high") == (table, fields)
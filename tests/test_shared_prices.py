@@ -0,0 +1,59 @@
+import numpy as np
+
+from bot.utils.api import PriceSnapshot
+from bot.utils.price_table import PriceTable
+from bot.utils.shared_prices import SharedPriceReader, SharedPriceWriter
+from data.items import herbs
+
+
+def snapshot(fetched_at, offset=0):
+    data = {}
+    for number, info in enumerate(herbs.values()):
+        data[str(info["seed_id"])] = {"high": 1000 + number + offset, "low": None, "highTime": 1700000000 + number}
+        data[str(info["herb_id"])] = {"high": 50 + number + offset, "low": 40 + number}
+    return PriceSnapshot("latest", PriceTable.from_payload(data), fetched_at, timestamp=1700000000)
+
+
+def assert_same_table(shared, table):
+    assert set(shared.columns) == set(table.columns)
+    for field, column in table.columns.items():
+        present = table.present[field]
+        np.testing.assert_array_equal(shared.present[field][:table.size], present[:table.size])
+        np.testing.assert_array_equal(shared.columns[field][:table.size][present[:table.size]], column[:table.size][present[:table.size]])
+
+
+def test_writer_and_reader_round_trip(tmp_path):
+    path = str(tmp_path / "shared_prices.latest")
+    writer = SharedPriceWriter(path, capacity=4096, slots=3)
+    reader = SharedPriceReader(path)
+    assert reader.header() is None
+
+    first = snapshot(100.0)
+    writer.publish(first)
+    header = reader.header()
+    assert int(header["version"]) == 1
+    assert float(header["fetched_at"]) == 100.0
+    assert int(header["timestamp"]) == 1700000000
+    first_table = reader.table(header)
+    assert_same_table(first_table, first.table)
+
+    # an unchanged table only refreshes the fetch time
+    writer.publish(PriceSnapshot("latest", first.table, 160.0))
+    header = reader.header()
+    assert int(header["version"]) == 1
+    assert float(header["fetched_at"]) == 160.0
+
+    second = snapshot(220.0, offset=7)
+    writer.publish(second)
+    header = reader.header()
+    assert int(header["version"]) == 2
+    assert_same_table(reader.table(header), second.table)
+    # the previous table lives in another slot and is still intact
+    assert_same_table(first_table, first.table)
+
+    # a restarted writer reuses the file and keeps counting versions
+    writer.close()
+    writer = SharedPriceWriter(path, capacity=4096, slots=3)
+    assert writer.version == 2
+    writer.close()
+    reader.close()
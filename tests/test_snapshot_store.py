@@ -0,0 +1,61 @@
+import asyncio
+
+from bot.utils.api import PriceStore
+from bot.utils.snapshot_store import SnapshotStore
+
+NOW = 1_700_000_000.0
+
+
+def data(high):
+    return {"249": {"high": high, "low": None}}
+
+
+def test_load_latest_returns_the_newest_payload_at_or_before(tmp_path):
+    store = SnapshotStore(str(tmp_path / "prices.sqlite3"))
+    assert store.load_latest("latest") is None
+    store.save("latest", data(1), NOW - 120, etag='"a"', last_modified="Mon")
+    store.save("latest", data(2), NOW - 60, etag='"b"')
+    store.save("1h", data(3), NOW)
+    assert store.load_latest("latest") == (data(2), NOW - 60, '"b"', None)
+    assert store.load_latest("latest", before=NOW - 90) == (data(1), NOW - 120, '"a"', "Mon")
+    assert store.load_latest("latest", before=NOW - 200) is None
+    store.close()
+
+    # a reopened store still has everything
+    store = SnapshotStore(str(tmp_path / "prices.sqlite3"))
+    assert store.load_latest("1h")[0] == data(3)
+    store.close()
+
+
+def test_prune_thins_old_snapshots_to_one_per_hour_and_drops_expired_ones():
+    store = SnapshotStore(":memory:")
+    hour = 3600
+    # one snapshot every 10 minutes for the last 4 hours (hour-aligned so the buckets are exact)
+    now = (NOW // hour) * hour
+    times = [now - minutes * 60 for minutes in range(4 * 60 - 10, -10, -10)]
+    store.save("latest", data(0), now - 3 * 86400)
+    for fetched_at in times:
+        store.save("latest", data(int(fetched_at)), fetched_at)
+
+    removed = store.prune(retention_days=2, full_resolution_hours=1, now=now)
+    kept = [row[0] for row in store._db.execute("SELECT fetched_at FROM snapshots ORDER BY fetched_at")]
+    # the first snapshot of every older hour survives
+    old = [t for t in times if t < now - hour]
+    expected = sorted({min(t for t in old if t // hour == bucket) for bucket in {t // hour for t in old}} | set(times) - set(old))
+    assert kept == expected
+    assert removed == len(times) + 1 - len(expected)
+    store.compact()
+    store.close()
+
+
+def test_price_store_starts_warm_from_the_snapshot_store():
+    snapshots = SnapshotStore(":memory:")
+    snapshots.save("latest", data(150), NOW, etag='"c"')
+    prices = PriceStore(snapshot_store=snapshots, refresh_interval=0)
+    asyncio.run(prices.load_persisted())
+    snapshot = prices.peek("latest")
+    assert snapshot.etag == '"c"'
+    assert snapshot.fetched_at == NOW
+    assert snapshot.stale_note()
+    assert prices.peek("1h") is None
+    snapshots.close()
@@ -1 +1,23 @@
-# TODO create some unit tests
+import math
+
+from bot.utils.helpers import generate_estimated_yield, skill_interp
+
+
+def test_skill_interp_interpolates_between_low_and_high():
+    assert skill_interp(25, 80, 1) == (25 + 1) / 256
+    assert skill_interp(25, 80, 99) == (80 + 1) / 256
+    assert skill_interp(25, 80, 50) == ((25 * 49 / 98) + (80 * 49 / 98) + 1) / 256
+
+
+def test_skill_interp_is_clamped():
+    assert skill_interp(500, 500, 99) == 1
+    assert skill_interp(-500, -500, 1) == 0
+
+
+def test_generate_estimated_yield():
+    # no bonuses: harvest lives / (1 - chance to save)
+    assert generate_estimated_yield(99, 25, 80, 3, 0, 0, 0) == 3 / (1 - skill_interp(25, 80, 99))
+    # secateurs + cape floor the boosted chances before the diary and Attas bonuses are applied
+    low = math.floor(math.floor(25 * 1.15) * 1.05)
+    high = math.floor(math.floor(80 * 1.15) * 1.05)
+    assert generate_estimated_yield(99, 25, 80, 6, 0.15, 0, 0.05) == 6 / (1 - skill_interp(low, high, 99))
@@ -0,0 +1,110 @@
+import asyncio
+import random
+
+from discord import app_commands
+
+from bot.commands import watch
+from bot.utils.price_table import PriceTable
+from bot.utils.watchlists import WATCHABLE_RECIPES, ThresholdIndex, Watchlists, WatchStore
+from data.items import fish, herbs
+
+
+def crossed(watches, previous, value):
+    if previous is None or value == previous:
+        return set()
+    if value > previous:
+        return {watch_id for watch_id, (direction, threshold) in watches.items() if direction == "above" and previous < threshold <= value}
+    return {watch_id for watch_id, (direction, threshold) in watches.items() if direction == "below" and value <= threshold < previous}
+
+
+def test_first_value_only_sets_the_baseline():
+    index = ThresholdIndex()
+    index.add(1, "above", 100)
+    assert index.update(150) == []
+    assert index.update(90) == []
+    assert index.update(100) == [1]
+
+
+def test_update_matches_brute_force_crossings():
+    rng = random.Random(3)
+    index = ThresholdIndex()
+    watches = {}
+    previous = None
+    for step in range(2000):
+        if rng.random() < 0.3:
+            watch_id = step
+            watches[watch_id] = (rng.choice(("above", "below")), rng.randint(0, 100))
+            index.add(watch_id, *watches[watch_id])
+        if watches and rng.random() < 0.1:
+            watch_id = rng.choice(sorted(watches))
+            index.remove(watch_id, *watches.pop(watch_id))
+        value = rng.randint(0, 100)
+        assert set(index.update(value)) == crossed(watches, previous, value)
+        previous = value
+    assert len(index) == len(watches)
+
+
+def test_herb_runs_are_not_watchable():
+    assert "Shark" in WATCHABLE_RECIPES
+    assert not any(name.endswith(" run") for name in WATCHABLE_RECIPES)
+    # a herb run watch stored before they were refused never gets a value
+    watchlists = Watchlists(WatchStore(":memory:"))
+    data = {str(item_id): {"high": 1000} for info in herbs.values() for item_id in (info["seed_id"], info["herb_id"])}
+    data.update({str(item_id): {"high": 500} for info in fish.values() for item_id in (info["raw_id"], info["cooked_id"])})
+    values = watchlists.values(PriceTable.from_payload(data), [("profit", "Ranarr run"), ("profit", "Shark")])
+    assert values == {("profit", "Shark"): 0.0}
+    watchlists.store.close()
+
+
+class Market:
+    def add_listener(self, callback):
+        pass
+
+    def remove_listener(self, callback):
+        pass
+
+    def peek(self, endpoint):
+        return None
+
+
+class Bot:
+    shard_ids = [1]
+    market = Market()
+
+
+class Response:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, content, ephemeral=False):
+        self.sent.append((content, ephemeral))
+
+
+class User:
+    id = 42
+
+
+class Interaction:
+    def __init__(self):
+        self.response = Response()
+        self.user = User()
+
+
+def test_watch_opens_its_store_on_load_and_refuses_herb_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(watch, "WatchStore", lambda: WatchStore(str(tmp_path / "watchlists.sqlite3")))
+
+    async def run():
+        cog = watch.Watch(Bot())
+        assert cog.watchlists is None
+        await cog.cog_load()
+        profit = app_commands.Choice(name="Recipe profit per action/run", value="profit")
+        above = app_commands.Choice(name="above", value="above")
+        refused = Interaction()
+        await cog.add.callback(cog, refused, profit, "Ranarr run", above, 1000)
+        assert "/herb_profit" in refused.response.sent[0][0] and refused.response.sent[0][1]
+        added = Interaction()
+        await cog.add.callback(cog, added, profit, "Shark", above, 1000)
+        assert added.response.sent[0][0].startswith("Watch #1:")
+        assert [watch["target"] for watch in cog.watchlists.watches.values()] == ["Shark"]
+        await cog.cog_unload()
+    asyncio.run(run())